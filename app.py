@@ -3,17 +3,30 @@ import sys
 # Linha específica do ambiente Render/Manus, pode manter se necessário
 # sys.path.append("/opt/.manus/.sandbox-runtime") 
 
-from flask import Flask, render_template, request, send_from_directory, url_for, abort
+from flask import Flask, render_template, request, send_file, url_for, abort, jsonify, Response, make_response
 import os
 import uuid
+import time
+import math
+import hashlib
+import functools
 import logging # Adicionado para logs mais detalhados
 import traceback # Para log de erros detalhado
 
 # Importar as funções dos scripts criados (Garante que os .py estejam no mesmo nível)
 try:
-    from calculo_precos import calcular_precos_planos
-    from preenche_cotacao import preencher_cotacao_pptx
-    from converte_pdf import converter_pptx_para_pdf
+    from gera_pdf import salvar_pdf_cotacao
+    from inicializacao import preaquecer_dados, preaquecer_worker, estado_prontidao
+    from metricas import medir, contar, observar, exportar, iniciar_instancia
+    from perfil import PERFIL_ATIVO, PerfilRequisicao, pedido_autorizado
+    from cache_pdf import obter_cache
+    from armazem_saida import obter_armazem, nome_pdf_cotacao, SAIDA_TTL_HORAS
+    from converte_pdf import ConversaoSaturada, estatisticas_conversao
+    from registro_tabelas import obter_registro
+    from calculo_precos import parse_valor_brasileiro
+    from jobs_cotacao import obter_fila
+    from lote_cotacao import ErroLote, ler_planilha, precificar_lote, gerar_zip_lote
+    from fipe import obter_fipe, parametros_busca
 except ImportError as import_err:
      # Logar erro crítico se módulos essenciais não forem encontrados
      logging.exception(f"ERRO CRÍTICO: Falha ao importar módulos locais necessários: {import_err}")
@@ -33,9 +46,13 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # Caminhos relativos ao diretório onde app.py está (/app no container Docker)
 INPUT_DIR = "input_files" 
 OUTPUT_DIR = "output" # Diretório relativo para salvar os arquivos gerados
-DATABASE_FILE = os.path.join(INPUT_DIR, "Tabela 2023.xlsx")
+# Tabelas de preços: "Tabela <AAAA[-MM-DD]>.xlsx" em INPUT_DIR, escolhidas pela data de vigência
+# (ver registro_tabelas.py). Novas tabelas entram no ar sem reiniciar a aplicação.
 # Usar o nome de arquivo padronizado (sem acentos, definido anteriormente)
 TEMPLATE_PPTX = os.path.join(INPUT_DIR, "cotacao_auto.pptx") 
+# Por quanto tempo clientes/proxies podem reusar uma resposta de /api/precos sem revalidar (segundos).
+# Depois disso revalidam com If-None-Match: enquanto a tabela não mudar, a resposta é um 304 vazio.
+PRECOS_MAX_AGE = int(os.environ.get("PRECOS_MAX_AGE", "300"))
 
 # Guarda o diretório de saída na configuração do Flask para fácil acesso
 app.config["OUTPUT_DIR"] = OUTPUT_DIR
@@ -54,105 +71,164 @@ if not os.path.exists(OUTPUT_DIR):
         # Se não conseguir criar o diretório de saída, a aplicação não funcionará
         raise OSError(f"Não foi possível criar o diretório de saída necessário: {e}") from e
 
-# --- Rotas da Aplicação ---
 
-@app.route("/", methods=["GET", "POST"])
-def index():
-    """ Rota principal que exibe o formulário e processa a geração da cotação. """
-    error = None
-    success = None
-    pdf_filename = None # Apenas o NOME do arquivo PDF para gerar o link
-    warning = None 
+def create_app():
+    """Fábrica para o gunicorn com --preload (ver gunicorn.conf.py): gunicorn "app:create_app()".
 
-    if request.method == "POST":
-        logging.info("Recebida requisição POST para /")
+    Carrega tabela de preços e template uma vez no master; os workers herdam tudo pelo fork e
+    só sobem o que é por processo (LibreOffice, vigia das tabelas) no hook post_fork.
+    """
+    iniciar_instancia() # Métricas desta subida, em diretório próprio e vazio
+    preaquecer_dados(INPUT_DIR, TEMPLATE_PPTX)
+    return app
+
+
+class ErroCotacao(Exception):
+    """Dados da cotação inválidos (status 400) ou falha interna ao precificar (status 500)."""
+
+    def __init__(self, mensagem, status=400):
+        super().__init__(mensagem)
+        self.status = status
+
+
+def preparar_cotacao(form):
+    """Valida os campos do formulário (ou JSON) e precifica.
+
+    Retorna (dados_cotacao, aviso ou None, nome do PDF a gerar). Levanta ErroCotacao com a
+    mensagem para o usuário.
+    """
+    with medir("formulario"):
         # Capturar dados do formulário
-        nome_cliente = request.form.get("nome")
-        placa = request.form.get("placa")
-        marca = request.form.get("marca")
-        modelo = request.form.get("modelo")
-        ano = request.form.get("ano")
-        valor_fipe_str = request.form.get("valor_fipe")
-        categoria = request.form.get("categoria", "") 
+        nome_cliente = form.get("nome")
+        placa = form.get("placa")
+        marca = form.get("marca")
+        modelo = form.get("modelo")
+        ano = form.get("ano")
+        valor_fipe_str = form.get("valor_fipe")
+        categoria = form.get("categoria", "") 
 
         logging.info(f"Dados recebidos do formulário: Nome='{nome_cliente}', Placa='{placa}', FIPE_str='{valor_fipe_str}'")
 
         # Validar dados obrigatórios
         if not all([nome_cliente, placa, marca, modelo, ano, valor_fipe_str]):
-            error = "Por favor, preencha todos os campos obrigatórios."
-            logging.warning(f"Tentativa de submissão com campos obrigatórios faltando. Dados: {request.form}")
-            # Retorna imediatamente se faltar dados
-            return render_template("index.html", error=error, success=success, warning=warning, pdf_filename=pdf_filename)
+            logging.warning(f"Tentativa de submissão com campos obrigatórios faltando. Dados: {form}")
+            raise ErroCotacao("Por favor, preencha todos os campos obrigatórios.")
 
         # Converter valores numéricos
         try:
             ano_int = int(ano)
-            # Tratar formato brasileiro (remove '.' de milhar, troca ',' decimal por '.')
-            valor_fipe_str_limpo = valor_fipe_str.replace('.', '').replace(',', '.')
-            valor_fipe = float(valor_fipe_str_limpo) 
-        except ValueError:
-            error = "Ano e Valor FIPE devem ser valores numéricos válidos (ex: 2023, 75000.50 ou 75.000,50)."
+            valor_fipe = parse_valor_brasileiro(valor_fipe_str)
+        except (ValueError, TypeError, AttributeError):
             logging.warning(f"Erro ao converter Ano ('{ano}') ou Valor FIPE ('{valor_fipe_str}').")
-            return render_template("index.html", error=error, success=success, warning=warning, pdf_filename=pdf_filename)
+            raise ErroCotacao("Ano e Valor FIPE devem ser valores numéricos válidos (ex: 2023, 75000.50 ou 75.000,50).")
+        # Mesma checagem do /api/precos: 'inf', '1e400' e negativos não são valores FIPE
+        if not math.isfinite(valor_fipe) or valor_fipe < 0:
+            logging.warning(f"Valor FIPE fora do intervalo: '{valor_fipe_str}'.")
+            raise ErroCotacao("Valor FIPE deve ser um número maior ou igual a zero (ex: 75000 ou 75.000,50).")
+
+    # Calcular preços dos planos
+    try:
+        # Pega a tabela vigente UMA vez: se uma nova versão entrar no ar agora,
+        # esta cotação termina inteira na versão que começou
+        tabela = obter_registro(INPUT_DIR).tabela_ativa()
+        versao_tabela = tabela.versao
+        logging.info(f"Calculando preços para FIPE: {valor_fipe} usando tabela: {versao_tabela}")
+        with medir("precos"):
+            precos_info = tabela.calcular(valor_fipe)
+    except RuntimeError as e:
+        logging.error(f"Erro interno: {e}")
+        raise ErroCotacao(f"Erro interno: {e}", 500)
+    except Exception as e:
+        logging.exception(f"Exceção ao calcular preços:") # Loga o traceback completo
+        raise ErroCotacao(f"Erro inesperado ao calcular preços: {e}", 500)
+
+    if not precos_info:
+        # Se não houve exceção mas precos_info é None/vazio (lógica não achou faixa)
+        error = f"Não foi possível encontrar uma faixa de preço para o valor FIPE informado ({valor_fipe}). Verifique a tabela de preços."
+        logging.warning(error)
+        raise ErroCotacao(error)
+
+    # Se chegou aqui, precos_info contém os dados calculados
+    logging.info(f"Preços calculados com sucesso (tabela {versao_tabela}): {precos_info}")
+
+    # Preparar dados para preencher o PowerPoint
+    dados_cotacao = {
+        "nome_cliente": nome_cliente,
+        "placa": placa,
+        "marca": marca,
+        "modelo": modelo,
+        "ano": ano_int, 
+        "valor_fipe": valor_fipe,
+        "categoria": categoria,
+        "precos": precos_info,
+        "versao_tabela": versao_tabela # Registra qual versão da tabela precificou a cotação
+    }
+
+    # Verificar aviso de aprovação
+    warning = None
+    if precos_info.get("sujeito_aprovacao", False):
+        warning = "Atenção: Esta cotação está sujeita à aprovação da diretoria devido ao valor do veículo."
+        logging.info(f"Cotação para FIPE {valor_fipe} sujeita à aprovação.")
+
+    # Gerar nomes de arquivo únicos
+    unique_id = str(uuid.uuid4())[:8]
+    output_pdf_filename = nome_pdf_cotacao(placa, unique_id) # Nome do PDF final (só caracteres aceitos no download)
+    return dados_cotacao, warning, output_pdf_filename
+
+
+def _registrar_cotacao(resultado, inicio):
+    """Conta a cotação em cotacoes_total e mede o tempo total da requisição (etapa "total")."""
+    contar("cotacoes_total", resultado=resultado)
+    observar("cotacao_etapa_segundos", time.perf_counter() - inicio, etapa="total")
+
+
+def perfilavel(view):
+    """Perfila a requisição que pedir (cabeçalho X-Perfil ou ?perfil=1) quando PERFIL_REQUISICOES=1.
+
+    Desligado, devolve a própria view. O nome do perfil gravado volta no cabeçalho X-Perfil.
+    """
+    if not PERFIL_ATIVO:
+        return view
+
+    @functools.wraps(view)
+    def view_perfilada(*args, **kwargs):
+        if not pedido_autorizado(request.headers.get("X-Perfil") or request.args.get("perfil")):
+            return view(*args, **kwargs)
+        with PerfilRequisicao(f"{request.method} {request.path}") as perfil:
+            resposta = make_response(view(*args, **kwargs))
+        resposta.headers["X-Perfil"] = perfil.nome
+        return resposta
+    return view_perfilada
+
+
+# --- Rotas da Aplicação ---
+
+@app.route("/", methods=["GET", "POST"])
+@perfilavel
+def index():
+    """ Rota principal que exibe o formulário e processa a geração da cotação. """
+    error = None
+    success = None
+    pdf_filename = None # Apenas o NOME do arquivo PDF para gerar o link
+    warning = None 
 
-        # Calcular preços dos planos
-        logging.info(f"Chamando calcular_precos_planos para FIPE: {valor_fipe} usando DB: {DATABASE_FILE}")
-        precos_info = None # Inicializa como None
+    if request.method == "POST":
+        logging.info("Recebida requisição POST para /")
+        inicio = time.perf_counter()
         try:
-            # Verifica se o arquivo DB existe antes de chamar
-            if not os.path.exists(DATABASE_FILE):
-                 error = f"Erro interno: Arquivo da tabela de preços ({DATABASE_FILE}) não encontrado no servidor."
-                 logging.error(error)
-            else:
-                 precos_info = calcular_precos_planos(valor_fipe, DATABASE_FILE)
+            dados_cotacao, warning, output_pdf_filename = preparar_cotacao(request.form)
+        except ErroCotacao as e:
+            error = str(e)
+            _registrar_cotacao("invalida" if e.status == 400 else "falha", inicio)
+            return render_template("index.html", error=error, success=success, warning=warning, pdf_filename=pdf_filename)
+        nome_cliente = dados_cotacao["nome_cliente"]
+        placa = dados_cotacao["placa"]
+        versao_tabela = dados_cotacao["versao_tabela"]
 
-        except Exception as e:
-             error = f"Erro inesperado ao calcular preços: {e}"
-             logging.exception(f"Exceção em calcular_precos_planos:") # Loga o traceback completo
-             # Garante que precos_info é None se houve exceção
-             precos_info = None 
-
-        # Verifica se o cálculo retornou preços ou se houve erro antes
-        if error:
-             # Se já houve erro (ex: DB não encontrado, exceção no cálculo), retorna agora
-             return render_template("index.html", error=error, success=success, warning=warning, pdf_filename=pdf_filename)
-        elif not precos_info:
-             # Se não houve exceção mas precos_info é None/vazio (lógica não achou faixa)
-             error = f"Não foi possível encontrar uma faixa de preço para o valor FIPE informado ({valor_fipe}). Verifique a tabela de preços."
-             logging.warning(error)
-             return render_template("index.html", error=error, success=success, warning=warning, pdf_filename=pdf_filename)
-
-        # Se chegou aqui, precos_info contém os dados calculados
-        logging.info(f"Preços calculados com sucesso: {precos_info}")
-
-        # Preparar dados para preencher o PowerPoint
-        dados_cotacao = {
-            "nome_cliente": nome_cliente,
-            "placa": placa,
-            "marca": marca,
-            "modelo": modelo,
-            "ano": ano_int, 
-            "valor_fipe": valor_fipe,
-            "categoria": categoria,
-            "precos": precos_info 
-        }
-
-        # Verificar aviso de aprovação
-        if precos_info.get("sujeito_aprovacao", False):
-            warning = "Atenção: Esta cotação está sujeita à aprovação da diretoria devido ao valor do veículo."
-            logging.info(f"Cotação para FIPE {valor_fipe} sujeita à aprovação.")
-
-        # Gerar nomes de arquivo únicos
-        unique_id = str(uuid.uuid4())[:8]
-        safe_placa = placa.replace(' ', '_').replace('/', '_').replace('-', '') # Mais sanitização
-        output_pptx_filename = f"cotacao_{safe_placa}_{unique_id}.pptx"
-        output_pdf_filename = f"cotacao_{safe_placa}_{unique_id}.pdf" # Nome esperado do PDF
-
-        # Caminhos completos dentro do diretório de saída configurado
-        output_pptx_path = os.path.join(app.config["OUTPUT_DIR"], output_pptx_filename)
-        # O caminho completo do PDF será determinado pela função de conversão
-
-        # ---- Bloco Principal: Preencher, Converter, Limpar ----
+        # Só o PDF final vai para o diretório de saída (no subdiretório do armazém); o PPTX existe apenas em memória
+        output_pdf_path = obter_armazem(app.config["OUTPUT_DIR"]).caminho(output_pdf_filename)
+
+        # ---- Bloco Principal: Preencher e Converter (em memória) ----
         # Este bloco try...except engloba todo o processo de geração
         try: 
             # 1. Verificar Template PPTX (os.path.exists)
@@ -167,58 +243,38 @@ def index():
             if not os.path.exists(TEMPLATE_PPTX):
                 error = f"Erro interno: Arquivo modelo de cotação ({TEMPLATE_PPTX}) não encontrado."
                 logging.error(error)
+                _registrar_cotacao("falha", inicio)
                 # Retorna o template mostrando o erro (importante retornar DENTRO do try neste caso)
                 return render_template("index.html", error=error, success=success, warning=warning, pdf_filename=pdf_filename) 
 
-            # 2. Preencher o PowerPoint
-            logging.info(f"Chamando preencher_cotacao_pptx para salvar em: {output_pptx_path}")
-            sucesso_pptx = preencher_cotacao_pptx(TEMPLATE_PPTX, output_pptx_path, dados_cotacao)
-
-            if sucesso_pptx:
-                logging.info(f"PPTX preenchido com sucesso: {output_pptx_path}. Tentando converter para PDF...")
-
-                # 3. Converter para PDF
-                caminho_pdf_gerado = converter_pptx_para_pdf(output_pptx_path, app.config["OUTPUT_DIR"]) 
-
-                if caminho_pdf_gerado and os.path.exists(caminho_pdf_gerado): 
-                    output_pdf_filename = os.path.basename(caminho_pdf_gerado) 
-                    success = f"Cotação para {nome_cliente} (placa {placa}) gerada com sucesso!"
-                    pdf_filename = output_pdf_filename 
-                    logging.info(f"PDF gerado com sucesso: {caminho_pdf_gerado}. Nome relativo para link: {pdf_filename}")
-
-                    # 4. Limpar o arquivo pptx intermediário (opcional)
-                    try:
-                        os.remove(output_pptx_path)
-                        logging.info(f"Arquivo PPTX intermediário removido: {output_pptx_path}")
-                    except OSError as e:
-                        logging.warning(f"Não foi possível remover arquivo PPTX intermediário: {e}")
-                else:
-                    # Se caminho_pdf_gerado for None ou o arquivo não existir, a conversão falhou
-                    error = f"Erro ao converter a cotação para PDF. Verifique os logs do servidor."
-                    logging.error(f"Falha na conversão para PDF (função retornou '{caminho_pdf_gerado}' ou arquivo não existe) para {output_pptx_path}")
-                    # Tenta limpar PPTX mesmo se PDF falhou? É seguro pois ele foi gerado.
-                    if os.path.exists(output_pptx_path):
-                        try:
-                            os.remove(output_pptx_path)
-                            logging.info(f"Limpando PPTX intermediário após falha no PDF: {output_pptx_path}")
-                        except:
-                            pass 
-            else: 
-                # Se preencher_cotacao_pptx retornou False
-                error = f"Erro ao preencher o modelo de cotação. Verifique os logs do servidor."
-                logging.error(f"Falha reportada por preencher_cotacao_pptx para {output_pptx_path}")
-
-        # Este except corresponde ao 'try' que engloba Preencher/Converter/Limpar
+            # 2. Gerar o PDF (motor escolhido no formulário/query "motor", ou MOTOR_PDF)
+            motor = request.values.get("motor") or None
+            logging.info(f"Gerando PDF (motor: {motor or 'padrão'}) para: {output_pdf_filename}")
+            # Cotação repetida (mesmos textos, template e tabela) reaproveita o PDF do cache
+            if salvar_pdf_cotacao(TEMPLATE_PPTX, dados_cotacao, output_pdf_path, motor, app.config["OUTPUT_DIR"]): 
+                success = f"Cotação para {nome_cliente} (placa {placa}) gerada com sucesso!"
+                pdf_filename = output_pdf_filename 
+                logging.info(f"PDF gerado com sucesso: {output_pdf_path} (tabela {versao_tabela}). Nome relativo para link: {pdf_filename}")
+                _registrar_cotacao("sucesso", inicio)
+            else:
+                # Falha no preenchimento ou na conversão (detalhes no log de gera_pdf)
+                error = f"Erro ao gerar a cotação em PDF. Verifique os logs do servidor."
+                logging.error(f"Falha ao gerar o PDF para {output_pdf_filename}")
+                _registrar_cotacao("falha", inicio)
+
+        # Conversões saturadas (vagas ocupadas e fila cheia): responde na hora em vez de prender o worker
+        except ConversaoSaturada as e:
+            error = "Muitas cotações sendo geradas neste momento. Tente novamente em alguns segundos."
+            logging.warning(f"Conversão recusada para {output_pdf_filename}: {e}")
+            _registrar_cotacao("saturada", inicio)
+            return (render_template("index.html", error=error, success=success, warning=warning, pdf_filename=pdf_filename),
+                    503, {"Retry-After": str(e.retry_after)})
+
+        # Este except corresponde ao 'try' que engloba Preencher/Converter
         except Exception as e:
             error = f"Ocorreu um erro inesperado durante a geração da cotação."
             logging.exception(f"Exceção durante preenchimento/conversão:") 
-            # Tenta limpar arquivos intermediários se possível em caso de erro
-            if 'output_pptx_path' in locals() and os.path.exists(output_pptx_path):
-                 try:
-                      os.remove(output_pptx_path)
-                      logging.info(f"Limpando PPTX intermediário após erro: {output_pptx_path}")
-                 except:
-                      pass 
+            _registrar_cotacao("falha", inicio)
 
     # Fim do 'if request.method == "POST":'
     # O return abaixo será executado para GET ou após o POST (com ou sem erro/success)
@@ -231,34 +287,206 @@ def index():
                        pdf_filename=pdf_filename) # Passa o nome do arquivo PDF
 
 
-@app.route("/output/<path:filename>") 
-def download_file(filename):
-    """ Rota para servir os arquivos PDF gerados. """
-    directory = app.config["OUTPUT_DIR"]
-    logging.info(f"Requisição de download para: {filename} de {directory}")
+@app.route("/api/cotacoes", methods=["POST"])
+def criar_job_cotacao():
+    """Enfileira a geração da cotação e responde 202 na hora; o status fica em GET /api/cotacoes/<id>.
+
+    Aceita os mesmos campos do formulário, como form ou JSON.
+    """
+    dados_requisicao = request.get_json(silent=True)
+    if dados_requisicao is None:
+        dados_requisicao = request.form
+    elif not isinstance(dados_requisicao, dict):
+        return jsonify(erro="O corpo JSON deve ser um objeto com os campos da cotação."), 400
     try:
-        # Verifica se o arquivo existe antes de tentar servir
-        file_path = os.path.join(directory, filename)
-        if not os.path.isfile(file_path):
-             logging.error(f"Tentativa de download de arquivo inexistente: {file_path}")
-             abort(404, description="Arquivo não encontrado") # Retorna erro 404
+        dados_cotacao, warning, output_pdf_filename = preparar_cotacao(dados_requisicao)
+    except ErroCotacao as e:
+        return jsonify(erro=str(e)), e.status
+    if not os.path.exists(TEMPLATE_PPTX):
+        logging.error(f"Arquivo modelo de cotação não encontrado: {TEMPLATE_PPTX}")
+        return jsonify(erro="Erro interno: arquivo modelo de cotação não encontrado."), 500
+
+    motor = dados_requisicao.get("motor") or request.args.get("motor") or None
+    try:
+        job = obter_fila(app.config["OUTPUT_DIR"], TEMPLATE_PPTX).submeter(dados_cotacao, output_pdf_filename, motor, warning)
+    except ConversaoSaturada as e:
+        logging.warning(f"Job de cotação recusado (fila cheia): {e}")
+        return (jsonify(erro="Muitas cotações sendo geradas neste momento. Tente novamente em alguns segundos."),
+                503, {"Retry-After": str(e.retry_after)})
+    status_url = url_for("status_job_cotacao", job_id=job["id"])
+    return jsonify(id=job["id"], status=job["status"], aviso=warning, status_url=status_url), 202, {"Location": status_url}
+
+
+@app.route("/api/cotacoes/<job_id>")
+def status_job_cotacao(job_id):
+    """Status do job: pendente, processando, concluido (com pdf_url) ou erro."""
+    job = obter_fila(app.config["OUTPUT_DIR"], TEMPLATE_PPTX).consultar(job_id)
+    if job is None:
+        return jsonify(erro="Job não encontrado."), 404
+    if job["status"] == "concluido":
+        job["pdf_url"] = url_for("download_file", filename=job["pdf"])
+    return jsonify(job)
+
+
+@app.route("/api/lote", methods=["POST"])
+def cotacao_lote():
+    """Cotação de frota: recebe uma planilha (campo 'arquivo', CSV ou XLSX) e devolve um ZIP com um
+    PDF por veículo + manifesto.csv, enviado aos pedaços conforme os PDFs ficam prontos."""
+    arquivo = request.files.get("arquivo")
+    if arquivo is None or not arquivo.filename:
+        return jsonify(erro="Envie a planilha da frota no campo 'arquivo' (.csv ou .xlsx)."), 400
+    try:
+        linhas = ler_planilha(arquivo.stream, arquivo.filename)
+        tabela = obter_registro(INPUT_DIR).tabela_ativa()
+    except ErroLote as e:
+        return jsonify(erro=str(e)), 400
+    except RuntimeError as e:
+        logging.error(f"Erro interno: {e}")
+        return jsonify(erro=f"Erro interno: {e}"), 500
+    if not os.path.exists(TEMPLATE_PPTX):
+        logging.error(f"Arquivo modelo de cotação não encontrado: {TEMPLATE_PPTX}")
+        return jsonify(erro="Erro interno: arquivo modelo de cotação não encontrado."), 500
+
+    # Precifica tudo antes de começar a resposta: o ZIP só leva tempo de preenchimento/conversão
+    cotacoes, erros = precificar_lote(tabela, linhas)
+    logging.info(f"Lote '{arquivo.filename}': {len(linhas)} linha(s), {len(cotacoes)} a gerar, {len(erros)} recusada(s) (tabela {tabela.versao}).")
+    motor = request.values.get("motor") or None
+    nome_zip = f"cotacoes_{time.strftime('%Y%m%d_%H%M%S')}.zip"
+    return Response(gerar_zip_lote(TEMPLATE_PPTX, cotacoes, erros, motor), mimetype="application/zip",
+                    headers={"Content-Disposition": f"attachment; filename={nome_zip}",
+                             "X-Accel-Buffering": "no"}) # Proxies não devem segurar o stream
+
+
+@app.route("/api/precos")
+def api_precos():
+    """Preços dos planos para ?valor_fipe=... (mesmo formato do formulário), sem gerar PDF.
+
+    A ETag depende da versão da tabela e do valor: quando uma nova tabela entra no ar, as
+    respostas em cache deixam de valer sozinhas. Sem log por requisição: é a rota de alto volume.
+    """
+    valor_fipe_str = request.args.get("valor_fipe", "")
+    try:
+        valor_fipe = parse_valor_brasileiro(valor_fipe_str)
+    except ValueError:
+        valor_fipe = None
+    if valor_fipe is None or not math.isfinite(valor_fipe) or valor_fipe < 0:
+        return jsonify(erro="Informe valor_fipe numérico (ex: 75000 ou 75.000,50)."), 400
+
+    try:
+        tabela = obter_registro(INPUT_DIR).tabela_ativa()
+    except RuntimeError as e:
+        logging.error(f"Erro interno: {e}")
+        return jsonify(erro="Tabela de preços indisponível."), 503
+
+    etag = hashlib.sha1(f"{tabela.versao}|{valor_fipe!r}".encode("utf-8")).hexdigest()[:20]
+    cabecalhos = {"ETag": f'"{etag}"', "Cache-Control": f"public, max-age={PRECOS_MAX_AGE}"}
+    if request.if_none_match.contains(etag):
+        return "", 304, cabecalhos
+
+    precos_info = tabela.calcular(valor_fipe)
+    if not precos_info:
+        return jsonify(erro=f"Não foi possível encontrar uma faixa de preço para o valor FIPE informado ({valor_fipe}).",
+                       versao_tabela=tabela.versao), 404, cabecalhos
+    return jsonify(valor_fipe=valor_fipe, versao_tabela=tabela.versao, precos=precos_info), 200, cabecalhos
+
+
+@app.route("/api/fipe/busca")
+def api_fipe_busca():
+    """Veículos da tabela FIPE local que casam com ?q= (marca, modelo e/ou ano), do mais parecido para o menos.
+
+    Opcionais: ano= (ano modelo; 32000 = 0 km) e limite= (padrão 10). Usada pelo formulário para
+    preencher marca, modelo, ano e valor FIPE. Sem log por requisição: roda a cada tecla digitada.
+    """
+    try:
+        consulta, ano, limite = parametros_busca(request.args)
+    except ValueError as e:
+        return jsonify(erro=str(e)), 400
+    indice = obter_fipe().indice()
+    if indice is None:
+        return jsonify(erro="Tabela FIPE de referência indisponível."), 503
+
+    # Mesmo esquema do /api/precos: a ETag muda sozinha quando o arquivo FIPE muda
+    etag = hashlib.sha1(f"{indice.versao}|{consulta}|{ano}|{limite}".encode("utf-8")).hexdigest()[:20]
+    cabecalhos = {"ETag": f'"{etag}"', "Cache-Control": f"public, max-age={PRECOS_MAX_AGE}"}
+    if request.if_none_match.contains(etag):
+        return "", 304, cabecalhos
+    with medir("fipe_busca"):
+        resultados = indice.buscar(consulta, ano, limite)
+    return jsonify(q=consulta, versao_fipe=indice.versao, resultados=resultados), 200, cabecalhos
+
 
-        logging.info(f"Servindo arquivo: {file_path}")
-        return send_from_directory(directory, filename, as_attachment=True)
+@app.route("/healthz")
+def healthz():
+    """Liveness: o processo está respondendo (não olha tabela, template nem LibreOffice)."""
+    return jsonify(status="ok", pid=os.getpid())
 
+
+@app.route("/readyz")
+def readyz():
+    """Readiness: 200 só depois do pré-aquecimento deste worker (tabela, template, LibreOffice).
+
+    Sem o hook post_fork do gunicorn.conf.py, a primeira chamada dispara o aquecimento e responde 503.
+    """
+    preaquecer_worker(INPUT_DIR, TEMPLATE_PPTX)
+    pronto, detalhes = estado_prontidao(INPUT_DIR, TEMPLATE_PPTX)
+    return jsonify(pronto=pronto, **detalhes), 200 if pronto else 503
+
+
+@app.route("/metrics")
+def metrics():
+    """Histogramas por etapa, contadores e medidores de processo no formato texto do Prometheus (todos os workers)."""
+    return Response(exportar(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.route("/status/conversao")
+def status_conversao():
+    """Fila e tempos das conversões PDF deste worker (para ajustar LIBREOFFICE_VAGAS / LIBREOFFICE_FILA_MAX)."""
+    return jsonify(pid=os.getpid(), **estatisticas_conversao())
+
+
+@app.route("/status/cache-pdf")
+def status_cache_pdf():
+    """Acertos/falhas do cache de PDFs deste worker."""
+    cache = obter_cache(app.config["OUTPUT_DIR"])
+    return jsonify(pid=os.getpid(), ativo=cache is not None, **(cache.estatisticas() if cache else {}))
+
+
+@app.route("/status/saida")
+def status_saida():
+    """Última limpeza do diretório de saída (arquivos, tamanho, removidos)."""
+    return jsonify(pid=os.getpid(), **obter_armazem(app.config["OUTPUT_DIR"]).estatisticas())
+
+
+@app.route("/output/<path:filename>") 
+def download_file(filename):
+    """ Rota para servir os arquivos PDF gerados.
+
+    send_file entrega o arquivo pelo wsgi.file_wrapper (sendfile no gunicorn) e responde
+    Range e GET condicional (ETag/Last-Modified -> 206/304). O nome do PDF é único e o
+    conteúdo nunca muda, então o navegador pode guardá-lo até o armazém apagá-lo.
+    """
+    file_path = obter_armazem(app.config["OUTPUT_DIR"]).localizar(filename)
+    if file_path is None:
+        logging.error(f"Tentativa de download de arquivo inexistente: {filename}")
+        abort(404, description="Arquivo não encontrado") # Retorna erro 404
+    try:
+        resposta = send_file(file_path, mimetype="application/pdf", as_attachment=True,
+                             conditional=True, max_age=int(SAIDA_TTL_HORAS * 3600))
     except FileNotFoundError:
-        # Segurança extra, embora o check acima deva pegar
-        logging.error(f"Exceção FileNotFoundError ao servir: {filename} de {directory}")
+        # Apagado pela limpeza entre o localizar e o envio
         abort(404, description="Recurso não encontrado")
-    except Exception as e:
-        logging.exception(f"Erro inesperado ao servir arquivo '{filename}':")
-        abort(500, description="Erro interno ao servir arquivo")
+    # Cotação tem dados pessoais: só o navegador do cliente guarda, nunca caches compartilhados
+    resposta.cache_control.public = False
+    resposta.cache_control.private = True
+    resposta.cache_control.immutable = True
+    return resposta
 
 
 if __name__ == "__main__":
     # Define a porta baseado na variável de ambiente ou usa 8080 como padrão
     port = int(os.environ.get("PORT", 8080))
     logging.info(f"Iniciando servidor de desenvolvimento Flask em host 0.0.0.0 na porta {port}")
+    iniciar_instancia()
     # Executa o servidor de desenvolvimento do Flask
     # debug=True é útil para desenvolvimento local, mas NUNCA em produção
     # host='0.0.0.0' permite acesso na rede local
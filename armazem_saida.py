@@ -0,0 +1,182 @@
+# ----- INÍCIO DO CÓDIGO PARA armazem_saida.py -----
+# Armazém dos PDFs entregues aos clientes (diretório de saída).
+#
+# Os arquivos ficam espalhados em 256 subdiretórios, <saída>/<xx>/<nome>, onde xx vem do hash
+# do nome: nenhum diretório acumula dezenas de milhares de entradas, e o link de download
+# continua sendo só o nome (/output/<nome>). Uma thread de limpeza apaga os PDFs mais velhos
+# que SAIDA_TTL_HORAS e, se o total passar de SAIDA_MAX_MB, os mais antigos primeiro.
+# Os diretórios ocultos (.cache_pdf, .jobs) têm limpeza própria e não são tocados aqui.
+#
+# Com vários workers, cada um tem a sua thread, mas um lock de arquivo (flock) garante que só
+# um varre o diretório por vez.
+import os
+import re
+import time
+import fcntl
+import hashlib
+import logging
+import threading
+
+log_prefix = "[armazem_saida]"
+
+SAIDA_TTL_HORAS = float(os.environ.get("SAIDA_TTL_HORAS", "24"))
+SAIDA_MAX_MB = float(os.environ.get("SAIDA_MAX_MB", "2000"))
+INTERVALO_LIMPEZA = float(os.environ.get("SAIDA_INTERVALO_LIMPEZA", "300")) # segundos
+ARQUIVO_LOCK = ".limpeza.lock"
+_NOME_VALIDO = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")
+_CARACTERE_INVALIDO = re.compile(r"[^A-Za-z0-9._-]")
+
+
+def nome_pdf_cotacao(*partes):
+    """Nome do PDF no armazém: "cotacao_<parte>_<parte>.pdf", com cada parte reduzida aos caracteres
+    que o localizar aceita (placa "ABC-1234" vira "ABC1234"; acentos, '#', ':', '/' etc. viram '_').
+    Assim todo PDF gerado tem link de download válido."""
+    nome = "_".join(["cotacao"] + [_CARACTERE_INVALIDO.sub("_", str(parte).replace("-", "")) for parte in partes]) + ".pdf"
+    if not _NOME_VALIDO.fullmatch(nome): # Não acontece: o prefixo e a lista acima garantem o formato
+        raise ValueError(f"Nome de PDF inválido gerado: {nome!r}")
+    return nome
+
+
+def _subdiretorio(nome):
+    return hashlib.sha1(nome.encode("utf-8")).hexdigest()[:2]
+
+
+class ArmazemSaida:
+    """Caminhos (com shard) dos PDFs gerados + limpeza por idade e por tamanho total."""
+
+    def __init__(self, diretorio, ttl_horas=SAIDA_TTL_HORAS, tamanho_max_mb=SAIDA_MAX_MB, intervalo=INTERVALO_LIMPEZA):
+        self.diretorio = diretorio
+        self.ttl = ttl_horas * 3600
+        self.tamanho_max = int(tamanho_max_mb * 1024 * 1024)
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._thread = None
+        self.removidos = 0
+        self.ultima_limpeza = None # {"arquivos", "bytes", "removidos", "duracao_s"}
+
+    def caminho(self, nome):
+        """Caminho onde gravar o PDF 'nome' (cria o subdiretório)."""
+        subdiretorio = os.path.join(self.diretorio, _subdiretorio(nome))
+        os.makedirs(subdiretorio, exist_ok=True)
+        return os.path.join(subdiretorio, nome)
+
+    def localizar(self, nome):
+        """Caminho do PDF 'nome' já gravado, ou None. Nomes com '/' ou começando com '.' são recusados."""
+        if not _NOME_VALIDO.fullmatch(nome):
+            return None
+        for caminho in (os.path.join(self.diretorio, _subdiretorio(nome), nome),
+                        os.path.join(self.diretorio, nome)): # Arquivos de antes do shard
+            if os.path.isfile(caminho):
+                return caminho
+        return None
+
+    def limpar(self):
+        """Remove os expirados e, acima do limite de tamanho, os mais antigos. Retorna quantos removeu."""
+        os.makedirs(self.diretorio, exist_ok=True)
+        with open(os.path.join(self.diretorio, ARQUIVO_LOCK), "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return 0 # Outro worker já está limpando
+            try:
+                return self._limpar()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _limpar(self):
+        inicio = time.monotonic()
+        agora = time.time()
+        arquivos = {} # (st_dev, st_ino) -> [mtime, tamanho, caminhos]
+        for entrada in os.scandir(self.diretorio):
+            if entrada.name.startswith("."):
+                continue
+            if entrada.is_dir(follow_symlinks=False):
+                try:
+                    entradas = list(os.scandir(entrada.path))
+                except OSError:
+                    continue
+            else:
+                entradas = [entrada]
+            for arquivo in entradas:
+                try:
+                    if not arquivo.is_file(follow_symlinks=False):
+                        continue
+                    st = arquivo.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                # Hard links (acertos do cache de PDFs) são o mesmo inode: contam e saem juntos
+                grupo = arquivos.setdefault((st.st_dev, st.st_ino), [st.st_mtime, st.st_size, []])
+                grupo[2].append(arquivo.path)
+
+        removidos = 0
+        total = 0
+        restantes = []
+        for mtime, tamanho, caminhos in arquivos.values():
+            if agora - mtime > self.ttl:
+                removidos += sum(self._remover(caminho) for caminho in caminhos)
+            else:
+                restantes.append((mtime, tamanho, caminhos))
+                total += tamanho
+        if total > self.tamanho_max:
+            for mtime, tamanho, caminhos in sorted(restantes):
+                if total <= self.tamanho_max:
+                    break
+                removidos += sum(self._remover(caminho) for caminho in caminhos)
+                total -= tamanho
+        quantidade = sum(len(caminhos) for _, _, caminhos in arquivos.values())
+
+        self.removidos += removidos
+        self.ultima_limpeza = {"arquivos": quantidade - removidos, "bytes": total, "removidos": removidos,
+                               "duracao_s": round(time.monotonic() - inicio, 3), "em": agora}
+        if removidos:
+            logging.info(f"{log_prefix} Limpeza: {removidos} arquivo(s) removidos; "
+                         f"{quantidade - removidos} restantes ({total / (1024 * 1024):.1f} MB).")
+        return removidos
+
+    @staticmethod
+    def _remover(caminho):
+        try:
+            os.remove(caminho)
+            return 1
+        except OSError:
+            return 0
+
+    def iniciar(self):
+        """Passa a limpar o diretório em uma thread de fundo."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="armazem-saida", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.limpar()
+            except Exception:
+                logging.exception(f"{log_prefix} Erro ao limpar '{self.diretorio}':")
+
+    def parar(self):
+        self._parar.set()
+
+    def estatisticas(self):
+        return {"ttl_horas": self.ttl / 3600, "tamanho_max_mb": self.tamanho_max / (1024 * 1024),
+                "removidos": self.removidos, "ultima_limpeza": self.ultima_limpeza}
+
+
+_armazens = {}
+_armazens_lock = threading.Lock()
+
+
+def obter_armazem(diretorio):
+    """ArmazemSaida do processo atual para 'diretorio' (threads não sobrevivem ao fork do gunicorn)."""
+    chave = (os.getpid(), os.path.abspath(diretorio))
+    armazem = _armazens.get(chave)
+    if armazem is None:
+        with _armazens_lock:
+            armazem = _armazens.get(chave)
+            if armazem is None:
+                armazem = ArmazemSaida(diretorio)
+                armazem.iniciar()
+                _armazens[chave] = armazem
+    return armazem
+
+# ----- FIM DO CÓDIGO -----
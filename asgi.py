@@ -0,0 +1,282 @@
+# ----- INÍCIO DO CÓDIGO PARA asgi.py -----
+# Variante ASGI do formulário de cotação e dos downloads, para rodar com um servidor assíncrono:
+#   uvicorn asgi:app --host 0.0.0.0 --port 8080
+#
+# Com gunicorn sync, cada cotação em conversão prende um worker inteiro (um processo Python com
+# tabela e template carregados) até o LibreOffice terminar. Aqui um único processo segura dezenas
+# de cotações ao mesmo tempo:
+#   - validação e preços rodam direto no event loop (microssegundos, tabela em memória);
+#   - preenchimento do PPTX, motores nativo/sobreposição e gravação vão para um pool de threads;
+#   - a conversão é um subprocesso assíncrono (conversao_async.py), com timeout e cancelamento:
+#     se o cliente desconectar, o LibreOffice daquela cotação é morto na hora.
+#
+# Páginas e regras são as mesmas do app.py (mesmo index.html, mesmo preparar_cotacao, mesmo
+# armazém e cache de PDFs), inclusive a busca na tabela FIPE (/api/fipe/busca) que preenche o
+# formulário. A API de jobs e a cotação de frota continuam só no app:app.
+import os
+import json
+import time
+import asyncio
+import logging
+import contextlib
+from urllib.parse import parse_qs, unquote
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import render_template
+
+import app as aplicacao_flask
+from app import preparar_cotacao, ErroCotacao
+from gera_pdf import motor_valido, consultar_cache, renderizar_sem_libreoffice, preencher_pptx_bytes, gravar_pdf
+from converte_pdf import ConversaoSaturada
+from conversao_async import ConversorAsync
+from armazem_saida import obter_armazem, SAIDA_TTL_HORAS
+from inicializacao import preaquecer_dados
+from registro_tabelas import obter_registro
+from metricas import medir, contar, observar, iniciar_instancia
+from fipe import obter_fipe, parametros_busca
+
+log_prefix = "[asgi]"
+
+# Threads para o trabalho de CPU/disco de cada cotação (o GIL é liberado em boa parte dele)
+ASGI_THREADS = int(os.environ.get("ASGI_THREADS") or os.cpu_count() or 4)
+CORPO_MAX = 64 * 1024 # O formulário tem poucos campos curtos
+TAMANHO_BLOCO = 256 * 1024 # Leitura/envio dos PDFs
+# Cabeçalho Allow do 405 por rota (as de /output/<nome> aceitam GET e HEAD)
+METODOS_PERMITIDOS = {"/": "GET, HEAD, POST", "/healthz": "GET", "/api/fipe/busca": "GET"}
+
+
+async def _responder(send, status, corpo=b"", tipo="text/html; charset=utf-8", cabecalhos=(), enviar_corpo=True):
+    cabecalhos = [(b"content-type", tipo.encode()), (b"content-length", str(len(corpo)).encode()),
+                  *((nome.encode(), valor.encode()) for nome, valor in cabecalhos)]
+    await send({"type": "http.response.start", "status": status, "headers": cabecalhos})
+    await send({"type": "http.response.body", "body": corpo if enviar_corpo else b""})
+
+
+async def _ler_corpo(receive):
+    """Corpo da requisição, ou None se passar de CORPO_MAX ou o cliente desconectar."""
+    partes = []
+    tamanho = 0
+    while True:
+        mensagem = await receive()
+        if mensagem["type"] == "http.disconnect":
+            return None
+        partes.append(mensagem.get("body", b""))
+        tamanho += len(partes[-1])
+        if tamanho > CORPO_MAX:
+            return None
+        if not mensagem.get("more_body"):
+            return b"".join(partes)
+
+
+async def _aguardar_desconexao(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def _renderizar(**contexto):
+    # Contexto de requisição só para o url_for do template montar os links
+    with aplicacao_flask.app.test_request_context("/"):
+        return render_template("index.html", sem_api=True, **contexto).encode("utf-8")
+
+
+def _registrar_cotacao(resultado, inicio):
+    contar("cotacoes_total", resultado=resultado)
+    observar("cotacao_etapa_segundos", time.perf_counter() - inicio, etapa="total")
+
+
+class AplicacaoASGI:
+    """Aplicação ASGI 3: GET/POST /, GET/HEAD /output/<nome>, GET /api/fipe/busca, /healthz."""
+
+    def __init__(self):
+        self._executor = None
+        self._conversor = None
+
+    def _iniciar(self):
+        # Criados dentro do event loop do servidor (a fila de vagas do conversor é do loop)
+        if self._conversor is None:
+            iniciar_instancia() # Retratos de métricas num diretório só deste processo
+            self._executor = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix="asgi-cotacao")
+            self._conversor = ConversorAsync()
+
+    async def _em_thread(self, funcao, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, funcao, *args)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        self._iniciar()
+        metodo, caminho = scope["method"], scope["path"]
+        if caminho == "/" and metodo in ("GET", "HEAD"):
+            await _responder(send, 200, _renderizar(), enviar_corpo=metodo == "GET")
+        elif caminho == "/" and metodo == "POST":
+            await self._cotar(scope, receive, send)
+        elif caminho.startswith("/output/") and metodo in ("GET", "HEAD"):
+            await self._download(scope, send, unquote(caminho[len("/output/"):]), metodo == "GET")
+        elif caminho == "/api/fipe/busca" and metodo == "GET":
+            await self._buscar_fipe(scope, send)
+        elif caminho == "/healthz" and metodo == "GET":
+            corpo = json.dumps({"status": "ok", "pid": os.getpid(), "conversao": self._conversor.estatisticas()})
+            await _responder(send, 200, corpo.encode(), "application/json")
+        elif caminho in METODOS_PERMITIDOS or caminho.startswith("/output/"):
+            permitidos = METODOS_PERMITIDOS.get(caminho, "GET, HEAD")
+            await _responder(send, 405, b"Metodo nao permitido", "text/plain", [("allow", permitidos)])
+        else:
+            await _responder(send, 404, b"Nao encontrado", "text/plain")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            mensagem = await receive()
+            if mensagem["type"] == "lifespan.startup":
+                self._iniciar()
+                try:
+                    # Tabela, template e renderizador rápido antes da primeira cotação; vigia das tabelas ligado
+                    await self._em_thread(preaquecer_dados, aplicacao_flask.INPUT_DIR, aplicacao_flask.TEMPLATE_PPTX)
+                    await self._em_thread(obter_registro, aplicacao_flask.INPUT_DIR)
+                except Exception as e:
+                    logging.error(f"{log_prefix} Pré-aquecimento falhou: {e}")
+                await send({"type": "lifespan.startup.complete"})
+            elif mensagem["type"] == "lifespan.shutdown":
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False, cancel_futures=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _cotar(self, scope, receive, send):
+        inicio = time.perf_counter()
+        corpo = await _ler_corpo(receive)
+        if corpo is None:
+            await _responder(send, 413, b"Requisicao invalida ou grande demais", "text/plain")
+            return
+        form = {nome: valores[0] for nome, valores in parse_qs(corpo.decode("utf-8", errors="replace"),
+                                                               keep_blank_values=True).items()}
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        motor = form.get("motor") or (query.get("motor") or [None])[0]
+
+        try:
+            dados_cotacao, aviso, nome_pdf = preparar_cotacao(form)
+        except ErroCotacao as e:
+            _registrar_cotacao("invalida" if e.status == 400 else "falha", inicio)
+            await _responder(send, 200, _renderizar(error=str(e)))
+            return
+        template_path = aplicacao_flask.TEMPLATE_PPTX
+        if not os.path.exists(template_path):
+            logging.error(f"{log_prefix} Arquivo modelo de cotação não encontrado: {template_path}")
+            _registrar_cotacao("falha", inicio)
+            await _responder(send, 200, _renderizar(error=f"Erro interno: Arquivo modelo de cotação ({template_path}) não encontrado."))
+            return
+
+        destino = obter_armazem(aplicacao_flask.app.config["OUTPUT_DIR"]).caminho(nome_pdf)
+        geracao = asyncio.ensure_future(self._gerar(template_path, dados_cotacao, destino, motor))
+        desconexao = asyncio.ensure_future(_aguardar_desconexao(receive))
+        try:
+            await asyncio.wait({geracao, desconexao}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            desconexao.cancel()
+            if not geracao.done(): # Cliente foi embora (ou o servidor está parando): ninguém vai ler o PDF
+                geracao.cancel()
+                logging.warning(f"{log_prefix} Cotação {nome_pdf} cancelada: cliente desconectou.")
+                _registrar_cotacao("cancelada", inicio)
+                with contextlib.suppress(asyncio.CancelledError):
+                    await geracao # Espera o LibreOffice daquela cotação ser morto
+        if geracao.cancelled():
+            return
+
+        try:
+            sucesso = geracao.result()
+        except ConversaoSaturada as e:
+            _registrar_cotacao("saturada", inicio)
+            await _responder(send, 503, _renderizar(error="Muitas cotações sendo geradas neste momento. "
+                                                          "Tente novamente em alguns segundos."),
+                             cabecalhos=[("retry-after", str(e.retry_after))])
+            return
+        except Exception:
+            logging.exception(f"{log_prefix} Exceção durante preenchimento/conversão:")
+            sucesso = False
+        if sucesso:
+            _registrar_cotacao("sucesso", inicio)
+            await _responder(send, 200, _renderizar(
+                success=f"Cotação para {dados_cotacao['nome_cliente']} (placa {dados_cotacao['placa']}) gerada com sucesso!",
+                warning=aviso, pdf_filename=nome_pdf))
+        else:
+            _registrar_cotacao("falha", inicio)
+            await _responder(send, 200, _renderizar(error="Erro ao gerar a cotação em PDF. Verifique os logs do servidor.",
+                                                    warning=aviso))
+
+    async def _gerar(self, template_path, dados_cotacao, destino, motor):
+        """Mesmo caminho do gera_pdf.salvar_pdf_cotacao, com a conversão assíncrona."""
+        motor = motor_valido(motor)
+        achou, cache, chave = await self._em_thread(consultar_cache, template_path, dados_cotacao, destino, motor,
+                                                    aplicacao_flask.app.config["OUTPUT_DIR"])
+        if achou:
+            return True
+        pdf_bytes = await self._em_thread(renderizar_sem_libreoffice, template_path, dados_cotacao, motor)
+        if pdf_bytes is None:
+            pptx_bytes = await self._em_thread(preencher_pptx_bytes, template_path, dados_cotacao)
+            if pptx_bytes is None:
+                return False
+            with medir("conversao"):
+                pdf_bytes = await self._conversor.converter_bytes(pptx_bytes)
+            if not pdf_bytes:
+                return False
+        await self._em_thread(gravar_pdf, pdf_bytes, destino, cache, chave)
+        return True
+
+    async def _buscar_fipe(self, scope, send):
+        """Mesma resposta do /api/fipe/busca do app.py."""
+        query = {nome: valores[0] for nome, valores in parse_qs(scope.get("query_string", b"").decode("latin-1")).items()}
+        try:
+            consulta, ano, limite = parametros_busca(query)
+        except ValueError as e:
+            await _responder(send, 400, json.dumps({"erro": str(e)}).encode(), "application/json")
+            return
+        # Em thread: a primeira chamada pode ter de ler o arquivo FIPE
+        indice = await self._em_thread(obter_fipe().indice)
+        if indice is None:
+            await _responder(send, 503, json.dumps({"erro": "Tabela FIPE de referência indisponível."}).encode(),
+                             "application/json")
+            return
+        with medir("fipe_busca"):
+            resultados = indice.buscar(consulta, ano, limite)
+        corpo = json.dumps({"q": consulta, "versao_fipe": indice.versao, "resultados": resultados}, ensure_ascii=False)
+        await _responder(send, 200, corpo.encode("utf-8"), "application/json")
+
+    async def _download(self, scope, send, nome, enviar_corpo):
+        caminho = obter_armazem(aplicacao_flask.app.config["OUTPUT_DIR"]).localizar(nome)
+        try:
+            if caminho is None:
+                raise FileNotFoundError(nome)
+            arquivo = await self._em_thread(open, caminho, "rb")
+        except FileNotFoundError:
+            await _responder(send, 404, b"Arquivo nao encontrado", "text/plain")
+            return
+        try:
+            st = os.fstat(arquivo.fileno())
+            etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+            # O nome do PDF é único e o conteúdo nunca muda (ver download_file no app.py)
+            cabecalhos = [("etag", etag), ("content-disposition", f'attachment; filename="{nome}"'),
+                          ("cache-control", f"private, max-age={int(SAIDA_TTL_HORAS * 3600)}, immutable")]
+            if_none_match = dict(scope["headers"]).get(b"if-none-match", b"").decode("latin-1")
+            if etag in [valor.strip() for valor in if_none_match.split(",")]:
+                await send({"type": "http.response.start", "status": 304,
+                            "headers": [(n.encode(), v.encode()) for n, v in cabecalhos]})
+                await send({"type": "http.response.body", "body": b""})
+                return
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", b"application/pdf"), (b"content-length", str(st.st_size).encode()),
+                *((n.encode(), v.encode()) for n, v in cabecalhos)]})
+            while enviar_corpo:
+                bloco = await self._em_thread(arquivo.read, TAMANHO_BLOCO)
+                if not bloco:
+                    break
+                await send({"type": "http.response.body", "body": bloco, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            arquivo.close()
+
+
+app = AplicacaoASGI()
+
+# ----- FIM DO CÓDIGO -----
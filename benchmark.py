@@ -0,0 +1,362 @@
+# ----- INÍCIO DO CÓDIGO PARA benchmark.py -----
+# Benchmarks reproduzíveis, sem depender dos arquivos reais de input_files/:
+#   python -m cotacao bench -o baseline.json          (roda e grava os resultados)
+#   python -m cotacao bench-compare baseline.json novo.json --limite 0.15
+#   python -m cotacao import-budget --max-ms 400 --max-rss-mb 64   (custo de subir um worker)
+#
+# Gera num diretório temporário uma tabela de preços sintética (mesmo layout da "Tabela 2023.xlsx":
+# título, cabeçalho "VALOR DO VEÍCULO / ADESAO / PLANO ...", faixas "R$a - R$b") e um template
+# sintético com as shapes de CAMPOS_COTACAO. Mede separadamente o cálculo de preços, o
+# preenchimento do PPTX e a conversão (se houver LibreOffice), e depois cotações completas pelo
+# test client do Flask com 1, 2, 4... requisições simultâneas. Valores FIPE vêm de um gerador com
+# semente fixa: duas execuções fazem exatamente o mesmo trabalho.
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import logging
+import platform
+import tempfile
+import threading
+import subprocess
+
+log_prefix = "[benchmark]"
+
+VERSAO_FORMATO = 1
+SEMENTE = 2023
+# Métricas comparadas pelo bench-compare: maior é pior
+METRICAS_LATENCIA = ("p50_ms", "p95_ms")
+# Carregados sob demanda (compilação de tabela, planilha de lote, preenchimento): não na subida do worker
+MODULOS_SOB_DEMANDA = ("pandas", "openpyxl", "pptx")
+
+# Roda num interpretador novo: mede o import como um worker do gunicorn recém-criado
+_SCRIPT_IMPORTACAO = """
+import os, sys, json, time
+inicio = time.perf_counter()
+import {modulo}
+duracao = time.perf_counter() - inicio
+try:
+    with open("/proc/self/statm") as f:
+        rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+except OSError:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+print(json.dumps({{"duracao_s": duracao, "rss_bytes": rss, "modulos": sorted(m for m in {sob_demanda!r} if m in sys.modules)}}))
+"""
+
+
+def gerar_tabela_sintetica(caminho, n_faixas=20, passo=5000.0):
+    """Planilha no layout da tabela real: n_faixas contíguas de 'passo' reais, até o limite de aprovação."""
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["AUTOMÓVEIS"])
+    ws.append(["LEVES / PASSEIO / APP / ALUGUEL / PESADOS"])
+    ws.append(["VALOR DO VEÍCULO ", None, "ADESAO", "PLANO OURO", "PLANO DIAMANTE", "PLANO PLATINUM", "PESADOS"])
+
+    def reais(valor):
+        return "R$" + f"{valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+    for i in range(n_faixas):
+        minimo = 0.0 if i == 0 else i * passo + 0.01
+        maximo = (i + 1) * passo
+        base = 80.0 + i * 10.0
+        ws.append([f"{reais(minimo)} - {reais(maximo)}", None, 150 + 50 * (i // 4),
+                   round(base, 1), round(base * 1.12, 1), round(base * 1.35, 1), round(base * 1.5, 1)])
+    ws.append(["PARTICIPAÇÃO MÍN. R$1.200,00 - 6% (Passeio)"])
+    wb.save(caminho)
+    return caminho
+
+
+def gerar_template_sintetico(caminho):
+    """Template .pptx com as shapes (slide, nome) que preencher_cotacao_pptx procura."""
+    from pptx import Presentation
+    from pptx.util import Inches
+    from preenche_cotacao import CAMPOS_COTACAO
+
+    prs = Presentation()
+    n_slides = max(slide for slide, _, _, _ in CAMPOS_COTACAO) + 1
+    slides = [prs.slides.add_slide(prs.slide_layouts[6]) for _ in range(n_slides)]
+    vistos = set()
+    for slide_index, nome_shape, _, _ in CAMPOS_COTACAO:
+        if (slide_index, nome_shape) in vistos:
+            continue
+        vistos.add((slide_index, nome_shape))
+        topo = Inches(0.5 + 0.8 * (len(vistos) % 7))
+        caixa = slides[slide_index].shapes.add_textbox(Inches(1), topo, Inches(6), Inches(0.7))
+        caixa.name = nome_shape
+        caixa.text_frame.text = "XXXX"
+    prs.save(caminho)
+    return caminho
+
+
+def _estatisticas(duracoes, total_s=None):
+    """Resumo (ms) de uma lista de durações em segundos."""
+    ordenadas = sorted(duracoes)
+    n = len(ordenadas)
+
+    def percentil(p):
+        return ordenadas[min(n - 1, int(round(p / 100.0 * (n - 1))))] * 1000
+
+    total = total_s if total_s is not None else sum(ordenadas)
+    return {"n": n, "media_ms": round(sum(ordenadas) / n * 1000, 4), "p50_ms": round(percentil(50), 4),
+            "p95_ms": round(percentil(95), 4), "p99_ms": round(percentil(99), 4),
+            "max_ms": round(ordenadas[-1] * 1000, 4), "ops_s": round(n / total, 1) if total else None}
+
+
+def _medir(funcao, argumentos, aquecimento=5):
+    for args in argumentos[:aquecimento]:
+        funcao(*args)
+    duracoes = []
+    for args in argumentos:
+        inicio = time.perf_counter()
+        funcao(*args)
+        duracoes.append(time.perf_counter() - inicio)
+    return _estatisticas(duracoes)
+
+
+def _dados_exemplo(rng, tabela, i):
+    valor_fipe = round(rng.uniform(1000, 130000), 2)
+    return {"nome_cliente": f"Cliente Benchmark {i}", "placa": f"BEN-{i:04d}", "marca": "VOLKSWAGEN",
+            "modelo": "Virtus Highline 1.0 TSI", "ano": 2022, "valor_fipe": valor_fipe, "categoria": "PASSEIO",
+            "precos": tabela.calcular(valor_fipe) or tabela.calcular(50000.0), "versao_tabela": tabela.versao}
+
+
+def bench_precos(arquivo_tabela, n):
+    from calculo_precos import calcular_precos_planos, obter_tabela, cache_precos
+
+    rng = random.Random(SEMENTE)
+    valores = [(round(rng.uniform(0, 130000), 2), arquivo_tabela) for _ in range(n)]
+    tabela = obter_tabela(arquivo_tabela)
+    resultados = {"precos.calcular": _medir(calcular_precos_planos, valores)}
+    cache_precos.limpar()
+    resultados["precos.calcular_sem_cache"] = _medir(
+        lambda v, _: (cache_precos.limpar(), tabela.calcular(v)), valores[:max(50, n // 10)])
+    lote = [v for v, _ in valores]
+    resultados["precos.calcular_lote"] = dict(_medir(tabela.calcular_lote, [(lote,)] * 20, aquecimento=2),
+                                              veiculos_por_lote=len(lote))
+    return resultados
+
+
+def bench_preenchimento(template_path, tabela, n):
+    from preenche_cotacao import preencher_cotacao_pptx
+
+    rng = random.Random(SEMENTE)
+    dados = [_dados_exemplo(rng, tabela, i) for i in range(n)]
+    resultados = {}
+    for nome, rapido in (("preenchimento.rapido", True), ("preenchimento.python_pptx", False)):
+        resultados[nome] = _medir(lambda d: preencher_cotacao_pptx(template_path, io.BytesIO(), d, rapido=rapido),
+                                  [(d,) for d in dados])
+    return resultados
+
+
+def _libreoffice_disponivel():
+    from converte_pdf import SOFFICE_BIN
+    return shutil.which(SOFFICE_BIN) is not None or shutil.which("libreoffice") is not None
+
+
+def bench_conversao(template_path, tabela, n):
+    from preenche_cotacao import preencher_cotacao_pptx
+    from converte_pdf import converter_pptx_bytes_para_pdf
+
+    if not _libreoffice_disponivel():
+        return {"conversao.libreoffice": {"pulado": "LibreOffice não encontrado"}}
+    rng = random.Random(SEMENTE)
+    entradas = []
+    for i in range(n):
+        buffer = io.BytesIO()
+        preencher_cotacao_pptx(template_path, buffer, _dados_exemplo(rng, tabela, i))
+        entradas.append((buffer.getvalue(),))
+    # A primeira conversão sobe a instância do pool: fica no aquecimento, fora da medida
+    return {"conversao.libreoffice": _medir(converter_pptx_bytes_para_pdf, entradas, aquecimento=1)}
+
+
+def bench_ponta_a_ponta(diretorio, template_path, concorrencias, requisicoes):
+    """POST / pelo test client do Flask, com N clientes simultâneos. Latências só das cotações geradas;
+    recusas por saturação (503) e falhas saem contadas à parte."""
+    import app as aplicacao
+    from converte_pdf import obter_agendador
+
+    if not _libreoffice_disponivel():
+        # Sem LibreOffice toda cotação falha: a "latência" seria a do erro
+        return {"ponta_a_ponta": {"pulado": "LibreOffice não encontrado"}}
+    originais = (aplicacao.INPUT_DIR, aplicacao.TEMPLATE_PPTX, aplicacao.app.config["OUTPUT_DIR"])
+    aplicacao.INPUT_DIR = diretorio
+    aplicacao.TEMPLATE_PPTX = template_path
+    aplicacao.app.config["OUTPUT_DIR"] = os.path.join(diretorio, "output")
+    os.makedirs(aplicacao.app.config["OUTPUT_DIR"], exist_ok=True)
+    agendador = obter_agendador()
+    fila_max_original = agendador.fila_max
+
+    resultados = {}
+    contador = iter(range(10 ** 9))
+    contador_lock = threading.Lock()
+    try:
+        for concorrencia in concorrencias:
+            # Fila do agendador do tamanho da concorrência: mede a espera por vaga, não recusas instantâneas
+            agendador.fila_max = max(fila_max_original, concorrencia)
+            rng = random.Random(SEMENTE + concorrencia)
+            duracoes = []
+            saturadas = 0
+            falhas = 0
+            por_thread = max(1, requisicoes // concorrencia)
+
+            def cliente():
+                nonlocal saturadas, falhas
+                client = aplicacao.app.test_client()
+                for _ in range(por_thread):
+                    with contador_lock:
+                        i = next(contador)
+                        valor = f"{rng.uniform(1000, 100000):.2f}".replace(".", ",")
+                    # Nome diferente a cada cotação: nenhuma vem do cache de PDFs
+                    formulario = {"nome": f"Cliente Benchmark {i}", "placa": f"BEN-{i:04d}", "marca": "VW",
+                                  "modelo": "Gol", "ano": "2020", "valor_fipe": valor, "categoria": "PASSEIO"}
+                    inicio = time.perf_counter()
+                    resposta = client.post("/", data=formulario)
+                    duracao = time.perf_counter() - inicio
+                    with contador_lock:
+                        if resposta.status_code == 503:
+                            saturadas += 1
+                        elif resposta.status_code != 200 or b"/output/" not in resposta.data:
+                            falhas += 1
+                        else:
+                            duracoes.append(duracao)
+
+            threads = [threading.Thread(target=cliente) for _ in range(concorrencia)]
+            inicio = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            total = time.perf_counter() - inicio
+            if duracoes:
+                resultado = _estatisticas(duracoes, total)
+            else:
+                resultado = {"n": 0, "p50_ms": None, "p95_ms": None, "p99_ms": None, "ops_s": 0.0}
+            enviadas = len(duracoes) + saturadas + falhas
+            resultado.update(concorrencia=concorrencia, saturadas=saturadas, falhas=falhas,
+                             taxa_sucesso=round(len(duracoes) / enviadas, 4))
+            resultados[f"ponta_a_ponta.c{concorrencia}"] = resultado
+    finally:
+        agendador.fila_max = fila_max_original
+        aplicacao.INPUT_DIR, aplicacao.TEMPLATE_PPTX, aplicacao.app.config["OUTPUT_DIR"] = originais
+    return resultados
+
+
+def _ambiente():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"python": platform.python_version(), "plataforma": platform.platform(), "cpus": os.cpu_count(),
+            "commit": commit, "libreoffice": _libreoffice_disponivel()}
+
+
+def executar_benchmarks(n_precos=20000, n_preenchimento=200, n_conversao=10, concorrencias=(1, 2, 4, 8),
+                        requisicoes=48, suites=("precos", "preenchimento", "conversao", "ponta_a_ponta")):
+    """Roda as suítes pedidas em um diretório temporário e retorna o dicionário de resultados."""
+    from calculo_precos import obter_tabela
+
+    diretorio = tempfile.mkdtemp(prefix="cotacao_bench_")
+    # Avisos por cotação (ex: "Valor Pesados NÃO INSERIDO") e o log por requisição do app.py
+    # mediriam o terminal, não o código
+    nivel_log = logging.getLogger().level
+    logging.getLogger().setLevel(logging.ERROR)
+    try:
+        arquivo_tabela = gerar_tabela_sintetica(os.path.join(diretorio, "Tabela 2023.xlsx"))
+        template_path = gerar_template_sintetico(os.path.join(diretorio, "cotacao_auto.pptx"))
+        tabela = obter_tabela(arquivo_tabela)
+        resultados = {}
+        inicio = time.perf_counter()
+        if "precos" in suites:
+            resultados.update(bench_precos(arquivo_tabela, n_precos))
+        if "preenchimento" in suites:
+            resultados.update(bench_preenchimento(template_path, tabela, n_preenchimento))
+        if "conversao" in suites:
+            resultados.update(bench_conversao(template_path, tabela, n_conversao))
+        if "ponta_a_ponta" in suites:
+            resultados.update(bench_ponta_a_ponta(diretorio, template_path, concorrencias, requisicoes))
+        return {"versao_formato": VERSAO_FORMATO, "criado_em": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "duracao_s": round(time.perf_counter() - inicio, 2), "ambiente": _ambiente(),
+                "parametros": {"n_precos": n_precos, "n_preenchimento": n_preenchimento, "n_conversao": n_conversao,
+                               "concorrencias": list(concorrencias), "requisicoes": requisicoes, "semente": SEMENTE},
+                "resultados": resultados}
+    finally:
+        logging.getLogger().setLevel(nivel_log)
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+def medir_importacao(modulo="app", n_maiores=10):
+    """Importa o módulo num processo novo com -X importtime.
+
+    Retorna {"duracao_ms", "rss_mb", "sob_demanda_carregados": [...], "maiores": [(nome, ms acumulado)]},
+    com "maiores" = imports diretos do módulo que mais custaram.
+    """
+    script = _SCRIPT_IMPORTACAO.format(modulo=modulo, sob_demanda=MODULOS_SOB_DEMANDA)
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    processo = subprocess.run([sys.executable, "-X", "importtime", "-c", script], capture_output=True,
+                              text=True, cwd=raiz, timeout=120)
+    if processo.returncode != 0:
+        raise RuntimeError(f"Falha ao importar '{modulo}': {processo.stderr.strip()[-2000:]}")
+    dados = json.loads(processo.stdout.strip().splitlines()[-1])
+    diretos = []
+    filhos = []
+    for linha in processo.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package", indentado 2 espaços por nível;
+        # os imports de um módulo aparecem antes da linha dele
+        partes = linha.split("|")
+        if not linha.startswith("import time:") or len(partes) != 3 or not partes[1].strip().isdigit():
+            continue
+        nome = partes[2].rstrip()
+        nivel = (len(nome) - len(nome.lstrip()) - 1) // 2
+        if nivel == 1:
+            filhos.append((nome.strip(), int(partes[1]) / 1000))
+        elif nivel == 0:
+            if nome.strip() == modulo:
+                diretos = filhos
+            filhos = []
+    diretos.sort(key=lambda item: item[1], reverse=True)
+    return {"duracao_ms": round(dados["duracao_s"] * 1000, 1), "rss_mb": round(dados["rss_bytes"] / 2**20, 1),
+            "sob_demanda_carregados": dados["modulos"], "maiores": diretos[:n_maiores]}
+
+
+def comparar(base, novo, limite=0.10):
+    """Compara dois resultados de executar_benchmarks. Retorna a lista de linhas
+    (benchmark, métrica, base, novo, variação, regrediu)."""
+    linhas = []
+    for nome, resultado_base in sorted(base["resultados"].items()):
+        resultado_novo = novo["resultados"].get(nome)
+        if resultado_novo is None or "pulado" in resultado_base or "pulado" in resultado_novo:
+            continue
+        for metrica in METRICAS_LATENCIA:
+            antes, depois = resultado_base.get(metrica), resultado_novo.get(metrica)
+            if not antes or depois is None:
+                continue
+            variacao = depois / antes - 1
+            linhas.append((nome, metrica, antes, depois, variacao, variacao > limite))
+        if "taxa_sucesso" in resultado_base:
+            antes, depois = resultado_base["taxa_sucesso"], resultado_novo.get("taxa_sucesso", 0)
+            linhas.append((nome, "taxa_sucesso", antes, depois, depois - antes, depois < antes))
+    return linhas
+
+
+def imprimir_resultados(dados, saida=sys.stdout):
+    for nome, resultado in dados["resultados"].items():
+        if "pulado" in resultado:
+            print(f"  {nome:32s} pulado: {resultado['pulado']}", file=saida)
+            continue
+        extra = f"  sucesso {resultado['taxa_sucesso']:.0%}" if "taxa_sucesso" in resultado else ""
+        if resultado.get("saturadas") or resultado.get("falhas"):
+            extra += f" ({resultado['saturadas']} saturada(s), {resultado['falhas']} falha(s))"
+        if resultado["p50_ms"] is None:
+            print(f"  {nome:32s} nenhuma cotação gerada{extra}", file=saida)
+            continue
+        print(f"  {nome:32s} p50 {resultado['p50_ms']:9.3f} ms  p95 {resultado['p95_ms']:9.3f} ms  "
+              f"p99 {resultado['p99_ms']:9.3f} ms  {resultado['ops_s'] or 0:10.1f} ops/s{extra}", file=saida)
+
+# ----- FIM DO CÓDIGO -----
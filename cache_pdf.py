@@ -0,0 +1,209 @@
+# ----- INÍCIO DO CÓDIGO PARA cache_pdf.py -----
+# Cache de PDFs gerados, endereçado pelo conteúdo.
+#
+# A chave é o hash de (versão do template, versão da tabela de preços, motor de PDF, textos que
+# vão para o PDF). Os textos são os de textos_cotacao(): duas cotações com os mesmos textos
+# finais geram exatamente o mesmo PDF, mesmo que os dados tenham vindo escritos de outro jeito.
+# Num acerto o PDF já existente é ligado (hard link) com o novo nome, sem preencher nem converter.
+#
+# Os arquivos ficam em <diretório de saída>/.cache_pdf/<2 primeiros hex>/<hash>.pdf, no mesmo
+# sistema de arquivos da saída (hard links não atravessam sistemas de arquivos). O diretório é
+# compartilhado entre os workers; as estatísticas são por processo.
+#
+# O PDF do cache e as cópias entregues em output/ são o mesmo inode: o cache nunca mexe no mtime
+# dele (a limpeza do armazém de saída expira as cópias por esse mtime). O último uso de cada
+# entrada fica num arquivo ao lado, <hash>.uso, e um acerto num PDF com mais de metade do TTL
+# entrega uma cópia nova, que passa a ser a entrada do cache: o link recém-entregue não expira logo.
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+import contextlib
+
+from metricas import registrar_fonte
+
+log_prefix = "[cache_pdf]"
+
+CACHE_PDF_ATIVO = os.environ.get("CACHE_PDF", "1") == "1"
+TAMANHO_MAX_MB = float(os.environ.get("CACHE_PDF_MAX_MB", "500"))
+TTL_HORAS = float(os.environ.get("CACHE_PDF_TTL_HORAS", "24"))
+INTERVALO_LIMPEZA = 60 # segundos entre varreduras de expiração/tamanho
+NOME_DIRETORIO = ".cache_pdf"
+SUFIXO_USO = ".uso"
+
+
+def chave_cotacao(versao_template, versao_tabela, motor, textos):
+    """Hash (hex) que identifica o PDF gerado a partir destes textos."""
+    conteudo = json.dumps([versao_template, versao_tabela, motor, textos], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+
+def _ligar_ou_copiar(origem, destino):
+    """Hard link de 'origem' em 'destino' (copia se o link não for possível). Substitui 'destino' atomicamente."""
+    temporario = f"{destino}.tmp.{os.getpid()}.{threading.get_ident()}"
+    try:
+        os.link(origem, temporario)
+    except OSError:
+        shutil.copyfile(origem, temporario)
+    os.replace(temporario, destino)
+
+
+def _marcar_uso(caminho):
+    """Atualiza o mtime de <hash>.uso (o último uso da entrada), criando-o se preciso."""
+    uso = caminho[:-len(".pdf")] + SUFIXO_USO
+    try:
+        os.utime(uso)
+    except FileNotFoundError:
+        with open(uso, "a"):
+            pass
+
+
+class CachePDF:
+    """PDFs gerados, por chave de conteúdo, com expiração (TTL) e limite de tamanho (descarta os mais antigos)."""
+
+    def __init__(self, diretorio, tamanho_max_mb=TAMANHO_MAX_MB, ttl_horas=TTL_HORAS):
+        self.diretorio = diretorio
+        self.tamanho_max = int(tamanho_max_mb * 1024 * 1024)
+        self.ttl = ttl_horas * 3600
+        self._lock = threading.Lock()
+        self._ultima_limpeza = 0.0
+        self.acertos = 0
+        self.falhas = 0
+        self.gravacoes = 0
+        self.descartes = 0
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, chave[:2], f"{chave}.pdf")
+
+    def obter(self, chave, destino):
+        """Se a chave estiver no cache, liga o PDF em 'destino' e retorna True."""
+        caminho = self._caminho(chave)
+        try:
+            idade = time.time() - os.stat(caminho).st_mtime
+            if idade > self.ttl:
+                raise FileNotFoundError(caminho) # Expirado: a limpeza remove depois
+            if idade > self.ttl / 2:
+                # Cópia nova (mtime de agora) para o cliente, e ela vira a entrada do cache
+                temporario = f"{destino}.tmp.{os.getpid()}.{threading.get_ident()}"
+                shutil.copyfile(caminho, temporario)
+                os.replace(temporario, destino)
+                _ligar_ou_copiar(destino, caminho)
+            else:
+                _ligar_ou_copiar(caminho, destino)
+            _marcar_uso(caminho)
+        except OSError:
+            with self._lock:
+                self.falhas += 1
+            return False
+        with self._lock:
+            self.acertos += 1
+        return True
+
+    def guardar(self, chave, origem):
+        """Guarda no cache o PDF já gravado em 'origem' (hard link, sem copiar os bytes)."""
+        caminho = self._caminho(chave)
+        try:
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            _ligar_ou_copiar(origem, caminho)
+            _marcar_uso(caminho)
+        except OSError as e:
+            logging.warning(f"{log_prefix} Não foi possível guardar {origem} no cache: {e}")
+            return
+        with self._lock:
+            self.gravacoes += 1
+        self.limpar_se_preciso()
+
+    def limpar_se_preciso(self):
+        agora = time.monotonic()
+        with self._lock:
+            if agora - self._ultima_limpeza < INTERVALO_LIMPEZA:
+                return
+            self._ultima_limpeza = agora
+        self.limpar()
+
+    def limpar(self):
+        """Remove os expirados e, se passar do limite de tamanho, os usados há mais tempo."""
+        agora = time.time()
+        arquivos = []
+        usos = {}
+        for raiz, _, nomes in os.walk(self.diretorio):
+            for nome in nomes:
+                caminho = os.path.join(raiz, nome)
+                try:
+                    st = os.stat(caminho)
+                except OSError:
+                    continue
+                if nome.endswith(".pdf"):
+                    arquivos.append((st.st_mtime, st.st_size, caminho))
+                elif nome.endswith(SUFIXO_USO):
+                    usos[caminho[:-len(SUFIXO_USO)] + ".pdf"] = st.st_mtime
+
+        removidos = 0
+        total = 0
+        restantes = []
+        for mtime, tamanho, caminho in arquivos:
+            if agora - mtime > self.ttl:
+                removidos += self._remover(caminho)
+            else:
+                restantes.append((max(mtime, usos.pop(caminho, 0.0)), tamanho, caminho))
+                total += tamanho
+        for _, tamanho, caminho in sorted(restantes):
+            if total <= self.tamanho_max:
+                break
+            removidos += self._remover(caminho)
+            total -= tamanho
+        for caminho in usos: # Marcas de uso de PDFs que já não estão no cache
+            with contextlib.suppress(OSError):
+                os.remove(caminho[:-len(".pdf")] + SUFIXO_USO)
+        if removidos:
+            with self._lock:
+                self.descartes += removidos
+            logging.info(f"{log_prefix} Limpeza: {removidos} PDF(s) descartados; {total / (1024 * 1024):.1f} MB em cache.")
+
+    @staticmethod
+    def _remover(caminho):
+        with contextlib.suppress(OSError):
+            os.remove(caminho[:-len(".pdf")] + SUFIXO_USO)
+        try:
+            os.remove(caminho) # Só remove o link do cache: a cópia entregue ao cliente continua
+            return 1
+        except OSError:
+            return 0
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "gravacoes": self.gravacoes,
+                "descartes": self.descartes,
+                "taxa_acerto": round(self.acertos / consultas, 4) if consultas else 0.0,
+                "tamanho_max_mb": self.tamanho_max / (1024 * 1024),
+                "ttl_horas": self.ttl / 3600,
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def obter_cache(diretorio_saida):
+    """CachePDF do diretório de saída (None se desativado com CACHE_PDF=0)."""
+    if not CACHE_PDF_ATIVO:
+        return None
+    diretorio = os.path.join(os.path.abspath(diretorio_saida), NOME_DIRETORIO)
+    cache = _caches.get(diretorio)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(diretorio)
+            if cache is None:
+                cache = _caches[diretorio] = CachePDF(diretorio)
+                registrar_fonte(lambda: [("cache_pdf_consultas_total", {"resultado": "acerto"}, cache.acertos),
+                                         ("cache_pdf_consultas_total", {"resultado": "falha"}, cache.falhas)])
+    return cache
+
+# ----- FIM DO CÓDIGO -----
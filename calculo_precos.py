@@ -1,280 +1,568 @@
 # ----- INÍCIO DO CÓDIGO PARA calculo_precos.py COM LOGS ADICIONAIS -----
-import pandas as pd
-import sys
-import numpy as np # numpy não parece ser usado, mas mantido por enquanto
+import math
+import numpy as np
 import traceback # Para log de erro
 import os # Importar OS para o bloco de teste funcionar
+import bisect
+import threading
+import hashlib
+import functools
+import collections
+import logging
+
+from metricas import registrar_fonte
+
+log_prefix = "[calculo_precos]"
 
 # sys.path.append("/opt/.manus/.sandbox-runtime") # Remover ou comentar se não for necessário
 
-def calcular_precos_planos(valor_fipe, arquivo_tabela):
-    """Calcula os preços dos planos com base no valor FIPE do veículo."""
-    print(f"\n[calculo_precos] Iniciando cálculo para FIPE: {valor_fipe} usando Tabela: {arquivo_tabela}")
-    
-    try:
-        # Ler a planilha de preços
-        print("[calculo_precos] Lendo arquivo Excel...")
-        if not os.path.exists(arquivo_tabela):
-             print(f"[calculo_precos] ERRO CRÍTICO IMEDIATO: Arquivo de tabela NÃO EXISTE em {arquivo_tabela}")
-             return None # Retorna None imediatamente se o arquivo não existe
-        df = pd.read_excel(arquivo_tabela)
-        print(f"[calculo_precos] Leitura concluída. DataFrame shape: {df.shape}")
-        
-        # --- Lógica para encontrar cabeçalho (mantida, mas pode ser frágil) ---
-        valor_veiculo_idx = None
-        # Procurar a linha que contém "VALOR DO VEÍCULO" ou similar
-        print("[calculo_precos] Procurando linha do cabeçalho por 'VALOR DO VEÍCULO'...")
+# --- Estrutura esperada da planilha ---
+COLUNAS_NECESSARIAS = ["faixa_valor", "adesao", "plano_ouro", "plano_diamante", "plano_platinum", "pesados"]
+KEYWORDS_MAP = {
+    "faixa_valor": ["VALOR", "VEÍCULO"],
+    "adesao": ["ADESAO", "ADESÃO"],
+    "plano_ouro": ["OURO"],
+    "plano_diamante": ["DIAMANTE"],
+    "plano_platinum": ["PLATINUM"],
+    "pesados": ["PESADOS"]
+}
+# (nome do plano no dict de saída, coluna mapeada) - a ordem define a ordem do dict retornado
+PLANOS_COLUNAS = [
+    ("Adesão", "adesao"),
+    ("Plano Ouro", "plano_ouro"),
+    ("Diamante", "plano_diamante"),
+    ("Platinum", "plano_platinum"),
+    ("Pesados", "pesados")
+]
+LIMITE_APROVACAO = 100000.0 # Acima disso: última faixa + 1% a cada R$ 1.000 excedentes
+TAMANHO_CACHE_PRECOS = int(os.environ.get("CACHE_PRECOS_TAMANHO", "1024")) # 0 desliga o cache
+EXTENSAO_ARTEFATO = ".npz"
+VERSAO_FORMATO_ARTEFATO = 1
+ARQUIVO_TABELA_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "input_files", "Tabela 2023.xlsx")
+
+
+def _ler_dados_tabela(arquivo_tabela):
+    """Lê o Excel, acha o cabeçalho e devolve o DataFrame de dados com as colunas mapeadas.
+
+    Levanta ValueError se a estrutura da tabela não for reconhecida.
+    """
+    import pandas as pd # Só aqui e no calcular_lote: o cálculo por cotação usa apenas NumPy
+
+    logging.info(f"{log_prefix} Lendo arquivo Excel: {arquivo_tabela}")
+    df = pd.read_excel(arquivo_tabela)
+    logging.info(f"{log_prefix} Leitura concluída. DataFrame shape: {df.shape}")
+
+    # --- Lógica para encontrar cabeçalho (mantida, mas pode ser frágil) ---
+    valor_veiculo_idx = None
+    # Procurar a linha que contém "VALOR DO VEÍCULO" ou similar
+    for idx, row in df.iterrows():
+        for col in row:
+            # Verifica se col é string antes de chamar 'in'
+            if isinstance(col, str) and "VALOR DO VEÍCULO" in col.upper(): # Comparar em maiúsculas
+                valor_veiculo_idx = idx
+                break
+        if valor_veiculo_idx is not None:
+            break
+
+    if valor_veiculo_idx is None:
+        logging.info(f"{log_prefix} Não encontrou por 'VALOR DO VEÍCULO'. Procurando por 'PLANO OURO'...")
+        # Tentar encontrar a linha com os nomes dos planos como fallback
         for idx, row in df.iterrows():
-            for col in row:
-                # Verifica se col é string antes de chamar 'in'
-                if isinstance(col, str) and "VALOR DO VEÍCULO" in col.upper(): # Comparar em maiúsculas
-                    valor_veiculo_idx = idx
-                    print(f"[calculo_precos] Encontrado 'VALOR DO VEÍCULO' na linha índice {idx}")
-                    break
-            if valor_veiculo_idx is not None:
+            # Verifica se é string antes de chamar upper()
+            if "PLANO OURO" in [str(x).upper() for x in row if isinstance(x, str)]:
+                valor_veiculo_idx = idx
                 break
-                
-        if valor_veiculo_idx is None:
-            print("[calculo_precos] Não encontrou por 'VALOR DO VEÍCULO'. Procurando por 'PLANO OURO'...")
-            # Tentar encontrar a linha com os nomes dos planos como fallback
-            for idx, row in df.iterrows():
-                # Verifica se é string antes de chamar upper()
-                if "PLANO OURO" in [str(x).upper() for x in row if isinstance(x, str)]:
-                    valor_veiculo_idx = idx
-                    print(f"[calculo_precos] Fallback: Usando linha {idx} como cabeçalho (contém PLANO OURO).")
-                    break
-                    
-        if valor_veiculo_idx is None:
-            print("[calculo_precos] ERRO CRÍTICO: Estrutura da tabela não identificada (cabeçalho não encontrado).")
-            return None # Retorna None se não achar o cabeçalho
-            
-        print(f"[calculo_precos] Linha de cabeçalho identificada (ou fallback): Índice {valor_veiculo_idx}")
-        colunas = df.iloc[valor_veiculo_idx].tolist()
-        print(f"[calculo_precos] Nomes das colunas brutos lidos da linha {valor_veiculo_idx}: {colunas}")
-
-        # --- Processamento do DataFrame ---
-        dados_df = df.iloc[valor_veiculo_idx+1:].reset_index(drop=True)
-        
-        # Mapear nomes das colunas
-        colunas_necessarias = ["faixa_valor", "adesao", "plano_ouro", "plano_diamante", "plano_platinum", "pesados"]
-        col_names = []
-        keywords_map = {
-            "faixa_valor": ["VALOR", "VEÍCULO"],
-            "adesao": ["ADESAO", "ADESÃO"],
-            "plano_ouro": ["OURO"],
-            "plano_diamante": ["DIAMANTE"],
-            "plano_platinum": ["PLATINUM"],
-            "pesados": ["PESADOS"]
-        }
-        mapped_cols = {name: None for name in colunas_necessarias}
-
-        print("[calculo_precos] Mapeando nomes das colunas por keywords...")
-        for i, col_header in enumerate(colunas):
-            header_str = str(col_header).upper()
-            found_map = False
-            for target_name, keywords in keywords_map.items():
-                 if mapped_cols[target_name] is None: # Mapeia apenas uma vez
-                     if any(keyword in header_str for keyword in keywords):
-                         col_names.append(target_name)
-                         mapped_cols[target_name] = i # Guarda o índice original
-                         print(f"  - Mapeado '{col_header}' (Índice {i}) para '{target_name}'")
-                         found_map = True
-                         break
-            if not found_map:
-                 col_names.append(f"desconhecida_{i}")
-                 print(f"  - Coluna '{col_header}' (Índice {i}) não mapeada.")
-        
-        # Aplicar nomes ao dataframe de dados
-        if len(col_names) >= dados_df.shape[1]:
-            dados_df.columns = col_names[:dados_df.shape[1]]
-            print(f"[calculo_precos] Nomes das colunas aplicados: {dados_df.columns.tolist()}")
-        else:
-             print(f"[calculo_precos] ERRO: Discrepância entre número de colunas lidas ({len(colunas)}) e colunas de dados ({dados_df.shape[1]})")
-             print(f"[calculo_precos] Colunas mapeadas: {col_names}")
-             return None
-
-        # Verificar se colunas essenciais foram mapeadas
-        colunas_faltantes = [name for name, index in mapped_cols.items() if index is None]
-        if colunas_faltantes:
-            print(f"[calculo_precos] AVISO: Colunas essenciais não encontradas pelo nome: {colunas_faltantes}. A aplicação pode falhar.")
-            # Poderia retornar None aqui se colunas como 'faixa_valor' faltarem
-
-        # Remover linhas com NaN em 'faixa_valor' (se a coluna existir)
-        if "faixa_valor" in dados_df.columns:
-            print(f"[calculo_precos] Shape antes de dropna('faixa_valor'): {dados_df.shape}")
-            dados_df = dados_df.dropna(subset=["faixa_valor"])
-            print(f"[calculo_precos] Shape depois de dropna('faixa_valor'): {dados_df.shape}")
-        else:
-             print("[calculo_precos] ERRO: Coluna 'faixa_valor' não encontrada após mapeamento.")
-             return None
 
-        if dados_df.empty:
-            print("[calculo_precos] ERRO: DataFrame vazio após limpar linhas sem faixa de valor.")
+    if valor_veiculo_idx is None:
+        raise ValueError("Estrutura da tabela não identificada (cabeçalho não encontrado).")
+
+    colunas = df.iloc[valor_veiculo_idx].tolist()
+    logging.info(f"{log_prefix} Cabeçalho na linha índice {valor_veiculo_idx}: {colunas}")
+
+    # --- Processamento do DataFrame ---
+    dados_df = df.iloc[valor_veiculo_idx+1:].reset_index(drop=True)
+
+    # Mapear nomes das colunas
+    col_names = []
+    mapped_cols = {name: None for name in COLUNAS_NECESSARIAS}
+    for i, col_header in enumerate(colunas):
+        header_str = str(col_header).upper()
+        found_map = False
+        for target_name, keywords in KEYWORDS_MAP.items():
+             if mapped_cols[target_name] is None: # Mapeia apenas uma vez
+                 if any(keyword in header_str for keyword in keywords):
+                     col_names.append(target_name)
+                     mapped_cols[target_name] = i # Guarda o índice original
+                     found_map = True
+                     break
+        if not found_map:
+             col_names.append(f"desconhecida_{i}")
+    dados_df.columns = col_names[:dados_df.shape[1]]
+
+    # Verificar se colunas essenciais foram mapeadas
+    colunas_faltantes = [name for name, index in mapped_cols.items() if index is None]
+    if colunas_faltantes:
+        logging.warning(f"{log_prefix} Colunas essenciais não encontradas pelo nome: {colunas_faltantes}. Preços dessas colunas serão 0.0.")
+
+    if "faixa_valor" not in dados_df.columns:
+        raise ValueError("Coluna 'faixa_valor' não encontrada após mapeamento.")
+    # Remover linhas com NaN em 'faixa_valor'
+    dados_df = dados_df.dropna(subset=["faixa_valor"]).reset_index(drop=True)
+    if dados_df.empty:
+        raise ValueError("Tabela vazia após limpar linhas sem faixa de valor.")
+
+    # Converter valores para numérico
+    for col in ["adesao", "plano_ouro", "plano_diamante", "plano_platinum", "pesados"]:
+        if col in dados_df.columns:
+            dados_df[col] = pd.to_numeric(dados_df[col], errors='coerce')
+
+    return dados_df
+
+
+def parse_valor_brasileiro(valor_str):
+    """Converte '75.000,50' / '75000' (ou um número já convertido, vindo de JSON/planilha) em float (ValueError se inválido)."""
+    if isinstance(valor_str, bool):
+        raise ValueError(f"valor inválido: {valor_str!r}")
+    if not isinstance(valor_str, str):
+        return float(valor_str) # int/float/numpy: já é número
+    # Tratar formato brasileiro (remove '.' de milhar, troca ',' decimal por '.')
+    valor_str_limpo = valor_str.replace('.', '').replace(',', '.')
+    return float(valor_str_limpo)
+
+
+def _parse_faixa(faixa):
+    """Converte 'R$15.000,01 - R$20.000,00' em (15000.01, 20000.0). Retorna None se não for uma faixa."""
+    if not (isinstance(faixa, str) and "-" in faixa):
+        return None
+    valores = faixa.replace("R$", "").strip().split("-")
+    if len(valores) != 2:
+        return None
+    try:
+        # Limpa pontos de milhar e troca vírgula decimal por ponto
+        min_valor = float(valores[0].replace(".", "").replace(",", ".").strip())
+        max_valor = float(valores[1].replace(".", "").replace(",", ".").strip())
+    except ValueError:
+        return None
+    if min_valor != min_valor or max_valor != max_valor: # NaN nunca casa com nenhum valor
+        return None
+    return min_valor, max_valor
+
+
+def _parse_max_ultima_faixa(faixa):
+    """Limite máximo da última linha da tabela (usado para recusar valores acima da tabela)."""
+    try:
+        if isinstance(faixa, str) and "-" in faixa:
+            return float(faixa.split("-")[1].replace("R$", "").replace(".", "").replace(",", ".").strip())
+    except (ValueError, IndexError):
+        pass
+    return None
+
+
+def caminho_artefato(arquivo_tabela):
+    """'input_files/Tabela 2023.xlsx' -> 'input_files/Tabela 2023.npz' (saída padrão do compile-table)."""
+    return os.path.splitext(arquivo_tabela)[0] + EXTENSAO_ARTEFATO
+
+
+def _sha256_arquivo(caminho):
+    with open(caminho, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class CachePrecos:
+    """LRU limitado dos preços por (versão da tabela, linha da faixa, percentual adicional).
+
+    Milhares de valores FIPE diferentes caem nas mesmas poucas dezenas de combinações,
+    então cotações repetidas ou próximas pulam todo o trabalho com a tabela.
+    """
+
+    def __init__(self, tamanho_maximo):
+        self.tamanho_maximo = tamanho_maximo
+        self._dados = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.descartes = 0
+
+    def obter(self, chave):
+        """Valor em cache para 'chave' ou None."""
+        with self._lock:
+            valor = self._dados.get(chave)
+            if valor is None:
+                self.falhas += 1
+                return None
+            self.acertos += 1
+            self._dados.move_to_end(chave)
+            return valor
+
+    def guardar(self, chave, valor):
+        if self.tamanho_maximo <= 0:
+            return valor
+        with self._lock:
+            self._dados[chave] = valor
+            if len(self._dados) > self.tamanho_maximo:
+                self._dados.popitem(last=False)
+                self.descartes += 1
+        return valor
+
+    def limpar(self):
+        """Invalida tudo (chamado quando a tabela de preços muda)."""
+        with self._lock:
+            self._dados.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            total = self.acertos + self.falhas
+            return {
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "descartes": self.descartes,
+                "tamanho": len(self._dados),
+                "tamanho_maximo": self.tamanho_maximo,
+                "taxa_acerto": self.acertos / total if total else 0.0,
+            }
+
+
+cache_precos = CachePrecos(TAMANHO_CACHE_PRECOS)
+registrar_fonte(lambda: [("cache_precos_consultas_total", {"resultado": "acerto"}, cache_precos.acertos),
+                         ("cache_precos_consultas_total", {"resultado": "falha"}, cache_precos.falhas)])
+
+
+class PriceTable:
+    """Tabela de preços compilada em memória a partir do Excel (ou do artefato .npz do compile-table).
+
+    As faixas "R$ x - R$ y" são parseadas uma única vez. Para a busca, a reta numérica é
+    dividida pelos limites das faixas (array ordenado 'pontos'): cada ponto e cada intervalo
+    aberto entre pontos consecutivos já sabem qual linha da tabela atende (a PRIMEIRA faixa,
+    na ordem da planilha, que contém o valor - mesma regra do loop original). Assim a busca
+    é um bisect, e os preços saem de uma matriz (linhas x planos) já numérica.
+    """
+
+    def __init__(self, arquivo_tabela, usar_artefato=True):
+        self.arquivo_tabela = arquivo_tabela
+        self.mtime = os.stat(arquivo_tabela).st_mtime_ns
+        if arquivo_tabela.lower().endswith(EXTENSAO_ARTEFATO):
+            self._carregar_artefato(arquivo_tabela)
+            return
+
+        # Excel: usa o artefato pré-compilado (compile-table) se ele corresponder a este arquivo
+        sha256 = _sha256_arquivo(arquivo_tabela)
+        artefato = caminho_artefato(arquivo_tabela)
+        if usar_artefato and os.path.exists(artefato):
+            try:
+                self._carregar_artefato(artefato)
+                if self.sha256 == sha256:
+                    logging.info(f"{log_prefix} Tabela carregada do artefato pré-compilado: {artefato}")
+                    return
+                logging.warning(f"{log_prefix} Artefato '{artefato}' desatualizado em relação ao Excel. Recompilando em memória.")
+            except Exception as e:
+                logging.warning(f"{log_prefix} Artefato '{artefato}' inválido ({e}). Recompilando em memória.")
+        self.sha256 = sha256
+        self._compilar(_ler_dados_tabela(arquivo_tabela))
+
+    @functools.cached_property
+    def versao(self):
+        """Identificador da versão: nome da tabela + início do SHA-256 da planilha de origem."""
+        return f"{os.path.splitext(os.path.basename(self.arquivo_tabela))[0]}@{self.sha256[:12]}"
+
+    def _compilar(self, dados_df):
+        n_linhas = len(dados_df)
+        # Matriz de preços: NaN (célula vazia/texto) ou coluna ausente viram 0.0, como antes
+        precos = np.zeros((n_linhas, len(PLANOS_COLUNAS)), dtype=np.float64)
+        precos_nan = np.ones((n_linhas, len(PLANOS_COLUNAS)), dtype=bool)
+        for j, (_, coluna) in enumerate(PLANOS_COLUNAS):
+            if coluna in dados_df.columns:
+                valores = dados_df[coluna].to_numpy(dtype=np.float64)
+                precos_nan[:, j] = np.isnan(valores)
+                precos[:, j] = np.nan_to_num(valores, nan=0.0)
+
+        faixas = [] # (min, max, linha) na ordem da planilha
+        for linha, faixa in enumerate(dados_df["faixa_valor"]):
+            intervalo = _parse_faixa(faixa)
+            if intervalo is not None:
+                faixas.append((intervalo[0], intervalo[1], linha))
+        if not faixas:
+            raise ValueError("Nenhuma faixa 'R$ x - R$ y' válida encontrada na tabela.")
+
+        def primeira_linha(contem):
+            return next((linha for mn, mx, linha in faixas if contem(mn, mx)), -1)
+
+        pontos = sorted({v for mn, mx, _ in faixas for v in (mn, mx)})
+        limites = [-np.inf] + pontos + [np.inf]
+        # linha_ponto[i]: faixa que contém exatamente pontos[i]
+        # linha_intervalo[i]: faixa que contém o intervalo aberto (limites[i], limites[i+1])
+        linha_ponto = [primeira_linha(lambda mn, mx, p=p: mn <= p <= mx) for p in pontos]
+        linha_intervalo = [primeira_linha(lambda mn, mx, a=a, b=b: mn <= a and mx >= b)
+                           for a, b in zip(limites[:-1], limites[1:])]
+        max_ultima_faixa = _parse_max_ultima_faixa(dados_df["faixa_valor"].iloc[-1])
+
+        self.faixas_texto = [str(f).replace("\n", " ") for f in dados_df["faixa_valor"]]
+        self.colunas_faltantes = [c for _, c in PLANOS_COLUNAS if c not in dados_df.columns]
+        self.precos = precos
+        self.precos_nan = precos_nan
+        self.faixa_min = np.array([f[0] for f in faixas], dtype=np.float64)
+        self.faixa_max = np.array([f[1] for f in faixas], dtype=np.float64)
+        self.faixa_linha = np.array([f[2] for f in faixas], dtype=np.intp)
+        self._pontos_arr = np.array(pontos, dtype=np.float64)
+        self._linha_ponto_arr = np.array(linha_ponto, dtype=np.intp)
+        self._linha_intervalo_arr = np.array(linha_intervalo, dtype=np.intp)
+        self.max_ultima_faixa = max_ultima_faixa
+        self._indexar()
+        logging.info(f"{log_prefix} Tabela compilada: {n_linhas} linhas, {len(faixas)} faixas, {len(pontos)} limites.")
+
+    def _indexar(self):
+        """Deriva as estruturas de busca escalar a partir dos arrays compilados."""
+        self.n_linhas = len(self.precos)
+        self.pontos = self._pontos_arr.tolist()
+        self.linha_ponto = self._linha_ponto_arr.tolist()
+        self.linha_intervalo = self._linha_intervalo_arr.tolist()
+        self._precos_linhas = self.precos.tolist() # Listas Python: acesso escalar mais rápido que numpy
+
+    def salvar_artefato(self, caminho):
+        """Grava a tabela compilada em um .npz (sem pickle), carregável sem pandas/openpyxl."""
+        with open(caminho, "wb") as f:
+            np.savez(
+                f,
+                versao_formato=np.array(VERSAO_FORMATO_ARTEFATO),
+                sha256_origem=np.array(self.sha256),
+                faixas_texto=np.frombuffer("\n".join(self.faixas_texto).encode("utf-8"), dtype=np.uint8),
+                colunas_faltantes=np.array(self.colunas_faltantes, dtype=str),
+                precos=self.precos,
+                precos_nan=self.precos_nan,
+                faixa_min=self.faixa_min,
+                faixa_max=self.faixa_max,
+                faixa_linha=self.faixa_linha,
+                pontos=self._pontos_arr,
+                linha_ponto=self._linha_ponto_arr,
+                linha_intervalo=self._linha_intervalo_arr,
+                max_ultima_faixa=np.array(np.nan if self.max_ultima_faixa is None else self.max_ultima_faixa),
+            )
+
+    def _carregar_artefato(self, caminho):
+        with np.load(caminho, allow_pickle=False) as dados:
+            if int(dados["versao_formato"]) != VERSAO_FORMATO_ARTEFATO:
+                raise ValueError(f"versão de formato {int(dados['versao_formato'])} não suportada")
+            self.sha256 = str(dados["sha256_origem"])
+            self.faixas_texto = dados["faixas_texto"].tobytes().decode("utf-8").split("\n")
+            self.colunas_faltantes = dados["colunas_faltantes"].tolist()
+            self.precos = dados["precos"]
+            self.precos_nan = dados["precos_nan"]
+            self.faixa_min = dados["faixa_min"]
+            self.faixa_max = dados["faixa_max"]
+            self.faixa_linha = dados["faixa_linha"].astype(np.intp)
+            self._pontos_arr = dados["pontos"]
+            self._linha_ponto_arr = dados["linha_ponto"].astype(np.intp)
+            self._linha_intervalo_arr = dados["linha_intervalo"].astype(np.intp)
+            max_ultima_faixa = float(dados["max_ultima_faixa"])
+        self.max_ultima_faixa = None if np.isnan(max_ultima_faixa) else max_ultima_faixa
+        self._indexar()
+
+    def validar(self, tolerancia=0.01):
+        """Confere a consistência das faixas e preços. Retorna (erros, avisos) como listas de texto.
+
+        As faixas são agrupadas em blocos na ordem da planilha: um bloco novo começa quando a
+        faixa recomeça abaixo da anterior (ex: tabela de motos depois da de automóveis).
+        Dentro de um bloco, lacunas maiores que 'tolerancia' (1 centavo) e sobreposições são erros.
+        """
+        erros, avisos = [], []
+        for coluna in self.colunas_faltantes:
+            erros.append(f"Coluna '{coluna}' não encontrada no cabeçalho (preço será sempre 0.0).")
+
+        bloco = 1
+        for k in range(len(self.faixa_min)):
+            mn, mx, linha = self.faixa_min[k], self.faixa_max[k], self.faixa_linha[k]
+            texto = self.faixas_texto[linha]
+            if mn > mx:
+                erros.append(f"Faixa '{texto}' com mínimo maior que o máximo.")
+            if k > 0:
+                ant_max, ant_linha = self.faixa_max[k - 1], self.faixa_linha[k - 1]
+                if mn < self.faixa_min[k - 1]:
+                    bloco += 1
+                    avisos.append(f"Faixa '{texto}' inicia o bloco {bloco}: só é usada em valores não cobertos pelos blocos anteriores.")
+                elif mn <= ant_max:
+                    erros.append(f"Sobreposição: '{self.faixas_texto[ant_linha]}' e '{texto}'.")
+                elif mn - ant_max > tolerancia + 1e-9:
+                    erros.append(f"Lacuna: nenhum preço entre '{self.faixas_texto[ant_linha]}' e '{texto}'.")
+            nan_planos = [PLANOS_COLUNAS[j][0] for j in np.flatnonzero(self.precos_nan[linha])
+                          if PLANOS_COLUNAS[j][1] not in self.colunas_faltantes]
+            if nan_planos:
+                msg = f"Faixa '{texto}' (bloco {bloco}) sem preço numérico para: {', '.join(nan_planos)}."
+                (erros if bloco == 1 else avisos).append(msg)
+
+        ultima = self.n_linhas - 1
+        if self.precos_nan[ultima].all():
+            limite_str = f"{LIMITE_APROVACAO:,.0f}".replace(",", ".")
+            avisos.append(f"A última linha da tabela ('{self.faixas_texto[ultima]}'), base dos valores acima de "
+                          f"R$ {limite_str}, não tem preços: esses veículos serão cotados a 0.0.")
+        return erros, avisos
+
+    def localizar_linha(self, valor_fipe):
+        """Índice da linha da tabela usada para 'valor_fipe' (<= R$ 100k), ou None se não houver."""
+        if valor_fipe != valor_fipe: # NaN
             return None
+        i = bisect.bisect_left(self.pontos, valor_fipe)
+        if i < len(self.pontos) and self.pontos[i] == valor_fipe:
+            linha = self.linha_ponto[i]
+        else:
+            linha = self.linha_intervalo[i]
+        if linha >= 0:
+            return linha
 
-        # Converter valores para numérico
-        for col in ["adesao", "plano_ouro", "plano_diamante", "plano_platinum", "pesados"]:
-            if col in dados_df.columns:
-                print(f"[calculo_precos] Convertendo coluna '{col}' para numérico.")
-                dados_df[col] = pd.to_numeric(dados_df[col], errors='coerce')
-                # Verificar se há NaNs após conversão (indicaria texto/formato inválido na coluna)
-                if dados_df[col].isnull().any():
-                     print(f"[calculo_precos] AVISO: Valores não numéricos encontrados na coluna '{col}' e convertidos para NaN.")
-            else:
-                 print(f"[calculo_precos] AVISO: Coluna '{col}' esperada não encontrada para conversão numérica.")
-
-        # --- Lógica de Cálculo ---
-        valor_excedente = 0.0
-        percentual_adicional = 0.0
-        sujeito_aprovacao = False
-        
-        if valor_fipe > 100000.0:
-            print(f"[calculo_precos] Valor FIPE {valor_fipe} > 100k. Aplicando regra especial.")
-            valor_excedente = valor_fipe - 100000.0
+        # Fallback: nenhuma faixa exata -> última linha, a menos que o valor passe do máximo da tabela
+        if valor_fipe > 0:
+            if self.max_ultima_faixa is not None and valor_fipe > self.max_ultima_faixa:
+                return None
+            return self.n_linhas - 1
+        return None
+
+    def calcular(self, valor_fipe):
+        """Mesmo dict de calcular_precos_planos, ou None se o valor não tiver faixa."""
+        if not math.isfinite(valor_fipe): # inf/NaN: sem faixa, como antes (int(inf) levantaria OverflowError)
+            return None
+        if valor_fipe > LIMITE_APROVACAO:
+            valor_excedente = valor_fipe - LIMITE_APROVACAO
             percentual_adicional = int(valor_excedente / 1000.0) # 1% a cada 1000
             sujeito_aprovacao = True
-            print(f"[calculo_precos] Valor excedente: {valor_excedente}, Percentual Adicional: {percentual_adicional}%")
-            
-            # Usar a última linha como base
-            if not dados_df.empty:
-                 faixa_encontrada = dados_df.iloc[-1]
-                 print(f"[calculo_precos] Usando última linha (Índice {faixa_encontrada.name}) como base: Faixa '{faixa_encontrada.get('faixa_valor', 'N/A')}'")
-            else:
-                 print("[calculo_precos] ERRO: Tabela vazia, não é possível calcular para FIPE > 100k.")
-                 return None 
+            linha = self.n_linhas - 1 # Usar a última linha como base
         else:
-            # --- Loop Principal para Encontrar a Faixa ---
-            print(f"[calculo_precos] Procurando faixa para FIPE: {valor_fipe}")
-            faixa_encontrada = None
-            for idx, row in dados_df.iterrows():
-                faixa = row["faixa_valor"]
-                print(f"[calculo_precos]  Verificando Linha índice: {idx}, Faixa: '{faixa}'")
-                if isinstance(faixa, str) and "-" in faixa:
-                    min_valor, max_valor = None, None
-                    try:
-                        # Limpeza mais robusta
-                        faixa_limpa = str(faixa).replace("R$", "").strip()
-                        valores = faixa_limpa.split("-")
-                        if len(valores) == 2:
-                            # Limpa pontos de milhar e troca vírgula decimal por ponto
-                            min_valor_str = valores[0].replace(".", "").replace(",", ".").strip()
-                            max_valor_str = valores[1].replace(".", "").replace(",", ".").strip()
-                            min_valor = float(min_valor_str)
-                            max_valor = float(max_valor_str)
-                            print(f"[calculo_precos]    Faixa parseada: min={min_valor}, max={max_valor}")
-                        else:
-                             print(f"[calculo_precos]    AVISO: Faixa '{faixa}' não tem formato min-max esperado após split.")
-                             continue 
-                             
-                    except ValueError as e:
-                        print(f"[calculo_precos]    ERRO ao converter valores da faixa '{faixa}' para float: {e}")
-                        continue 
-                    except Exception as e_parse:
-                         print(f"[calculo_precos]    ERRO inesperado ao parsear faixa '{faixa}': {e_parse}")
-                         continue
-
-                    # Comparação
-                    if min_valor is not None and max_valor is not None:
-                        # Ajuste pequeno para garantir inclusão correta (ex: 0.01 a 100.00 inclui 100.00)
-                        # A comparação original min_valor <= valor_fipe <= max_valor ESTÁ CORRETA.
-                        # Não precisa de ajuste epsilon se os limites forem xxx.01 a yyy.00
-                        comparacao = min_valor <= valor_fipe <= max_valor
-                        print(f"[calculo_precos]    Comparando: {min_valor} <= {valor_fipe} <= {max_valor} -> {comparacao}")
-                        if comparacao:
-                            faixa_encontrada = row
-                            print(f"[calculo_precos]    >>> Faixa ENCONTRADA! Índice da linha no DataFrame original: {idx}")
-                            break 
-                    else:
-                         print("[calculo_precos]    AVISO: min_valor ou max_valor não puderam ser definidos para comparação.")
-
-            # Fallback se nenhuma faixa exata foi encontrada
-            if faixa_encontrada is None:
-                print(f"[calculo_precos] Nenhuma faixa exata encontrada para FIPE {valor_fipe}.")
-                # Manter fallback para última linha, mas só se valor > 0
-                if not dados_df.empty and valor_fipe > 0:
-                     # Verificar se o valor FIPE é MAIOR que o máximo da última faixa?
-                     # Isso pode indicar que ele realmente não deveria ter preço.
-                     # Vamos pegar a última faixa para análise:
-                     ultima_faixa_row = dados_df.iloc[-1]
-                     ultima_faixa_str = ultima_faixa_row.get("faixa_valor", "")
-                     max_ultima_faixa = None
-                     try:
-                         if isinstance(ultima_faixa_str, str) and "-" in ultima_faixa_str:
-                             max_str = ultima_faixa_str.split("-")[1].replace("R$", "").replace(".", "").replace(",", ".").strip()
-                             max_ultima_faixa = float(max_str)
-                     except: 
-                         pass # Ignora erro ao parsear a última faixa para este check
-
-                     # Se o valor FIPE for maior que o limite máximo da tabela, retornar erro?
-                     if max_ultima_faixa is not None and valor_fipe > max_ultima_faixa:
-                           print(f"[calculo_precos] ERRO: Valor FIPE {valor_fipe} é MAIOR que o limite máximo da tabela ({max_ultima_faixa}).")
-                           return None # Retorna None -> Causa o erro "Não foi possível encontrar..." no app.py intencionalmente.
-                     else:
-                          # Se não for maior que o limite (ou não conseguimos verificar), mantém o fallback
-                          faixa_encontrada = ultima_faixa_row
-                          print(f"[calculo_precos] ATENÇÃO: Usando a ÚLTIMA faixa da tabela como fallback: '{ultima_faixa_str}'")
-
-                elif valor_fipe <= 0:
-                     print("[calculo_precos] ERRO: Valor FIPE inválido ou zero.")
-                     return None
-                else:
-                    # Isso só aconteceria se dropna limpasse TUDO
-                    print("[calculo_precos] ERRO CRÍTICO: Não há faixas válidas na tabela para usar como fallback.")
-                    return None 
-
-        # --- Extração dos Preços ---
-        print(f"[calculo_precos] Extraindo preços da linha encontrada (Índice original: {faixa_encontrada.name if faixa_encontrada is not None else 'Nenhum'})")
-        precos = {}
-        if faixa_encontrada is not None:
-            for plano, coluna in [
-                ("Adesão", "adesao"),
-                ("Plano Ouro", "plano_ouro"),
-                ("Diamante", "plano_diamante"),
-                ("Platinum", "plano_platinum"),
-                ("Pesados", "pesados")
-            ]:
-                # Verifica se a coluna realmente existe ANTES de tentar acessá-la
-                if coluna in faixa_encontrada.index:
-                    valor_na_celula = faixa_encontrada[coluna]
-                    # Verifica se não é NaN (resultado de to_numeric com erro ou célula vazia)
-                    if not pd.isna(valor_na_celula):
-                        try:
-                            valor_base = float(valor_na_celula)
-                            print(f"[calculo_precos]   {plano} ({coluna}): Valor base lido = {valor_base}")
-                             
-                            if sujeito_aprovacao and plano != "Adesão":
-                                valor_ajustado = valor_base * (1 + percentual_adicional / 100.0)
-                                print(f"[calculo_precos]     + {percentual_adicional}% = {valor_ajustado}")
-                                precos[plano] = valor_ajustado
-                            else:
-                                precos[plano] = valor_base
-                        except Exception as e_conv:
-                             print(f"[calculo_precos]   ERRO ao converter valor para {plano} ({coluna}): '{valor_na_celula}' -> {e_conv}")
-                             precos[plano] = 0.0 # Define 0.0 se a conversão falhar
-                    else:
-                        print(f"[calculo_precos]   AVISO: Valor NULO/NaN encontrado na coluna '{coluna}' para o plano '{plano}'. Definindo preço como 0.0")
-                        precos[plano] = 0.0
-                else:
-                    print(f"[calculo_precos]   AVISO: Coluna '{coluna}' não encontrada na linha selecionada para o plano '{plano}'. Definindo preço como 0.0")
-                    precos[plano] = 0.0
-        else:
-             print("[calculo_precos] ERRO: Nenhuma linha/faixa encontrada para extrair preços (faixa_encontrada is None).")
-             return None # Retorna None explicitamente
+            valor_excedente = 0.0
+            percentual_adicional = 0.0
+            sujeito_aprovacao = False
+            linha = self.localizar_linha(valor_fipe)
+            if linha is None:
+                return None
+
+        # Os preços só dependem da linha e do percentual: reaproveita o dict já calculado
+        chave = (self.versao, linha, percentual_adicional)
+        planos = cache_precos.obter(chave)
+        if planos is None:
+            planos = cache_precos.guardar(chave, self._precos_planos(linha, percentual_adicional, sujeito_aprovacao))
+        precos = dict(planos)
 
         # Adicionar informações extras
         precos["valor_excedente"] = valor_excedente
         precos["percentual_adicional"] = percentual_adicional
         precos["sujeito_aprovacao"] = sujeito_aprovacao
-        
-        print(f"[calculo_precos] Preços finais calculados: {precos}")
-        print("[calculo_precos] Cálculo finalizado com sucesso.")
         return precos
-        
+
+
+    def _precos_planos(self, linha, percentual_adicional, sujeito_aprovacao):
+        base = self._precos_linhas[linha]
+        precos = {"Adesão": base[0]}
+        if sujeito_aprovacao:
+            fator = 1 + percentual_adicional / 100.0
+            for j in range(1, len(PLANOS_COLUNAS)):
+                precos[PLANOS_COLUNAS[j][0]] = base[j] * fator
+        else:
+            for j in range(1, len(PLANOS_COLUNAS)):
+                precos[PLANOS_COLUNAS[j][0]] = base[j]
+        return precos
+
+    def localizar_linhas(self, valores_fipe):
+        """Versão vetorizada de localizar_linha: array de índices de linha (-1 = sem faixa)."""
+        v = np.asarray(valores_fipe, dtype=np.float64)
+        n_pontos = len(self._pontos_arr)
+        i = np.searchsorted(self._pontos_arr, v, side="left")
+        i_ponto = np.minimum(i, n_pontos - 1)
+        exato = (i < n_pontos) & (self._pontos_arr[i_ponto] == v)
+        linhas = np.where(exato, self._linha_ponto_arr[i_ponto], self._linha_intervalo_arr[i])
+
+        # Mesmo fallback do escalar: última linha se valor > 0 e não passar do máximo da tabela
+        fallback = (linhas < 0) & (v > 0)
+        if self.max_ultima_faixa is not None:
+            fallback &= ~(v > self.max_ultima_faixa)
+        linhas = np.where(fallback, self.n_linhas - 1, linhas)
+        linhas[np.isnan(v)] = -1
+        return linhas
+
+    def calcular_lote(self, valores_fipe):
+        """Calcula os preços de vários veículos de uma vez. Retorna um DataFrame, uma linha por valor.
+
+        As colunas são as mesmas chaves do dict de calcular() + 'valor_fipe' e 'faixa_encontrada'.
+        Onde calcular() retornaria None, os preços ficam NaN e 'faixa_encontrada' é False.
+        """
+        import pandas as pd
+
+        indice = valores_fipe.index if isinstance(valores_fipe, pd.Series) else None
+        v = np.asarray(valores_fipe, dtype=np.float64).ravel()
+
+        acima = v > LIMITE_APROVACAO
+        valor_excedente = np.where(acima, v - LIMITE_APROVACAO, 0.0)
+        with np.errstate(invalid="ignore"):
+            percentual_adicional = np.where(acima, np.trunc(valor_excedente / 1000.0), 0.0) # int() trunca
+        linhas = np.where(acima, self.n_linhas - 1, self.localizar_linhas(v))
+        linhas[~np.isfinite(v)] = -1 # inf/NaN: sem preço, como no calcular()
+        encontrada = linhas >= 0
+
+        precos = self.precos[np.where(encontrada, linhas, 0)]
+        fator = 1 + percentual_adicional / 100.0
+        precos[:, 1:] = np.where(acima[:, None], precos[:, 1:] * fator[:, None], precos[:, 1:]) # Adesão sem ajuste
+        precos[~encontrada] = np.nan
+
+        resultado = pd.DataFrame(precos, columns=[plano for plano, _ in PLANOS_COLUNAS], index=indice)
+        resultado.insert(0, "valor_fipe", v)
+        resultado["valor_excedente"] = valor_excedente
+        resultado["percentual_adicional"] = percentual_adicional
+        resultado["sujeito_aprovacao"] = acima
+        resultado["faixa_encontrada"] = encontrada
+        return resultado
+
+
+# Uma PriceTable por arquivo, por processo. Recarregada quando o mtime do arquivo muda.
+_tabelas = {}
+_chaves_tabela = {} # caminho informado -> caminho absoluto
+_tabelas_lock = threading.Lock()
+
+
+def obter_tabela(arquivo_tabela):
+    """Retorna a PriceTable de 'arquivo_tabela', (re)compilando se o arquivo mudou no disco."""
+    mtime = os.stat(arquivo_tabela).st_mtime_ns # FileNotFoundError se não existir
+    chave = _chaves_tabela.get(arquivo_tabela)
+    if chave is None:
+        # Caminhos relativo e absoluto compartilham a mesma tabela
+        chave = _chaves_tabela.setdefault(arquivo_tabela, os.path.abspath(arquivo_tabela))
+    tabela = _tabelas.get(chave)
+    if tabela is not None and tabela.mtime == mtime:
+        return tabela
+    with _tabelas_lock:
+        tabela = _tabelas.get(chave)
+        if tabela is None or tabela.mtime != mtime:
+            logging.info(f"{log_prefix} (Re)carregando tabela de preços: {arquivo_tabela}")
+            tabela = PriceTable(arquivo_tabela)
+            _tabelas[chave] = tabela
+            cache_precos.limpar()
+    return tabela
+
+
+def calcular_precos_planos_lote(valores_fipe, arquivo_tabela=ARQUIVO_TABELA_PADRAO):
+    """Calcula os preços para uma frota inteira (array NumPy, lista ou Series de valores FIPE).
+
+    Retorna um DataFrame com uma linha por veículo (ver PriceTable.calcular_lote),
+    ou None se a tabela não puder ser carregada.
+    """
+    try:
+        return obter_tabela(arquivo_tabela).calcular_lote(valores_fipe)
+    except FileNotFoundError:
+        logging.error(f"{log_prefix} ERRO CRÍTICO: Arquivo de tabela não encontrado em {arquivo_tabela}")
+        return None
+    except Exception as e:
+        logging.error(f"{log_prefix} ERRO GERAL INESPERADO em calcular_precos_planos_lote: {e}")
+        traceback.print_exc()
+        return None
+
+
+def calcular_precos_planos(valor_fipe, arquivo_tabela):
+    """Calcula os preços dos planos com base no valor FIPE do veículo."""
+    try:
+        precos = obter_tabela(arquivo_tabela).calcular(valor_fipe)
+        if precos is None:
+            logging.info(f"{log_prefix} Nenhuma faixa encontrada para FIPE {valor_fipe}.")
+        return precos
+
     except FileNotFoundError:
-        print(f"[calculo_precos] ERRO CRÍTICO: Arquivo de tabela não encontrado em {arquivo_tabela}")
+        logging.error(f"{log_prefix} ERRO CRÍTICO: Arquivo de tabela não encontrado em {arquivo_tabela}")
         return None
     except Exception as e:
-        print(f"[calculo_precos] ERRO GERAL INESPERADO em calcular_precos_planos: {e}")
+        logging.error(f"{log_prefix} ERRO GERAL INESPERADO em calcular_precos_planos: {e}")
         traceback.print_exc() # Imprime traceback completo no log
         return None
 
@@ -0,0 +1,115 @@
+# ----- INÍCIO DO CÓDIGO PARA conversao_async.py -----
+# Conversão PPTX -> PDF para o servidor ASGI (asgi.py), sem prender threads nem processos.
+#
+# Cada conversão é um 'libreoffice --convert-to pdf' lançado com asyncio.create_subprocess_exec:
+# enquanto o LibreOffice trabalha, o event loop segue atendendo outras requisições. No máximo
+# VAGAS_CONVERSAO conversões rodam ao mesmo tempo (cada vaga com o seu perfil de usuário); as
+# demais esperam numa fila de até ASGI_FILA_CONVERSAO, que só custa uma corrotina cada.
+#
+# O timeout é do asyncio, e uma conversão cancelada (cliente desconectou, servidor parando) mata
+# o grupo de processos do LibreOffice na hora.
+import os
+import time
+import signal
+import shutil
+import asyncio
+import logging
+import tempfile
+import contextlib
+
+from converte_pdf import (ConversaoSaturada, VAGAS_CONVERSAO, PERFIS_DIR, TEMP_DIR, TIMEOUT_CONVERSAO,
+                          comando_conversao_avulsa)
+from metricas import contar, observar, medir
+
+log_prefix = "[conversao_async]"
+
+# Conversões aguardando vaga (por processo); acima disso responde 503 com Retry-After
+ASGI_FILA_CONVERSAO = int(os.environ.get("ASGI_FILA_CONVERSAO", "100"))
+
+
+class ConversorAsync:
+    """Vagas de conversão do event loop atual + execução do LibreOffice em subprocesso assíncrono."""
+
+    def __init__(self, vagas=VAGAS_CONVERSAO, fila_max=ASGI_FILA_CONVERSAO, timeout=TIMEOUT_CONVERSAO):
+        self.vagas = vagas
+        self.fila_max = fila_max
+        self.timeout = timeout
+        self._livres = asyncio.Queue()
+        for indice in range(vagas):
+            self._livres.put_nowait(indice)
+        self._aguardando = 0
+        self._duracao_media = None
+
+    def _perfil(self, vaga):
+        return os.path.join(PERFIS_DIR, f"cotacao_{os.getpid()}_async_{vaga}")
+
+    def _retry_after(self):
+        duracao = self._duracao_media or 5.0
+        return max(1, int(duracao * (self._aguardando + 1) / self.vagas))
+
+    async def converter_bytes(self, pptx_bytes):
+        """Bytes do PDF ou None. Levanta ConversaoSaturada se a fila estiver cheia."""
+        if self._aguardando >= self.fila_max:
+            contar("conversoes_total", modo="async", resultado="saturada")
+            raise ConversaoSaturada(self._retry_after())
+        self._aguardando += 1
+        inicio = time.perf_counter()
+        try:
+            vaga = await self._livres.get()
+        finally:
+            self._aguardando -= 1
+        observar("cotacao_etapa_segundos", time.perf_counter() - inicio, etapa="fila_conversao")
+        try:
+            return await self._converter(vaga, pptx_bytes)
+        finally:
+            self._livres.put_nowait(vaga)
+
+    async def _converter(self, vaga, pptx_bytes):
+        temp_dir = tempfile.mkdtemp(prefix="cotacao_", dir=TEMP_DIR)
+        inicio = time.perf_counter()
+        processo = None
+        try:
+            pptx_path = os.path.join(temp_dir, "cotacao.pptx")
+            with open(pptx_path, "wb") as f:
+                f.write(pptx_bytes)
+            cmd = comando_conversao_avulsa(pptx_path, temp_dir, self._perfil(vaga))
+            # Sessão própria: no timeout/cancelamento o killpg leva junto o soffice.bin filho
+            processo = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE,
+                                                            stderr=asyncio.subprocess.PIPE, start_new_session=True)
+            try:
+                _, stderr = await asyncio.wait_for(processo.communicate(), self.timeout)
+            except asyncio.TimeoutError:
+                logging.error(f"{log_prefix} Timeout ({self.timeout}s) na conversão da vaga {vaga}.")
+                contar("conversoes_total", modo="async", resultado="timeout")
+                return None
+            pdf_path = os.path.join(temp_dir, "cotacao.pdf")
+            if processo.returncode != 0 or not os.path.exists(pdf_path):
+                logging.error(f"{log_prefix} LibreOffice falhou (código {processo.returncode}): "
+                              f"{stderr.decode(errors='replace').strip()}")
+                contar("conversoes_total", modo="async", resultado="falha")
+                return None
+            with open(pdf_path, "rb") as f:
+                pdf_bytes = f.read()
+            duracao = time.perf_counter() - inicio
+            self._duracao_media = duracao if self._duracao_media is None else 0.8 * self._duracao_media + 0.2 * duracao
+            contar("conversoes_total", modo="async", resultado="sucesso")
+            logging.info(f"{log_prefix} PDF gerado em {duracao:.2f}s (vaga {vaga}): {len(pdf_bytes)} bytes")
+            return pdf_bytes
+        except FileNotFoundError:
+            logging.error(f"{log_prefix} ERRO CRÍTICO: Comando 'libreoffice' não encontrado.")
+            contar("conversoes_total", modo="async", resultado="falha")
+            return None
+        finally:
+            if processo is not None and processo.returncode is None:
+                # Timeout ou cancelamento (CancelledError segue subindo depois deste bloco)
+                with contextlib.suppress(ProcessLookupError):
+                    os.killpg(processo.pid, signal.SIGKILL)
+                await asyncio.shield(processo.wait())
+            with medir("limpeza"):
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def estatisticas(self):
+        return {"vagas": self.vagas, "livres": self._livres.qsize(), "aguardando": self._aguardando,
+                "fila_max": self.fila_max, "duracao_media_s": self._duracao_media and round(self._duracao_media, 3)}
+
+# ----- FIM DO CÓDIGO -----
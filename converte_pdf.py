@@ -5,15 +5,447 @@ import os
 import subprocess
 import logging # Usar logging é melhor que print
 import traceback
+import json
+import base64
+import math
+import time
+import select
+import shutil
+import tempfile
+import threading
+import contextlib
+import atexit
+
+from metricas import contar, observar, medir
 
 # Configurar logging (pode ser configurado globalmente em app.py)
 # logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 log_prefix = "[converte_pdf]"
 
+# Memória estimada de uma conversão do LibreOffice (soffice + documento), usada no orçamento de vagas
+MEMORIA_POR_VAGA_MB = int(os.environ.get("LIBREOFFICE_MEMORIA_POR_VAGA_MB", "400"))
+
+
+def _memoria_disponivel_mb():
+    """Memória disponível para o container: limite do cgroup (v2/v1) ou MemAvailable do /proc/meminfo."""
+    for caminho in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(caminho) as f:
+                valor = f.read().strip()
+            if valor.isdigit() and int(valor) < 1 << 60: # "max" / valor gigante = sem limite
+                return int(valor) // (1024 * 1024)
+        except OSError:
+            pass
+    try:
+        with open("/proc/meminfo") as f:
+            for linha in f:
+                if linha.startswith("MemAvailable:"):
+                    return int(linha.split()[1]) // 1024
+    except OSError:
+        pass
+    return None
+
+
+def _vagas_padrao():
+    """Conversões simultâneas por worker que cabem no orçamento de CPU/RAM, divididas entre os workers do gunicorn."""
+    orcamento = os.cpu_count() or 1
+    memoria = _memoria_disponivel_mb()
+    if memoria is not None:
+        orcamento = min(orcamento, memoria // MEMORIA_POR_VAGA_MB)
+    workers = int(os.environ.get("WEB_CONCURRENCY", "2")) # Mesmo "-w 2" do Dockerfile
+    return max(1, orcamento // max(1, workers))
+
+
+# --- Configurações do Pool de LibreOffice (via variáveis de ambiente) ---
+# LIBREOFFICE_POOL_SIZE=0 desliga o pool e volta ao comportamento antigo (um processo por conversão)
+POOL_TAMANHO = int(os.environ.get("LIBREOFFICE_POOL_SIZE") or _vagas_padrao())
+# Conversões simultâneas por processo (uma por vaga, cada vaga com seu próprio perfil do LibreOffice)
+VAGAS_CONVERSAO = int(os.environ.get("LIBREOFFICE_VAGAS") or (POOL_TAMANHO if POOL_TAMANHO > 0 else _vagas_padrao()))
+# Máximo de requisições esperando vaga; acima disso a conversão é recusada na hora (HTTP 503)
+FILA_MAX = int(os.environ.get("LIBREOFFICE_FILA_MAX", "4"))
+# Tempo máximo esperando vaga antes de desistir (segundos)
+ESPERA_MAX = float(os.environ.get("LIBREOFFICE_ESPERA_MAX", "20"))
+# Teto da espera de quem tenta de novo após ConversaoSaturada (o Retry-After estimado pode ser maior)
+ESPERA_SATURADO_MAX = 30
+# Reinicia a instância após N conversões (evita vazamento de memória do soffice)
+POOL_MAX_JOBS = int(os.environ.get("LIBREOFFICE_MAX_JOBS", "200"))
+# Python com o módulo 'uno' (pacote python3-uno do Debian), usado para rodar ponte_uno.py
+UNO_PYTHON = os.environ.get("LIBREOFFICE_PYTHON", "/usr/bin/python3")
+SOFFICE_BIN = os.environ.get("LIBREOFFICE_BIN", "soffice")
+# Diretório base dos perfis de usuário (um perfil isolado por instância)
+PERFIS_DIR = os.environ.get("LIBREOFFICE_PERFIS_DIR", os.path.join(tempfile.gettempdir(), "cotacao_lo_perfis"))
+# Diretório temporário da conversão avulsa em memória (bytes -> bytes): tmpfs quando existir
+TEMP_DIR = os.environ.get("LIBREOFFICE_TMP_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+TIMEOUT_CONVERSAO = 120 # Mesmo timeout de 2 minutos usado no subprocess
+TIMEOUT_INICIO = 60 # Tempo máximo para o soffice subir e a ponte conectar
+# Instância que não sobe espera antes de tentar de novo: 5s, 10s, 20s... até este teto (segundos)
+ESPERA_REINICIO_MAX = float(os.environ.get("LIBREOFFICE_ESPERA_REINICIO_MAX", "300"))
+ESPERA_REINICIO_BASE = 5
+PONTE_UNO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ponte_uno.py")
+
+
+def _nome_vaga(indice):
+    return f"cotacao_{os.getpid()}_{indice}"
+
+
+def _perfil_vaga(indice):
+    """Perfil de usuário exclusivo da vaga: conversões simultâneas nunca disputam o lock do mesmo perfil."""
+    return os.path.join(PERFIS_DIR, _nome_vaga(indice))
+
+
+class ConversaoSaturada(RuntimeError):
+    """Todas as vagas ocupadas e a fila cheia (ou a espera estourou). retry_after: segundos sugeridos."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Conversões de PDF saturadas. Tente novamente em {retry_after}s.")
+        self.retry_after = retry_after
+
+
+class PoolIndisponivel(RuntimeError):
+    """O pool não tem como subir neste ambiente (soffice ou python3-uno ausentes): não adianta reiniciar."""
+
+
+class AgendadorConversao:
+    """Limita as conversões simultâneas a 'vagas' e enfileira no máximo 'fila_max' requisições.
+
+    Cada vaga tem um índice fixo (0..vagas-1), que escolhe a instância do pool e o perfil
+    do LibreOffice. Quando não há vaga nem lugar na fila, levanta ConversaoSaturada na hora,
+    em vez de prender o worker web até o timeout.
+    """
+
+    def __init__(self, vagas, fila_max, espera_max):
+        self.vagas = vagas
+        self.fila_max = fila_max
+        self.espera_max = espera_max
+        self._livres = list(range(vagas - 1, -1, -1))
+        self._cond = threading.Condition()
+        self.em_execucao = 0
+        self.na_fila = 0
+        self.concluidas = 0
+        self.recusadas = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+        self.duracao_total = 0.0
+
+    def _retry_after(self):
+        """Estimativa (segundos) até sobrar vaga, pela duração média das conversões."""
+        media = self.duracao_total / self.concluidas if self.concluidas else 5.0
+        return max(1, math.ceil(media * (self.na_fila + 1) / self.vagas))
+
+    @contextlib.contextmanager
+    def vaga(self):
+        """Reserva uma vaga (bloqueia até espera_max) e devolve seu índice."""
+        inicio = time.monotonic()
+        with self._cond:
+            if not self._livres and self.na_fila >= self.fila_max:
+                self.recusadas += 1
+                raise ConversaoSaturada(self._retry_after())
+            self.na_fila += 1
+            try:
+                limite = inicio + self.espera_max
+                while not self._livres:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self.recusadas += 1
+                        raise ConversaoSaturada(self._retry_after())
+                    self._cond.wait(restante)
+                indice = self._livres.pop()
+            finally:
+                self.na_fila -= 1
+            espera = time.monotonic() - inicio
+            observar("cotacao_etapa_segundos", espera, etapa="fila_conversao")
+            self.espera_total += espera
+            self.espera_maxima = max(self.espera_maxima, espera)
+            self.em_execucao += 1
+        if espera > 1:
+            logging.info(f"{log_prefix} Conversão esperou {espera:.1f}s por uma vaga (vaga #{indice}).")
+
+        inicio_conversao = time.monotonic()
+        try:
+            yield indice
+        finally:
+            with self._cond:
+                self.duracao_total += time.monotonic() - inicio_conversao
+                self.concluidas += 1
+                self.em_execucao -= 1
+                self._livres.append(indice)
+                self._cond.notify()
+
+    def estatisticas(self):
+        """Profundidade da fila e tempos de espera/conversão, para ajuste de vagas e fila."""
+        with self._cond:
+            return {
+                "vagas": self.vagas,
+                "fila_max": self.fila_max,
+                "em_execucao": self.em_execucao,
+                "na_fila": self.na_fila,
+                "concluidas": self.concluidas,
+                "recusadas": self.recusadas,
+                "espera_media_s": round(self.espera_total / self.concluidas, 3) if self.concluidas else 0.0,
+                "espera_maxima_s": round(self.espera_maxima, 3),
+                "duracao_media_s": round(self.duracao_total / self.concluidas, 3) if self.concluidas else 0.0,
+            }
+
+
+class InstanciaLibreOffice:
+    """Um soffice headless de longa duração + o processo ponte_uno.py que conversa com ele.
+
+    Cada instância tem seu próprio perfil de usuário (-env:UserInstallation) e escuta
+    conversões via UNO em um pipe nomeado exclusivo.
+    """
+
+    def __init__(self, indice):
+        self.indice = indice
+        self.nome = _nome_vaga(indice)
+        self.perfil_dir = _perfil_vaga(indice)
+        self.soffice = None
+        self.ponte = None
+        self.jobs = 0
+        self.falhas_inicio = 0 # Partidas seguidas que falharam (zera quando uma sobe)
+        self._proxima_tentativa = 0.0
+
+    def ativa(self):
+        return (self.soffice is not None and self.soffice.poll() is None
+                and self.ponte is not None and self.ponte.poll() is None)
+
+    def iniciar(self):
+        logging.info(f"{log_prefix} Iniciando instância LibreOffice #{self.indice} (perfil: {self.perfil_dir})")
+        os.makedirs(self.perfil_dir, exist_ok=True)
+        perfil_url = "file://" + os.path.abspath(self.perfil_dir)
+        try:
+            self.soffice = subprocess.Popen(
+                [SOFFICE_BIN, '--headless', '--invisible', '--nologo', '--norestore',
+                 '--nodefault', '--nolockcheck', f'-env:UserInstallation={perfil_url}',
+                 f'--accept=pipe,name={self.nome};urp;StarOffice.ComponentContext'],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+        except FileNotFoundError as e:
+            raise PoolIndisponivel(f"soffice não encontrado ({SOFFICE_BIN})") from e
+        try:
+            self.ponte = subprocess.Popen(
+                [UNO_PYTHON, PONTE_UNO, '--pipe', self.nome, '--timeout-conexao', str(TIMEOUT_INICIO)],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1,
+            )
+        except OSError as e:
+            self.encerrar() # Não deixa o soffice órfão se o Python da ponte não existir
+            if isinstance(e, FileNotFoundError):
+                raise PoolIndisponivel(f"Python da ponte UNO não encontrado ({UNO_PYTHON})") from e
+            raise
+        self.jobs = 0
+        try:
+            resposta = self._ler_resposta(TIMEOUT_INICIO + 5)
+        except ValueError:
+            resposta = None # Linha truncada/ilegível: conta como não pronta
+        if not resposta or not resposta.get("pronto"):
+            self.encerrar()
+            if resposta and resposta.get("fatal"):
+                raise PoolIndisponivel(resposta.get("erro"))
+            raise RuntimeError(f"Instância LibreOffice #{self.indice} não ficou pronta: {resposta}")
+        logging.info(f"{log_prefix} Instância LibreOffice #{self.indice} pronta.")
+
+    def garantir(self):
+        """Sobe (ou reinicia) a instância se não estiver no ar.
+
+        Uma partida que falha deixa a instância em espera (ESPERA_REINICIO_BASE dobrando até
+        ESPERA_REINICIO_MAX); até lá, levanta RuntimeError na hora e a conversão vai para o avulso.
+        PoolIndisponivel (sem soffice ou python3-uno) sobe direto, sem espera: não é passageiro.
+        """
+        if self.ativa():
+            return
+        if self.soffice is not None:
+            logging.warning(f"{log_prefix} Instância LibreOffice #{self.indice} caiu. Reiniciando...")
+        self.encerrar()
+        espera = self._proxima_tentativa - time.monotonic()
+        if espera > 0:
+            raise RuntimeError(f"Instância LibreOffice #{self.indice} aguardando {espera:.0f}s para tentar subir de novo")
+        try:
+            self.iniciar()
+        except PoolIndisponivel:
+            raise
+        except (OSError, RuntimeError):
+            self.falhas_inicio += 1
+            atraso = min(ESPERA_REINICIO_MAX, ESPERA_REINICIO_BASE * 2 ** (self.falhas_inicio - 1))
+            self._proxima_tentativa = time.monotonic() + atraso
+            logging.warning(f"{log_prefix} Instância LibreOffice #{self.indice} não subiu ({self.falhas_inicio}ª falha seguida). "
+                            f"Nova tentativa em {atraso:.0f}s.")
+            raise
+        self.falhas_inicio = 0
+
+    def _ler_resposta(self, timeout):
+        """Lê uma linha JSON da ponte, respeitando o timeout. Retorna None em timeout/EOF; ValueError se a linha vier ilegível."""
+        prontos, _, _ = select.select([self.ponte.stdout], [], [], timeout)
+        if not prontos:
+            return None
+        linha = self.ponte.stdout.readline()
+        if not linha:
+            return None
+        return json.loads(linha)
+
+    def _executar(self, job):
+        """Envia um job à ponte. Retorna a resposta se ok, senão None; reinicia a instância se travar ou morrer."""
+        self.garantir()
+
+        try:
+            self.ponte.stdin.write(json.dumps(job) + "\n")
+            self.ponte.stdin.flush()
+            resposta = self._ler_resposta(TIMEOUT_CONVERSAO)
+        except (OSError, ValueError) as e:
+            # Ponte morreu no meio (BrokenPipeError) ou respondeu lixo: recicla só esta instância
+            logging.error(f"{log_prefix} Instância #{self.indice} falhou na comunicação com a ponte ({e}). Encerrando-a.")
+            contar("conversoes_total", modo="pool", resultado="falha")
+            self.encerrar()
+            return None
+        self.jobs += 1
+
+        if resposta is None:
+            logging.error(f"{log_prefix} Instância #{self.indice} não respondeu em {TIMEOUT_CONVERSAO}s. Encerrando-a.")
+            contar("conversoes_total", modo="pool", resultado="timeout")
+            self.encerrar()
+            return None
+        if not resposta.get("ok"):
+            logging.error(f"{log_prefix} Instância #{self.indice} falhou ao converter: {resposta.get('erro')}")
+            contar("conversoes_total", modo="pool", resultado="falha")
+            if resposta.get("fatal"):
+                self.encerrar()
+            return None
+        contar("conversoes_total", modo="pool", resultado="sucesso")
+
+        if self.jobs >= POOL_MAX_JOBS:
+            logging.info(f"{log_prefix} Instância #{self.indice} atingiu {self.jobs} conversões. Reciclando.")
+            self.encerrar()
+        return resposta
+
+    def converter(self, pptx_path, pdf_path):
+        """Converte arquivo -> arquivo. Retorna True/False."""
+        job = {"entrada": os.path.abspath(pptx_path), "saida": os.path.abspath(pdf_path)}
+        return self._executar(job) is not None
+
+    def converter_bytes(self, pptx_bytes):
+        """Converte em memória (streams UNO na ponte). Retorna os bytes do PDF ou None."""
+        resposta = self._executar({"pptx_b64": base64.b64encode(pptx_bytes).decode("ascii")})
+        if resposta is None:
+            return None
+        return base64.b64decode(resposta["pdf_b64"])
+
+    def encerrar(self):
+        for proc in (self.ponte, self.soffice):
+            if proc is not None and proc.poll() is None:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+        self.ponte = None
+        self.soffice = None
+
+
+class PoolLibreOffice:
+    """Pool de InstanciaLibreOffice, uma por vaga do agendador. Sobem sob demanda e são reaproveitadas.
+
+    O acesso exclusivo a cada instância é garantido pelo AgendadorConversao (vaga = índice).
+    """
+
+    def __init__(self, tamanho):
+        self.tamanho = tamanho
+        self.instancias = [InstanciaLibreOffice(i) for i in range(tamanho)]
+
+    def converter(self, vaga, pptx_path, pdf_path):
+        return self.instancias[vaga].converter(pptx_path, pdf_path)
+
+    def converter_bytes(self, vaga, pptx_bytes):
+        return self.instancias[vaga].converter_bytes(pptx_bytes)
+
+    def aquecer(self, vaga):
+        """Sobe a instância da vaga agora, se ainda não estiver no ar (levanta OSError/RuntimeError se não subir)."""
+        self.instancias[vaga].garantir()
+
+    def encerrar(self):
+        for inst in self.instancias:
+            inst.encerrar()
+            shutil.rmtree(inst.perfil_dir, ignore_errors=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_indisponivel = False # Vira True com PoolIndisponivel (sem soffice ou python3-uno); falhas passageiras não
+_agendador = None
+
+
+def obter_pool():
+    """Retorna o pool do processo atual (criado na primeira chamada) ou None se desativado."""
+    global _pool
+    if POOL_TAMANHO <= 0 or _pool_indisponivel:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = PoolLibreOffice(VAGAS_CONVERSAO)
+            atexit.register(_pool.encerrar)
+    return _pool
+
+
+def encerrar_conversao():
+    """Encerra as instâncias do pool deste processo. Para processos filhos do multiprocessing,
+    que saem sem rodar o atexit (o soffice ficaria órfão)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.encerrar()
+    else:
+        _remover_perfis_avulsos()
+
+
+def _remover_perfis_avulsos():
+    for indice in range(VAGAS_CONVERSAO):
+        shutil.rmtree(_perfil_vaga(indice), ignore_errors=True)
+
+
+def obter_agendador():
+    """Agendador de conversões do processo atual (criado na primeira chamada)."""
+    global _agendador
+    if _agendador is None:
+        with _pool_lock:
+            if _agendador is None:
+                _agendador = AgendadorConversao(VAGAS_CONVERSAO, FILA_MAX, ESPERA_MAX)
+                atexit.register(_remover_perfis_avulsos)
+                logging.info(f"{log_prefix} Agendador de conversões: {VAGAS_CONVERSAO} vaga(s), fila máxima {FILA_MAX}, "
+                             f"espera máxima {ESPERA_MAX}s.")
+    return _agendador
+
+
+def aquecer_conversao():
+    """Sobe uma instância do pool já (na subida do worker), para a primeira cotação não pagar a partida do
+    LibreOffice. Retorna True se a instância ficou pronta; False se o pool estiver desativado/indisponível
+    (as conversões usam o subprocesso avulso)."""
+    global _pool_indisponivel
+    with obter_agendador().vaga() as vaga:
+        pool = obter_pool()
+        if pool is None:
+            return False
+        try:
+            pool.aquecer(vaga)
+            return True
+        except PoolIndisponivel as e:
+            logging.error(f"{log_prefix} Pool de LibreOffice indisponível ({e}). Usando conversão avulsa daqui em diante.")
+            _pool_indisponivel = True
+            return False
+        except (OSError, RuntimeError) as e:
+            logging.error(f"{log_prefix} Instância do pool não subiu ({e}). Ela será reiniciada na próxima conversão.")
+            return False
+
+
+def estatisticas_conversao():
+    """Estado do agendador (vagas, fila, tempos) do processo atual."""
+    return obter_agendador().estatisticas()
+
+
 def converter_pptx_para_pdf(pptx_path, output_dir): # Alterado para receber output_dir
     """Converte um arquivo PowerPoint para PDF usando LibreOffice.
     Salva o PDF no diretório especificado com o mesmo nome base do PPTX.
 
+    Usa o pool de instâncias persistentes quando disponível; se o pool não puder
+    ser usado, cai para um processo 'libreoffice --convert-to' por conversão.
+
     Args:
         pptx_path (str): Caminho para o arquivo PowerPoint de entrada (.pptx).
         output_dir (str): Caminho para o diretório onde o PDF será salvo.
@@ -22,6 +454,7 @@ def converter_pptx_para_pdf(pptx_path, output_dir): # Alterado para receber outp
         str or None: O caminho completo para o arquivo PDF gerado em caso de sucesso, 
                      None caso contrário.
     """
+    global _pool_indisponivel
     logging.info(f"{log_prefix} Iniciando conversão de '{pptx_path}' para PDF em '{output_dir}'")
 
     # Verificar se o arquivo de entrada existe
@@ -36,8 +469,77 @@ def converter_pptx_para_pdf(pptx_path, output_dir): # Alterado para receber outp
          # os.makedirs(output_dir, exist_ok=True) 
          return None
 
+    base_name_without_ext = os.path.splitext(os.path.basename(pptx_path))[0]
+    expected_pdf_path = os.path.join(output_dir, f"{base_name_without_ext}.pdf")
+
+    # ConversaoSaturada (sem vaga e fila cheia) sobe para quem chamou responder 503
+    with obter_agendador().vaga() as vaga:
+        pool = obter_pool()
+        if pool is not None:
+            try:
+                if pool.converter(vaga, pptx_path, expected_pdf_path) and os.path.exists(expected_pdf_path):
+                    logging.info(f"{log_prefix} PDF criado com sucesso (pool): {expected_pdf_path}")
+                    return expected_pdf_path
+                logging.error(f"{log_prefix} Pool não gerou o PDF. Tentando conversão avulsa.")
+            except PoolIndisponivel as e:
+                # Sem soffice/python3-uno: desliga o pool neste processo
+                logging.error(f"{log_prefix} Pool de LibreOffice indisponível ({e}). Usando conversão avulsa daqui em diante.")
+                _pool_indisponivel = True
+            except (OSError, RuntimeError) as e:
+                # Instância fora do ar (caiu, não subiu, em espera): só esta conversão vai para o avulso
+                logging.error(f"{log_prefix} Instância #{vaga} do pool indisponível ({e}). Conversão avulsa para esta cotação.")
+
+        return _converter_subprocess(pptx_path, output_dir, _perfil_vaga(vaga))
+
+
+def converter_pptx_bytes_para_pdf(pptx_bytes):
+    """Converte um .pptx em memória para PDF, sem gravar nada no diretório de saída.
+
+    Com o pool, o conteúdo vai e volta pela ponte UNO (streams em memória). Sem o pool,
+    a conversão avulsa usa um diretório temporário em tmpfs (/dev/shm), apagado em seguida.
+
+    Args:
+        pptx_bytes (bytes): Conteúdo do arquivo PowerPoint (.pptx).
 
-    # Construir o comando do LibreOffice
+    Returns:
+        bytes or None: Conteúdo do PDF em caso de sucesso, None caso contrário.
+    """
+    global _pool_indisponivel
+    logging.info(f"{log_prefix} Iniciando conversão em memória ({len(pptx_bytes)} bytes de PPTX)")
+
+    # ConversaoSaturada (sem vaga e fila cheia) sobe para quem chamou responder 503
+    with obter_agendador().vaga() as vaga:
+        pool = obter_pool()
+        if pool is not None:
+            try:
+                pdf_bytes = pool.converter_bytes(vaga, pptx_bytes)
+                if pdf_bytes:
+                    logging.info(f"{log_prefix} PDF gerado em memória (pool): {len(pdf_bytes)} bytes")
+                    return pdf_bytes
+                logging.error(f"{log_prefix} Pool não gerou o PDF. Tentando conversão avulsa.")
+            except PoolIndisponivel as e:
+                logging.error(f"{log_prefix} Pool de LibreOffice indisponível ({e}). Usando conversão avulsa daqui em diante.")
+                _pool_indisponivel = True
+            except (OSError, RuntimeError) as e:
+                logging.error(f"{log_prefix} Instância #{vaga} do pool indisponível ({e}). Conversão avulsa para esta cotação.")
+
+        temp_dir = tempfile.mkdtemp(prefix="cotacao_", dir=TEMP_DIR)
+        try:
+            pptx_path = os.path.join(temp_dir, "cotacao.pptx")
+            with open(pptx_path, "wb") as f:
+                f.write(pptx_bytes)
+            pdf_path = _converter_subprocess(pptx_path, temp_dir, _perfil_vaga(vaga))
+            if pdf_path is None:
+                return None
+            with open(pdf_path, "rb") as f:
+                return f.read()
+        finally:
+            with medir("limpeza"):
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def comando_conversao_avulsa(pptx_path, output_dir, perfil_dir=None):
+    """Linha de comando do 'libreoffice --convert-to pdf' (PDF em output_dir, com o nome do .pptx)."""
     # Assume que 'libreoffice' está no PATH dentro do container Docker
     cmd = [
         'libreoffice',
@@ -46,7 +548,18 @@ def converter_pptx_para_pdf(pptx_path, output_dir): # Alterado para receber outp
         '--outdir', output_dir, # Diretório onde salvar o PDF
         pptx_path             # Arquivo de entrada
     ]
+    if perfil_dir is not None:
+        cmd.insert(1, f'-env:UserInstallation=file://{os.path.abspath(perfil_dir)}')
+    return cmd
+
+
+def _converter_subprocess(pptx_path, output_dir, perfil_dir=None):
+    """Conversão avulsa: sobe um 'libreoffice --headless --convert-to pdf' só para este arquivo.
 
+    perfil_dir: perfil de usuário exclusivo (um por vaga), para conversões simultâneas
+    não disputarem o lock do perfil padrão.
+    """
+    cmd = comando_conversao_avulsa(pptx_path, output_dir, perfil_dir)
     logging.info(f"{log_prefix} Executando comando: {' '.join(cmd)}")
     pdf_gerado_path = None # Inicializa como None
 
@@ -90,6 +603,8 @@ def converter_pptx_para_pdf(pptx_path, output_dir): # Alterado para receber outp
 
     except subprocess.TimeoutExpired:
          logging.error(f"{log_prefix} Comando LibreOffice excedeu o timeout de 120 segundos.")
+         contar("conversoes_total", modo="avulsa", resultado="timeout")
+         return None
     except FileNotFoundError:
          # Isso aconteceria se o comando 'libreoffice' não fosse encontrado no sistema
          logging.error(f"{log_prefix} ERRO CRÍTICO: Comando 'libreoffice' não encontrado. Verifique a instalação no Dockerfile.")
@@ -99,6 +614,7 @@ def converter_pptx_para_pdf(pptx_path, output_dir): # Alterado para receber outp
 
     # Retorna o caminho do PDF se foi gerado, senão None
     logging.info(f"{log_prefix} Retornando caminho do PDF: {pdf_gerado_path}")
+    contar("conversoes_total", modo="avulsa", resultado="sucesso" if pdf_gerado_path else "falha")
     return pdf_gerado_path
 
 
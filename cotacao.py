@@ -0,0 +1,295 @@
+# ----- INÍCIO DO CÓDIGO PARA cotacao.py -----
+# Linha de comando das tarefas "offline" do gerador de cotações.
+# Uso:
+#   python -m cotacao compile-table "input_files/Tabela 2023.xlsx"   (roda no build/deploy)
+#   python -m cotacao validate-table "input_files/Tabela 2023.xlsx"
+#   python -m cotacao compile-native input_files/cotacao_auto.pptx  (fundos do motor de PDF nativo)
+#   python -m cotacao diff-visual input_files/cotacao_auto.pptx      (motor nativo x LibreOffice)
+#   python -m cotacao batch associados.csv --out renovacoes/ --workers 4  (cotações em massa, retomável)
+#   python -m cotacao bench -o baseline.json                         (benchmarks com dados sintéticos)
+#   python -m cotacao bench-compare baseline.json novo.json          (falha se algo ficou mais lento)
+#   python -m cotacao import-budget                                  (falha se o worker ficou pesado)
+import sys
+import os
+import json
+import argparse
+import time
+import logging
+
+from calculo_precos import PriceTable, caminho_artefato
+
+
+def _imprimir_validacao(erros, avisos):
+    for aviso in avisos:
+        print(f"  AVISO: {aviso}")
+    for erro in erros:
+        print(f"  ERRO: {erro}")
+
+
+def cmd_compile_table(args):
+    """Compila a planilha de preços em um artefato .npz carregado pelos workers em milissegundos."""
+    saida = args.saida or caminho_artefato(args.tabela)
+    inicio = time.perf_counter()
+    tabela = PriceTable(args.tabela, usar_artefato=False) # Sempre do Excel: o artefato antigo pode estar velho
+    print(f"Tabela '{args.tabela}' compilada em {time.perf_counter() - inicio:.2f}s "
+          f"({tabela.n_linhas} linhas, {len(tabela.faixa_min)} faixas).")
+
+    erros, avisos = tabela.validar()
+    _imprimir_validacao(erros, avisos)
+    if erros or (args.estrito and avisos):
+        print(f"Validação falhou ({len(erros)} erro(s), {len(avisos)} aviso(s)). Artefato NÃO gravado.")
+        return 1
+
+    # Grava em arquivo temporário e renomeia: workers nunca leem um artefato pela metade
+    temporario = f"{saida}.tmp.{os.getpid()}"
+    tabela.salvar_artefato(temporario)
+    os.replace(temporario, saida)
+    print(f"Artefato gravado em '{saida}' ({os.path.getsize(saida)} bytes).")
+    return 0
+
+
+def cmd_validate_table(args):
+    """Valida uma planilha (.xlsx) ou um artefato (.npz) sem gravar nada."""
+    tabela = PriceTable(args.tabela, usar_artefato=False)
+    erros, avisos = tabela.validar()
+    _imprimir_validacao(erros, avisos)
+    print(f"{len(erros)} erro(s), {len(avisos)} aviso(s).")
+    return 1 if erros or (args.estrito and avisos) else 0
+
+
+# Cotação de exemplo para o diff-visual (textos longos e acentos de propósito)
+DADOS_EXEMPLO = {
+    "nome_cliente": "Maria Conceição de Araújo Gonçalves", "placa": "ABC-1D23", "marca": "VOLKSWAGEN",
+    "modelo": "Virtus Highline 1.0 TSI", "ano": 2022, "valor_fipe": 98765.43, "categoria": "PASSEIO",
+    "precos": {"Adesão": 450.0, "Plano Ouro": 213.3, "Diamante": 237.2, "Platinum": 289.7, "Pesados": 298.0,
+               "valor_excedente": 0.0, "percentual_adicional": 0.0, "sujeito_aprovacao": False},
+}
+
+
+def cmd_compile_native(args):
+    """Gera o artefato do motor de PDF nativo (fundos rasterizados + posição dos campos)."""
+    from pdf_nativo import compilar_fundo_nativo
+    inicio = time.perf_counter()
+    saida = compilar_fundo_nativo(args.template, args.saida, args.dpi)
+    print(f"Artefato nativo gravado em '{saida}' ({os.path.getsize(saida)} bytes) "
+          f"em {time.perf_counter() - inicio:.1f}s.")
+    return 0
+
+
+def cmd_diff_visual(args):
+    """Renderiza a mesma cotação pelos dois motores e compara as páginas rasterizadas."""
+    from gera_pdf import gerar_pdf_cotacao
+    from pdf_nativo import renderizar_pdf_nativo, comparar_visual
+
+    dados = DADOS_EXEMPLO
+    if args.dados:
+        with open(args.dados, encoding="utf-8") as f:
+            dados = json.load(f)
+
+    inicio = time.perf_counter()
+    pdf_nativo = renderizar_pdf_nativo(args.template, dados)
+    tempo_nativo = time.perf_counter() - inicio
+    if pdf_nativo is None:
+        print("Motor nativo não gerou o PDF (artefato ausente ou texto não suportado).")
+        return 1
+    inicio = time.perf_counter()
+    pdf_referencia = gerar_pdf_cotacao(args.template, dados, motor="libreoffice")
+    tempo_referencia = time.perf_counter() - inicio
+    if pdf_referencia is None:
+        print("LibreOffice não gerou o PDF de referência.")
+        return 1
+    print(f"Nativo: {tempo_nativo * 1000:.1f} ms | LibreOffice: {tempo_referencia * 1000:.0f} ms")
+
+    falhou = False
+    for pagina in comparar_visual(pdf_referencia, pdf_nativo, args.dpi, saida_dir=args.saida):
+        acima = pagina["pixels_diferentes"] > args.max_diferenca
+        falhou = falhou or acima
+        print(f"  Página {pagina['pagina']}: {pagina['pixels_diferentes']:.2%} pixels diferentes "
+              f"(média {pagina['diferenca_media']:.1f}){'  <-- ACIMA DO LIMITE' if acima else ''}")
+    if args.saida:
+        print(f"Imagens de diferença em '{args.saida}'.")
+    return 1 if falhou else 0
+
+
+def cmd_batch(args):
+    """Gera um PDF por linha da planilha, em processos paralelos, retomando de onde parou."""
+    from lote_cotacao import ErroLote
+    from lote_offline import gerar_lote_offline, ARQUIVO_MANIFESTO
+    from registro_tabelas import obter_registro
+    from calculo_precos import obter_tabela
+    from converte_pdf import VAGAS_CONVERSAO
+    from gera_pdf import MOTORES_PDF
+    from preenche_cotacao import obter_template
+
+    if args.motor and args.motor not in MOTORES_PDF:
+        print(f"ERRO: motor desconhecido '{args.motor}'. Use um de: {', '.join(MOTORES_PDF)}.")
+        return 2
+    if not os.path.isfile(args.template):
+        print(f"ERRO: template não encontrado: '{args.template}'. Informe o .pptx com --template.")
+        return 2
+    try:
+        obter_template(args.template) # Carregado aqui, antes do fork dos filhos
+    except Exception as e:
+        print(f"ERRO: template inválido '{args.template}': {e}")
+        return 2
+    if args.tabela:
+        tabela = obter_tabela(args.tabela)
+    else:
+        tabela = obter_registro(args.tabelas_dir, vigiar=False).tabela_ativa() # A vigente hoje, como no app
+    try:
+        resumo = gerar_lote_offline(args.planilha, args.out, tabela, args.template,
+                                    workers=args.workers or VAGAS_CONVERSAO, motor=args.motor)
+    except ErroLote as e:
+        print(f"ERRO: {e}")
+        return 2
+    except KeyboardInterrupt:
+        print("Interrompido. Rode o mesmo comando para continuar de onde parou.")
+        return 130
+    print(f"{resumo['total']} linha(s): {resumo['gerados']} PDF(s) gerados agora, {resumo['retomados']} já existiam, "
+          f"{len(resumo['erros'])} com erro. {resumo['duracao_s']:.1f}s no total"
+          + (f", {resumo['cotacoes_por_min']:.0f} cotações/min." if resumo["cotacoes_por_min"] else "."))
+    for erro in resumo["erros"][:20]:
+        print(f"  Linha {erro['linha']} ({erro.get('placa') or '?'}): {erro.get('erro')}")
+    if len(resumo["erros"]) > 20:
+        print(f"  ... e mais {len(resumo['erros']) - 20}.")
+    print(f"Manifesto em '{os.path.join(args.out, ARQUIVO_MANIFESTO)}'.")
+    return 1 if resumo["erros"] else 0
+
+
+def cmd_bench(args):
+    """Roda os benchmarks com tabela e template sintéticos e, com -o, grava o JSON de baseline."""
+    from benchmark import executar_benchmarks, imprimir_resultados
+
+    if args.rapido:
+        parametros = dict(n_precos=2000, n_preenchimento=30, n_conversao=3, concorrencias=(1, 4), requisicoes=12)
+    else:
+        parametros = dict(n_precos=args.n_precos, n_preenchimento=args.n_preenchimento, n_conversao=args.n_conversao,
+                          concorrencias=tuple(args.concorrencia), requisicoes=args.requisicoes)
+    dados = executar_benchmarks(suites=tuple(args.suites), **parametros)
+    print(f"Benchmarks concluídos em {dados['duracao_s']:.1f}s (commit {dados['ambiente']['commit'] or '?'}):")
+    imprimir_resultados(dados)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(dados, f, ensure_ascii=False, indent=2)
+        print(f"Resultados gravados em '{args.saida}'.")
+    return 0
+
+
+def cmd_bench_compare(args):
+    """Compara dois JSON do 'bench'; código de saída 1 se alguma latência piorou além do limite."""
+    from benchmark import comparar
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.novo, encoding="utf-8") as f:
+        novo = json.load(f)
+    linhas = comparar(base, novo, args.limite)
+    if not linhas:
+        print("Nenhum benchmark em comum entre os dois arquivos.")
+        return 1
+    for nome, metrica, antes, depois, variacao, regrediu in linhas:
+        marca = "  <-- REGRESSÃO" if regrediu else ""
+        if metrica == "taxa_sucesso":
+            print(f"  {nome:32s} {metrica:13s} {antes:10.2%} -> {depois:10.2%}{marca}")
+        else:
+            print(f"  {nome:32s} {metrica:13s} {antes:10.3f} -> {depois:10.3f} ms ({variacao:+.1%}){marca}")
+    regressoes = sum(1 for linha in linhas if linha[-1])
+    print(f"{regressoes} regressão(ões) acima de {args.limite:.0%}." if regressoes else "Sem regressões.")
+    return 1 if regressoes else 0
+
+
+def cmd_import_budget(args):
+    """Tempo de import e RSS de um worker recém-criado; código de saída 1 se passar do orçamento."""
+    from benchmark import medir_importacao
+
+    medida = medir_importacao(args.modulo)
+    print(f"import {args.modulo}: {medida['duracao_ms']:.1f} ms, RSS {medida['rss_mb']:.1f} MB")
+    for nome, ms in medida["maiores"]:
+        print(f"  {nome:32s} {ms:9.1f} ms")
+    problemas = []
+    if medida["duracao_ms"] > args.max_ms:
+        problemas.append(f"import levou {medida['duracao_ms']:.1f} ms (máximo {args.max_ms:.0f} ms)")
+    if medida["rss_mb"] > args.max_rss_mb:
+        problemas.append(f"RSS de {medida['rss_mb']:.1f} MB (máximo {args.max_rss_mb:.0f} MB)")
+    if medida["sob_demanda_carregados"]:
+        problemas.append(f"módulos que deveriam ser carregados sob demanda: {', '.join(medida['sob_demanda_carregados'])}")
+    for problema in problemas:
+        print(f"  ACIMA DO ORÇAMENTO: {problema}")
+    if not problemas:
+        print("Dentro do orçamento.")
+    return 1 if problemas else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m cotacao", description="Ferramentas do gerador de cotações Bravax")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("compile-table", help="Compila a tabela de preços (.xlsx) em um artefato binário (.npz)")
+    p.add_argument("tabela", help="Caminho da planilha, ex: 'input_files/Tabela 2023.xlsx'")
+    p.add_argument("-o", "--saida", help="Arquivo .npz de saída (padrão: mesmo nome da planilha)")
+    p.add_argument("--estrito", action="store_true", help="Falha também em avisos de validação")
+    p.set_defaults(func=cmd_compile_table)
+
+    p = sub.add_parser("validate-table", help="Valida faixas (lacunas/sobreposições) e preços (NaN) da tabela")
+    p.add_argument("tabela", help="Planilha .xlsx ou artefato .npz")
+    p.add_argument("--estrito", action="store_true", help="Falha também em avisos de validação")
+    p.set_defaults(func=cmd_validate_table)
+
+    p = sub.add_parser("compile-native", help="Gera os fundos e o layout do motor de PDF nativo (precisa de LibreOffice e pdftoppm)")
+    p.add_argument("template", help="Template .pptx, ex: input_files/cotacao_auto.pptx")
+    p.add_argument("-o", "--saida", help="Arquivo de saída (padrão: <template>.nativo.npz)")
+    p.add_argument("--dpi", type=int, default=150, help="Resolução dos fundos rasterizados")
+    p.set_defaults(func=cmd_compile_native)
+
+    p = sub.add_parser("diff-visual", help="Compara o PDF do motor nativo com o do LibreOffice")
+    p.add_argument("template", help="Template .pptx (o artefato nativo deve ter sido compilado)")
+    p.add_argument("--dados", help="JSON com os dados da cotação (padrão: cotação de exemplo)")
+    p.add_argument("--dpi", type=int, default=50, help="Resolução da comparação")
+    p.add_argument("--max-diferenca", type=float, default=0.02, help="Fração máxima de pixels diferentes por página")
+    p.add_argument("--saida", help="Diretório para gravar as imagens de diferença (.pgm)")
+    p.set_defaults(func=cmd_diff_visual)
+
+    p = sub.add_parser("batch", help="Gera as cotações de uma planilha (CSV/XLSX) em PDFs, em paralelo e retomável")
+    p.add_argument("planilha", help="CSV ou XLSX com as colunas nome, placa, marca, modelo, ano, valor_fipe, categoria")
+    p.add_argument("--out", required=True, help="Diretório dos PDFs (também guarda o checkpoint e o manifesto.csv)")
+    p.add_argument("--workers", type=int, help="Processos de geração, cada um com o seu LibreOffice (padrão: LIBREOFFICE_VAGAS)")
+    p.add_argument("--template", default=os.path.join("input_files", "cotacao_auto.pptx"), help="Template .pptx")
+    p.add_argument("--tabelas-dir", default="input_files", help="Diretório das tabelas 'Tabela <data>.xlsx' (usa a vigente)")
+    p.add_argument("--tabela", help="Planilha de preços específica (em vez da vigente em --tabelas-dir)")
+    p.add_argument("--motor", help="Motor de PDF: libreoffice, nativo ou sobreposicao (padrão: MOTOR_PDF)")
+    p.set_defaults(func=cmd_batch)
+
+    p = sub.add_parser("bench", help="Benchmarks reproduzíveis (preços, preenchimento, conversão, ponta a ponta)")
+    p.add_argument("-o", "--saida", help="Arquivo JSON para gravar os resultados (baseline)")
+    p.add_argument("--suites", nargs="+", default=["precos", "preenchimento", "conversao", "ponta_a_ponta"],
+                   choices=["precos", "preenchimento", "conversao", "ponta_a_ponta"], help="Suítes a rodar")
+    p.add_argument("--n-precos", type=int, default=20000, help="Cálculos de preço medidos")
+    p.add_argument("--n-preenchimento", type=int, default=200, help="Preenchimentos de PPTX medidos (por modo)")
+    p.add_argument("--n-conversao", type=int, default=10, help="Conversões pelo LibreOffice medidas")
+    p.add_argument("--concorrencia", type=int, nargs="+", default=[1, 2, 4, 8], help="Requisições simultâneas no ponta a ponta")
+    p.add_argument("--requisicoes", type=int, default=48, help="Cotações por nível de concorrência")
+    p.add_argument("--rapido", action="store_true", help="Poucas iterações (verificação rápida, não para baseline)")
+    p.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser("bench-compare", help="Compara dois resultados do 'bench' e aponta regressões")
+    p.add_argument("base", help="JSON de referência (baseline)")
+    p.add_argument("novo", help="JSON da execução nova")
+    p.add_argument("--limite", type=float, default=0.10, help="Piora máxima tolerada (0.10 = 10%%)")
+    p.set_defaults(func=cmd_bench_compare)
+
+    p = sub.add_parser("import-budget", help="Mede tempo de import (-X importtime) e RSS de um worker e confere o orçamento")
+    p.add_argument("--modulo", default="app", help="Módulo importado pelo worker (padrão: app)")
+    p.add_argument("--max-ms", type=float, default=400, help="Tempo máximo de import em ms")
+    p.add_argument("--max-rss-mb", type=float, default=64, help="RSS máximo do processo depois do import, em MB")
+    p.set_defaults(func=cmd_import_budget)
+
+    args = parser.parse_args(argv)
+    # Mensagens dos módulos (ex: "[calculo_precos] Tabela compilada...") no terminal, sem timestamp
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# ----- FIM DO CÓDIGO -----
@@ -0,0 +1,390 @@
+# ----- INÍCIO DO CÓDIGO PARA fipe.py -----
+# Tabela FIPE de referência local, para o formulário preencher marca, modelo, ano e valor FIPE
+# sem o vendedor digitar nem consultar outra aba:
+#   GET /api/fipe/busca?q=gol trend 2015[&ano=2015][&limite=10]
+#
+# O arquivo (FIPE_ARQUIVO, padrão input_files/fipe.csv; também .parquet, com pyarrow instalado)
+# tem uma linha por marca/modelo/ano, com as colunas marca, modelo, ano e valor (ou valor_fipe).
+# Ele é lido uma vez por processo (no master, com --preload) e guardado em colunas NumPy,
+# dividido em blocos por marca. Cada bloco tem:
+#   - as linhas ordenadas por modelo e ano (mais novo primeiro): arrays de ano e valor, mais o
+#     início das linhas de cada modelo;
+#   - um índice de prefixos: as palavras normalizadas (minúsculas, sem acento) em ordem, cada uma
+#     com os modelos em que aparece ("gol tr" acha "GOL TREND 1.0 Flex");
+#   - um índice de trigramas de "marca modelo", usado só quando nada casa pelos prefixos (erros de
+#     digitação: "corola" acha "COROLLA").
+# Quando o arquivo muda, só os blocos das marcas cujas linhas mudaram são reconstruídos, em
+# segundo plano; a troca do índice é atômica, como a das tabelas de preços.
+import os
+import io
+import re
+import csv
+import time
+import bisect
+import hashlib
+import logging
+import threading
+import unicodedata
+
+import numpy as np
+
+log_prefix = "[fipe]"
+
+FIPE_ARQUIVO = os.environ.get("FIPE_ARQUIVO", os.path.join("input_files", "fipe.csv"))
+INTERVALO_VERIFICACAO = float(os.environ.get("FIPE_INTERVALO_VERIFICACAO", "10")) # segundos
+# Fração mínima dos trigramas da consulta presentes no nome para um casamento aproximado entrar no resultado
+SIMILARIDADE_MINIMA = float(os.environ.get("FIPE_SIMILARIDADE_MINIMA", "0.5"))
+LIMITE_PADRAO = 10
+LIMITE_MAXIMO = 50
+MIN_CARACTERES = 2
+ANO_ZERO_KM = 32000 # Convenção da FIPE para veículos 0 km
+
+# Nome normalizado da coluna -> coluna do índice
+COLUNAS_FIPE = {"marca": "marca", "modelo": "modelo", "ano": "ano", "ano_modelo": "ano", "valor": "valor",
+                "valor_fipe": "valor", "preco": "valor", "preco_medio": "valor"}
+
+_VIRGULA_DECIMAL = re.compile(r"(?<=\d),(?=\d)")
+_SEPARADORES = re.compile(r"[^a-z0-9.]+|(?<!\d)\.|\.(?!\d)") # Ponto só fica entre dígitos ("1.0")
+_ANO = re.compile(r"\d{4,5}")
+_VAZIO = np.empty(0, dtype=np.int32)
+
+
+def normalizar(texto):
+    """Minúsculas, sem acentos e só letras/dígitos separados por espaço ("Citroën C4 1,6" -> "citroen c4 1.6")."""
+    texto = unicodedata.normalize("NFKD", str(texto).lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(_SEPARADORES.sub(" ", _VIRGULA_DECIMAL.sub(".", texto)).split())
+
+
+def _trigramas(texto):
+    texto = f" {texto} "
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def _valor(valor):
+    """'R$ 74.442,00', '74442.00' ou número -> float."""
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    texto = str(valor).replace("R$", "").strip()
+    if "," in texto: # Formato brasileiro: ponto de milhar, vírgula decimal
+        texto = texto.replace(".", "").replace(",", ".")
+    return float(texto)
+
+
+def _ano(valor):
+    """2015, '2015', '2015 Gasolina' ou '32000' (0 km) -> int."""
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    m = _ANO.search(str(valor))
+    if not m:
+        raise ValueError(f"ano inválido: {valor!r}")
+    return int(m.group(0))
+
+
+def ler_arquivo(caminho):
+    """Lê o arquivo FIPE. Retorna ({marca: [(modelo, ano, valor)]}, linhas descartadas, sha1 do arquivo)."""
+    with open(caminho, "rb") as f:
+        conteudo = f.read()
+    versao = hashlib.sha1(conteudo).hexdigest()[:12]
+    if caminho.lower().endswith(".parquet"):
+        import pandas as pd # Só para .parquet (precisa de pyarrow ou fastparquet)
+
+        df = pd.read_parquet(io.BytesIO(conteudo))
+        cabecalho = [str(c) for c in df.columns]
+        linhas = df.itertuples(index=False, name=None)
+    else:
+        texto = conteudo.decode("utf-8-sig", errors="replace")
+        try:
+            dialeto = csv.Sniffer().sniff(texto[:4096], delimiters=",;\t")
+        except csv.Error:
+            dialeto = csv.excel
+        leitor = csv.reader(io.StringIO(texto), dialeto)
+        cabecalho = next(leitor, [])
+        linhas = leitor
+
+    posicoes = {}
+    for i, nome in enumerate(cabecalho):
+        coluna = COLUNAS_FIPE.get(normalizar(nome).replace(" ", "_"))
+        if coluna is not None:
+            posicoes.setdefault(coluna, i)
+    faltando = [c for c in ("marca", "modelo", "ano", "valor") if c not in posicoes]
+    if faltando:
+        raise ValueError(f"Colunas ausentes no arquivo FIPE '{caminho}': {', '.join(faltando)}.")
+
+    marcas = {}
+    descartadas = 0
+    for linha in linhas:
+        try:
+            marca = str(linha[posicoes["marca"]]).strip()
+            modelo = str(linha[posicoes["modelo"]]).strip()
+            registro = (modelo, _ano(linha[posicoes["ano"]]), _valor(linha[posicoes["valor"]]))
+        except (IndexError, ValueError, TypeError):
+            descartadas += 1
+            continue
+        if not marca or not modelo or not (0 < registro[1] <= ANO_ZERO_KM) or not registro[2] > 0:
+            descartadas += 1
+            continue
+        marcas.setdefault(marca, []).append(registro)
+    return marcas, descartadas, versao
+
+
+class BlocoMarca:
+    """Linhas de uma marca em colunas NumPy + índices de prefixo e de trigramas dos modelos."""
+
+    def __init__(self, marca, linhas, assinatura):
+        self.marca = marca
+        self.assinatura = assinatura
+        self.palavras_marca = normalizar(marca).split()
+        linhas = sorted(set(linhas), key=lambda l: (l[0], -l[1], l[2]))
+
+        self.modelos = [] # nome original de cada modelo
+        inicio = []
+        for i, (modelo, _, _) in enumerate(linhas):
+            if not self.modelos or self.modelos[-1] != modelo:
+                self.modelos.append(modelo)
+                inicio.append(i)
+        inicio.append(len(linhas))
+        self.inicio = np.array(inicio, dtype=np.int32) # linhas do modelo m: inicio[m]:inicio[m+1]
+        self.anos = np.array([l[1] for l in linhas], dtype=np.int16)
+        self.valores = np.array([l[2] for l in linhas], dtype=np.float64)
+        modelo_da_linha = np.repeat(np.arange(len(self.modelos), dtype=np.int32), np.diff(self.inicio))
+        self.modelos_ano = {int(ano): np.unique(modelo_da_linha[self.anos == ano]) for ano in np.unique(self.anos)}
+
+        marca_norm = normalizar(marca)
+        textos = [normalizar(m) for m in self.modelos]
+        self.comprimentos = np.array([len(marca_norm) + 1 + len(t) for t in textos], dtype=np.int16)
+        self.n_trigramas = np.array([len(_trigramas(f"{marca_norm} {t}")) for t in textos], dtype=np.int16)
+
+        # Prefixos: palavras em ordem; os modelos de palavras[i] são modelos_palavra[inicio_palavra[i]:inicio_palavra[i+1]]
+        pares = sorted({(p, m) for m, t in enumerate(textos) for p in t.split()})
+        self.palavras = []
+        inicio_palavra = []
+        for posicao, (palavra, _) in enumerate(pares):
+            if not self.palavras or self.palavras[-1] != palavra:
+                self.palavras.append(palavra)
+                inicio_palavra.append(posicao)
+        inicio_palavra.append(len(pares))
+        self.inicio_palavra = np.array(inicio_palavra, dtype=np.int32)
+        self.modelos_palavra = np.array([m for _, m in pares], dtype=np.int32)
+
+        # Trigramas: trigrama -> (início, fim) em modelos_trigrama
+        por_trigrama = {}
+        for m, t in enumerate(textos):
+            for trigrama in _trigramas(f"{marca_norm} {t}"):
+                por_trigrama.setdefault(trigrama, []).append(m)
+        self.trigramas = {}
+        modelos_trigrama = []
+        for trigrama, modelos in por_trigrama.items():
+            self.trigramas[trigrama] = (len(modelos_trigrama), len(modelos_trigrama) + len(modelos))
+            modelos_trigrama.extend(modelos)
+        self.modelos_trigrama = np.array(modelos_trigrama, dtype=np.int32)
+
+    def _com_ano(self, candidatos, ano):
+        if ano is None:
+            return candidatos
+        return np.intersect1d(candidatos, self.modelos_ano.get(ano, _VAZIO), assume_unique=True)
+
+    def por_prefixo(self, termos, ano=None):
+        """Modelos em que cada termo é começo de alguma palavra do modelo ou da marca."""
+        candidatos = None
+        for termo in termos:
+            if any(p.startswith(termo) for p in self.palavras_marca):
+                continue
+            lo = bisect.bisect_left(self.palavras, termo)
+            hi = bisect.bisect_left(self.palavras, termo + "\x7f", lo)
+            if lo == hi:
+                return _VAZIO
+            modelos = self.modelos_palavra[self.inicio_palavra[lo]:self.inicio_palavra[hi]]
+            if hi - lo > 1: # Uma palavra só já vem em ordem e sem repetição
+                modelos = np.unique(modelos)
+            candidatos = modelos if candidatos is None else np.intersect1d(candidatos, modelos, assume_unique=True)
+            if not len(candidatos):
+                return _VAZIO
+        if candidatos is None: # Todos os termos são da marca
+            candidatos = np.arange(len(self.modelos), dtype=np.int32)
+        return self._com_ano(candidatos, ano)
+
+    def aproximados(self, trigramas, ano=None):
+        """(modelos, semelhança) dos modelos com pelo menos SIMILARIDADE_MINIMA dos trigramas da consulta.
+
+        Entre nomes com a mesma fração, os mais curtos (mais próximos do que foi digitado) ficam na frente.
+        """
+        faixas = [self.trigramas[t] for t in trigramas if t in self.trigramas]
+        if not faixas:
+            return _VAZIO, np.empty(0)
+        contagem = np.bincount(np.concatenate([self.modelos_trigrama[i:f] for i, f in faixas]),
+                               minlength=len(self.modelos))
+        fracao = contagem / len(trigramas)
+        candidatos = self._com_ano(np.flatnonzero(fracao >= SIMILARIDADE_MINIMA).astype(np.int32), ano)
+        return candidatos, fracao[candidatos] - self.n_trigramas[candidatos] / 10000
+
+    def resultado(self, m, pontuacao, ano=None):
+        linhas = slice(self.inicio[m], self.inicio[m + 1])
+        anos = self.anos[linhas]
+        # Sem ano pedido, o mais novo (0 km primeiro)
+        i = int(np.flatnonzero(anos == ano)[0]) if ano is not None else 0
+        ano_linha = int(anos[i])
+        return {"marca": self.marca, "modelo": self.modelos[m], "ano": ano_linha, "zero_km": ano_linha == ANO_ZERO_KM,
+                "valor_fipe": float(self.valores[linhas][i]), "anos": [int(a) for a in anos],
+                "pontuacao": round(float(pontuacao), 3)}
+
+
+class IndiceFipe:
+    """Uma versão do arquivo FIPE, com um BlocoMarca por marca. Não muda depois de montado."""
+
+    def __init__(self, blocos, versao, descartadas=0):
+        self.blocos = blocos # marca -> BlocoMarca
+        self.versao = versao
+        self.descartadas = descartadas
+        self.n_modelos = sum(len(b.modelos) for b in blocos.values())
+        self.n_linhas = sum(len(b.anos) for b in blocos.values())
+
+    def buscar(self, consulta, ano=None, limite=LIMITE_PADRAO):
+        """Veículos que casam com a consulta, do mais parecido para o menos (um por modelo).
+
+        Um número de 4 dígitos na consulta (ou 0km) é tratado como ano modelo, se 'ano' não vier.
+        Casamentos por prefixo (pontuação entre 1 e 2, nomes mais curtos primeiro) vêm antes dos
+        aproximados por trigramas (pontuação abaixo de 1), que só são procurados se não houver nenhum.
+        """
+        termos = []
+        for termo in normalizar(consulta).split():
+            if termo == "0km":
+                ano = ANO_ZERO_KM if ano is None else ano
+            elif len(termo) == 4 and termo.isdigit() and 1900 <= int(termo) <= 2100:
+                ano = int(termo) if ano is None else ano
+            else:
+                termos.append(termo)
+        if not termos:
+            return []
+
+        tamanho = sum(len(t) for t in termos)
+        candidatos = []
+        for bloco in self.blocos.values():
+            modelos = bloco.por_prefixo(termos, ano)
+            if len(modelos):
+                candidatos.append((bloco, modelos, 1 + np.minimum(tamanho / bloco.comprimentos[modelos], 1)))
+        if not candidatos:
+            trigramas = _trigramas(" ".join(termos))
+            for bloco in self.blocos.values():
+                modelos, semelhanca = bloco.aproximados(trigramas, ano)
+                if len(modelos):
+                    candidatos.append((bloco, modelos, np.minimum(semelhanca, 0.999)))
+
+        melhores = []
+        for bloco, modelos, pontuacoes in candidatos:
+            if len(modelos) > limite: # Só os 'limite' melhores de cada marca disputam o resultado
+                escolhidos = np.argpartition(-pontuacoes, limite)[:limite]
+                modelos, pontuacoes = modelos[escolhidos], pontuacoes[escolhidos]
+            melhores.extend((-float(p), bloco.marca, bloco.modelos[m], bloco, int(m)) for m, p in zip(modelos, pontuacoes))
+        melhores.sort(key=lambda item: item[:3])
+        return [bloco.resultado(m, -p, ano) for p, _, _, bloco, m in melhores[:limite]]
+
+    def estatisticas(self):
+        return {"versao": self.versao, "marcas": len(self.blocos), "modelos": self.n_modelos,
+                "linhas": self.n_linhas, "descartadas": self.descartadas}
+
+
+def montar_indice(caminho, anterior=None):
+    """Lê o arquivo e monta o IndiceFipe, reaproveitando de 'anterior' os blocos das marcas que não mudaram."""
+    inicio = time.perf_counter()
+    marcas, descartadas, versao = ler_arquivo(caminho)
+    blocos = {}
+    reaproveitados = 0
+    for marca, linhas in marcas.items():
+        assinatura = hashlib.sha1(repr(sorted(linhas)).encode("utf-8")).hexdigest()
+        bloco = anterior.blocos.get(marca) if anterior is not None else None
+        if bloco is not None and bloco.assinatura == assinatura:
+            reaproveitados += 1
+        else:
+            bloco = BlocoMarca(marca, linhas, assinatura)
+        blocos[marca] = bloco
+    indice = IndiceFipe(blocos, versao, descartadas)
+    logging.info(f"{log_prefix} Índice FIPE {versao} montado em {time.perf_counter() - inicio:.2f}s: "
+                 f"{len(blocos)} marca(s) ({len(blocos) - reaproveitados} reconstruída(s)), {indice.n_modelos} modelos, "
+                 f"{indice.n_linhas} linhas, {descartadas} descartada(s).")
+    return indice
+
+
+class RegistroFipe:
+    """Índice FIPE vigente de um arquivo. Confere o arquivo no máximo a cada INTERVALO_VERIFICACAO
+    segundos, na própria busca; com um índice já no ar, a reconstrução roda numa thread à parte."""
+
+    def __init__(self, caminho, intervalo=INTERVALO_VERIFICACAO):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self._indice = None
+        self._mtime = None
+        self._proxima_verificacao = 0.0
+        self._lock = threading.Lock()
+
+    def indice(self):
+        """IndiceFipe vigente, ou None se o arquivo não existir ou nunca tiver sido lido com sucesso."""
+        if time.monotonic() >= self._proxima_verificacao:
+            if self._indice is None:
+                self.verificar()
+            elif self._lock.acquire(blocking=False): # Outra thread já está verificando
+                self._lock.release()
+                threading.Thread(target=self.verificar, name="fipe-indice", daemon=True).start()
+        return self._indice
+
+    def verificar(self):
+        """Reconstrói o índice se o arquivo mudou desde a última leitura."""
+        with self._lock:
+            self._proxima_verificacao = time.monotonic() + self.intervalo
+            try:
+                mtime = os.stat(self.caminho).st_mtime_ns
+            except OSError:
+                if self._mtime is not None or self._indice is None:
+                    logging.warning(f"{log_prefix} Arquivo FIPE não encontrado: {self.caminho}. Busca FIPE desligada.")
+                self._indice, self._mtime = None, None
+                return
+            if mtime == self._mtime:
+                return
+            try:
+                self._indice = montar_indice(self.caminho, self._indice)
+            except Exception as e:
+                logging.error(f"{log_prefix} Falha ao ler '{self.caminho}': {e}. Mantendo o índice anterior.")
+            self._mtime = mtime # Arquivo com erro só é lido de novo quando mudar
+
+    def herdar(self, outro):
+        """Reaproveita o índice do processo pai (master com --preload), compartilhado pelo fork."""
+        with outro._lock:
+            self._indice, self._mtime = outro._indice, outro._mtime
+
+
+_registros = {}
+_registros_lock = threading.Lock()
+
+
+def obter_fipe(caminho=FIPE_ARQUIVO):
+    """RegistroFipe do processo atual (o lock não sobrevive ao fork do gunicorn); herda o índice do pai."""
+    caminho = os.path.abspath(caminho)
+    chave = (os.getpid(), caminho)
+    registro = _registros.get(chave)
+    if registro is None:
+        with _registros_lock:
+            registro = _registros.get(chave)
+            if registro is None:
+                registro = RegistroFipe(caminho)
+                pai = _registros.get((os.getppid(), caminho))
+                if pai is not None:
+                    registro.herdar(pai)
+                _registros[chave] = registro
+    return registro
+
+
+def parametros_busca(args):
+    """Valida q, ano e limite de /api/fipe/busca (args com .get). Levanta ValueError com a mensagem."""
+    consulta = (args.get("q") or "").strip()
+    if len(consulta) < MIN_CARACTERES:
+        raise ValueError(f"Informe ao menos {MIN_CARACTERES} caracteres em q.")
+    try:
+        ano = int(args.get("ano")) if (args.get("ano") or "").strip() else None
+        limite = int(args.get("limite") or LIMITE_PADRAO)
+    except ValueError:
+        raise ValueError("ano e limite devem ser números inteiros.")
+    if not 1 <= limite <= LIMITE_MAXIMO:
+        raise ValueError(f"limite deve estar entre 1 e {LIMITE_MAXIMO}.")
+    return consulta, ano, limite
+
+# ----- FIM DO CÓDIGO -----
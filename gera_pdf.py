@@ -0,0 +1,150 @@
+# ----- INÍCIO DO CÓDIGO PARA gera_pdf.py -----
+# Geração do PDF de uma cotação, escolhendo o motor:
+#   "libreoffice" - preenche o .pptx (preenche_cotacao.py) e converte (converte_pdf.py)
+#   "nativo"      - desenha o PDF direto (pdf_nativo.py), sem LibreOffice; se não puder, cai para o LibreOffice
+#   "sobreposicao"- carimba os textos no PDF base do template (pdf_sobreposicao.py); idem
+import os
+import io
+import logging
+import threading
+
+from preenche_cotacao import preencher_cotacao_pptx, obter_template, textos_cotacao
+from cache_pdf import obter_cache, chave_cotacao
+from converte_pdf import converter_pptx_bytes_para_pdf
+from pdf_nativo import renderizar_pdf_nativo
+from pdf_sobreposicao import renderizar_pdf_sobreposicao, obter_base, BaseIndisponivel
+from metricas import medir
+
+log_prefix = "[gera_pdf]"
+
+MOTORES_PDF = ("libreoffice", "nativo", "sobreposicao")
+# Motor padrão quando a requisição não escolhe um
+MOTOR_PDF_PADRAO = os.environ.get("MOTOR_PDF", "libreoffice")
+
+
+def motor_valido(motor):
+    motor = motor or MOTOR_PDF_PADRAO
+    if motor not in MOTORES_PDF:
+        logging.warning(f"{log_prefix} Motor de PDF desconhecido '{motor}'. Usando '{MOTOR_PDF_PADRAO}'.")
+        motor = MOTOR_PDF_PADRAO
+    return motor
+
+
+def renderizar_sem_libreoffice(template_path, dados_cotacao, motor):
+    """Bytes do PDF pelos motores "nativo"/"sobreposicao", ou None se o motor for "libreoffice"
+    ou não puder gerar este PDF (quem chamou cai para preencher + converter)."""
+    if motor == "nativo":
+        with medir("renderizacao_nativa"):
+            pdf_bytes = renderizar_pdf_nativo(template_path, dados_cotacao)
+        if pdf_bytes is not None:
+            logging.info(f"{log_prefix} PDF gerado pelo motor nativo ({len(pdf_bytes)} bytes).")
+        return pdf_bytes
+
+    if motor == "sobreposicao":
+        with medir("sobreposicao"):
+            pdf_bytes = renderizar_pdf_sobreposicao(template_path, dados_cotacao)
+        if pdf_bytes is not None:
+            logging.info(f"{log_prefix} PDF gerado por sobreposição ({len(pdf_bytes)} bytes).")
+        return pdf_bytes
+    return None
+
+
+def preencher_pptx_bytes(template_path, dados_cotacao):
+    """Preenche o PowerPoint em um buffer (sem passar pelo disco). Bytes do .pptx ou None."""
+    buffer_pptx = io.BytesIO()
+    with medir("preenchimento"):
+        preenchido = preencher_cotacao_pptx(template_path, buffer_pptx, dados_cotacao)
+    if not preenchido:
+        logging.error(f"{log_prefix} Falha reportada por preencher_cotacao_pptx.")
+        return None
+    logging.info(f"{log_prefix} PPTX preenchido com sucesso ({buffer_pptx.tell()} bytes). Convertendo para PDF...")
+    return buffer_pptx.getvalue()
+
+
+def gerar_pdf_cotacao(template_path, dados_cotacao, motor=None):
+    """Bytes do PDF da cotação, ou None em caso de falha (detalhes no log).
+
+    Levanta converte_pdf.ConversaoSaturada se o LibreOffice estiver sem vagas.
+    """
+    motor = motor_valido(motor)
+    pdf_bytes = renderizar_sem_libreoffice(template_path, dados_cotacao, motor)
+    if pdf_bytes is not None:
+        return pdf_bytes
+
+    # Preenche e converte bytes -> bytes
+    pptx_bytes = preencher_pptx_bytes(template_path, dados_cotacao)
+    if pptx_bytes is None:
+        return None
+    with medir("conversao"):
+        pdf_bytes = converter_pptx_bytes_para_pdf(pptx_bytes)
+    if not pdf_bytes:
+        logging.error(f"{log_prefix} Falha na conversão para PDF em memória.")
+        return None
+    return pdf_bytes
+
+
+def consultar_cache(template_path, dados_cotacao, destino, motor, diretorio_saida=None):
+    """Procura a cotação no cache_pdf e, se achar, já a grava em 'destino'.
+
+    Retorna (achou, cache, chave); cache e chave vão depois para gravar_pdf.
+    """
+    cache = obter_cache(diretorio_saida or os.path.dirname(destino) or ".")
+    if cache is None:
+        return False, None, None
+    template = obter_template(template_path)
+    chave = chave_cotacao(template.versao, dados_cotacao.get("versao_tabela"), motor, textos_cotacao(dados_cotacao))
+    if cache.obter(chave, destino):
+        logging.info(f"{log_prefix} PDF reaproveitado do cache ({chave[:12]}): {destino}")
+        return True, cache, chave
+    return False, cache, chave
+
+
+def gravar_pdf(pdf_bytes, destino, cache=None, chave=None):
+    """Grava o PDF em 'destino' (temporário + rename: o download nunca vê um PDF pela metade)."""
+    with medir("gravacao"):
+        temporario = f"{destino}.tmp"
+        with open(temporario, "wb") as f:
+            f.write(pdf_bytes)
+        os.replace(temporario, destino)
+        if cache is not None:
+            cache.guardar(chave, destino)
+
+
+def salvar_pdf_cotacao(template_path, dados_cotacao, destino, motor=None, diretorio_saida=None):
+    """Gera o PDF da cotação em 'destino' (gravação atômica). Retorna True/False.
+
+    Se a mesma cotação (mesmos textos, template, tabela e motor) já foi gerada, reaproveita o
+    PDF do cache_pdf (em 'diretorio_saida', por padrão o diretório de 'destino') sem preencher
+    nem converter nada.
+    """
+    motor = motor_valido(motor)
+    achou, cache, chave = consultar_cache(template_path, dados_cotacao, destino, motor, diretorio_saida)
+    if achou:
+        return True
+
+    pdf_bytes = gerar_pdf_cotacao(template_path, dados_cotacao, motor)
+    if not pdf_bytes:
+        return False
+    gravar_pdf(pdf_bytes, destino, cache, chave)
+    return True
+
+
+def preparar_motor_padrao(template_path, em_segundo_plano=True):
+    """Se o motor padrão for "sobreposicao", prepara o PDF base (na subida do worker)."""
+    if MOTOR_PDF_PADRAO != "sobreposicao":
+        return
+
+    def preparar():
+        try:
+            obter_base(template_path)
+        except BaseIndisponivel as e:
+            logging.info(f"{log_prefix} PDF base não preparado agora: {e}.")
+        except Exception as e:
+            logging.error(f"{log_prefix} Não foi possível preparar o PDF base: {e}. Será tentado na primeira cotação.")
+
+    if em_segundo_plano:
+        threading.Thread(target=preparar, name="prepara-pdf-base", daemon=True).start()
+    else:
+        preparar()
+
+# ----- FIM DO CÓDIGO -----
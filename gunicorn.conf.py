@@ -0,0 +1,33 @@
+# ----- INÍCIO DO CÓDIGO PARA gunicorn.conf.py -----
+# Carregado automaticamente pelo gunicorn quando iniciado a partir deste diretório.
+#
+# preload_app: o master importa a aplicação e, com "app:create_app()", já carrega tabela de
+# preços e template (inicializacao.preaquecer_dados); os workers herdam isso pelo fork.
+# post_fork: cada worker sobe em segundo plano o que não atravessa o fork (LibreOffice, vigia
+# das tabelas). O /readyz só responde 200 quando isso terminar.
+# on_starting: as métricas dos workers vão para um diretório desta subida (pid do master), também
+# com "app:app", que não passa pelo create_app.
+#
+# worker_class gthread: o ZIP de /api/lote é enviado aos pedaços durante minutos. Num worker sync,
+# o master mataria o worker (SIGKILL) ao passar do timeout e o cliente receberia um ZIP truncado,
+# sem manifesto. No gthread quem avisa o master é o laço principal do worker, não a requisição:
+# o timeout só derruba um worker realmente travado, e cada worker atende várias requisições.
+import os
+
+preload_app = True
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120")) # Worker sem sinal de vida por mais que isso é reiniciado
+
+
+def on_starting(server):
+    from metricas import iniciar_instancia
+    iniciar_instancia()
+
+
+def post_fork(server, worker):
+    import app
+    from inicializacao import preaquecer_worker
+    preaquecer_worker(app.INPUT_DIR, app.TEMPLATE_PPTX)
+
+# ----- FIM DO CÓDIGO -----
@@ -0,0 +1,134 @@
+# ----- INÍCIO DO CÓDIGO PARA inicializacao.py -----
+# Pré-aquecimento da aplicação, em duas fases:
+#
+#   preaquecer_dados()  - tabela de preços, índice FIPE (se houver o arquivo), bytes/índice do
+#                         template, renderizador rápido e artefatos dos motores de PDF já
+#                         existentes no disco. Não cria processos nem threads: com
+#                         "gunicorn --preload" roda uma vez no master, e os workers herdam
+#                         tudo pelo fork (memória compartilhada, copy-on-write).
+#   preaquecer_worker() - o que não sobrevive ao fork: thread de vigia das tabelas, instância do
+#                         LibreOffice da primeira vaga e o PDF base do modo sobreposição. Roda em
+#                         segundo plano no worker (hook post_fork do gunicorn.conf.py ou, sem ele,
+#                         na primeira chamada de /readyz).
+#
+# /readyz só responde 200 quando as duas fases terminaram neste worker.
+import os
+import gc
+import time
+import logging
+import threading
+
+from registro_tabelas import obter_registro
+from preenche_cotacao import obter_template
+from converte_pdf import aquecer_conversao
+from gera_pdf import MOTOR_PDF_PADRAO, preparar_motor_padrao
+from pdf_nativo import obter_fundo
+from pdf_sobreposicao import caminho_base, obter_base
+from fipe import FIPE_ARQUIVO, obter_fipe
+
+log_prefix = "[inicializacao]"
+
+_etapas = {} # nome -> {"ok": bool, "duracao_s": float, "erro"/"detalhe": str}
+_dados_pid = None # pid em que preaquecer_dados() rodou (o do master, com --preload)
+_worker = {} # pid -> threading.Event, marcado quando preaquecer_worker() termina
+_lock = threading.Lock()
+
+
+def _etapa(nome, funcao):
+    inicio = time.perf_counter()
+    try:
+        detalhe = funcao()
+        _etapas[nome] = {"ok": True, "duracao_s": round(time.perf_counter() - inicio, 3)}
+        if detalhe:
+            _etapas[nome]["detalhe"] = detalhe
+    except Exception as e:
+        logging.error(f"{log_prefix} Falha ao pré-aquecer '{nome}': {e}")
+        _etapas[nome] = {"ok": False, "duracao_s": round(time.perf_counter() - inicio, 3), "erro": str(e)}
+    return _etapas[nome]["ok"]
+
+
+def preaquecer_dados(diretorio_tabelas, template_path):
+    """Carrega tabela e template no processo atual (seguro no master antes do fork)."""
+    global _dados_pid
+
+    def carregar_template():
+        obter_template(template_path).renderizador_rapido() # Compila o preenchimento rápido também
+
+    def carregar_base():
+        obter_base(template_path)
+
+    def carregar_fipe():
+        indice = obter_fipe(FIPE_ARQUIVO).indice()
+        if indice is None:
+            raise RuntimeError(f"não foi possível ler '{FIPE_ARQUIVO}'")
+        return indice.versao
+
+    inicio = time.perf_counter()
+    _etapa("tabela", lambda: obter_registro(diretorio_tabelas, vigiar=False).tabela_ativa().versao)
+    _etapa("template", carregar_template)
+    if os.path.exists(FIPE_ARQUIVO): # Opcional: sem o arquivo, o formulário só não sugere veículos
+        _etapa("fipe", carregar_fipe)
+    if MOTOR_PDF_PADRAO == "nativo":
+        _etapa("motor_nativo", lambda: None if obter_fundo(template_path) else "artefato ausente ou desatualizado: usa LibreOffice")
+    elif MOTOR_PDF_PADRAO == "sobreposicao":
+        # Só lê o PDF base já gravado; converter o template exigiria o LibreOffice (fica para o worker)
+        if os.path.exists(caminho_base(template_path)):
+            _etapa("motor_sobreposicao", carregar_base)
+    # Objetos carregados até aqui vivem até o fim: fora do GC, as páginas herdadas pelo fork
+    # não são copiadas só porque o coletor passou por elas
+    gc.freeze()
+    _dados_pid = os.getpid()
+    logging.info(f"{log_prefix} Dados pré-carregados em {time.perf_counter() - inicio:.2f}s (pid {_dados_pid}).")
+
+
+def preaquecer_worker(diretorio_tabelas, template_path, em_segundo_plano=True):
+    """Sobe o que é por processo (vigia das tabelas, LibreOffice, PDF base). Idempotente por worker."""
+    pid = os.getpid()
+    with _lock:
+        if pid in _worker:
+            return _worker[pid]
+        pronto = _worker[pid] = threading.Event()
+
+    def aquecer():
+        inicio = time.perf_counter()
+        try:
+            if _dados_pid is None:
+                preaquecer_dados(diretorio_tabelas, template_path) # Sem --preload: carrega aqui mesmo
+            _etapa("vigia_tabelas", lambda: obter_registro(diretorio_tabelas).tabela_ativa().versao)
+            if MOTOR_PDF_PADRAO != "nativo": # O nativo só cai para o LibreOffice em casos raros
+                _etapa("libreoffice", lambda: None if aquecer_conversao() else "pool indisponível: conversão avulsa")
+            preparar_motor_padrao(template_path, em_segundo_plano=False)
+        finally:
+            pronto.set()
+            logging.info(f"{log_prefix} Worker {pid} pronto em {time.perf_counter() - inicio:.2f}s.")
+
+    if em_segundo_plano:
+        threading.Thread(target=aquecer, name="preaquecimento", daemon=True).start()
+    else:
+        aquecer()
+    return pronto
+
+
+def estado_prontidao(diretorio_tabelas, template_path):
+    """(pronto, detalhes) deste worker, para /readyz.
+
+    Além do aquecimento concluído, exige agora uma tabela vigente e o template no disco (uma
+    tabela que chegue depois deixa o worker pronto sem reiniciar).
+    """
+    evento = _worker.get(os.getpid())
+    aquecido = evento is not None and evento.is_set()
+    detalhes = {"pid": os.getpid(), "aquecimento_iniciado": evento is not None,
+                "aquecimento_concluido": aquecido, "etapas": dict(_etapas)}
+    if not aquecido:
+        return False, detalhes
+    try:
+        detalhes["versao_tabela"] = obter_registro(diretorio_tabelas).tabela_ativa().versao
+    except RuntimeError as e:
+        detalhes["erro"] = str(e)
+        return False, detalhes
+    if not os.path.exists(template_path):
+        detalhes["erro"] = f"Template não encontrado: {template_path}"
+        return False, detalhes
+    return True, detalhes
+
+# ----- FIM DO CÓDIGO -----
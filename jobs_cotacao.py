@@ -0,0 +1,198 @@
+# ----- INÍCIO DO CÓDIGO PARA jobs_cotacao.py -----
+# Jobs assíncronos de cotação: o POST só enfileira e devolve um id; threads de fundo
+# preenchem e convertem. O worker web fica livre enquanto o LibreOffice trabalha.
+#
+# O estado de cada job fica em <diretório de saída>/.jobs/<id>.json (escrita atômica), e não
+# em memória: com gunicorn -w N o GET de status pode cair em outro worker que não o do POST.
+import os
+import re
+import json
+import time
+import uuid
+import socket
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from converte_pdf import ConversaoSaturada, VAGAS_CONVERSAO, ESPERA_MAX, ESPERA_SATURADO_MAX, TIMEOUT_CONVERSAO, estatisticas_conversao
+from gera_pdf import salvar_pdf_cotacao
+from armazem_saida import obter_armazem
+from metricas import contar
+
+log_prefix = "[jobs_cotacao]"
+
+# Threads de geração por worker: uma por vaga de conversão (mais que isso só esperaria na fila do agendador)
+JOBS_THREADS = int(os.environ.get("JOBS_THREADS") or VAGAS_CONVERSAO)
+# Jobs aguardando por worker; acima disso o POST responde 503 com Retry-After
+JOBS_FILA_MAX = int(os.environ.get("JOBS_FILA_MAX", "50"))
+JOBS_TTL_HORAS = float(os.environ.get("JOBS_TTL_HORAS", "24")) # Estado de jobs antigos é apagado depois disso
+TENTATIVAS_SATURADO = 5 # Job que encontra o agendador saturado espera e tenta de novo
+# Tempo máximo entre duas gravações do estado de um job vivo: espera na fila do agendador + conversão,
+# com folga para o preenchimento e a espera entre tentativas. Passado isso, o job é dado como perdido.
+LIMITE_SEM_ATUALIZACAO = ESPERA_MAX + TIMEOUT_CONVERSAO + ESPERA_SATURADO_MAX + 30
+INTERVALO_LIMPEZA = 300
+NOME_DIRETORIO = ".jobs"
+_ID_VALIDO = re.compile(r"[0-9a-f]{32}")
+
+
+class FilaJobs:
+    """Executor de jobs de cotação do processo atual + estado compartilhado em disco."""
+
+    def __init__(self, diretorio_saida, template_path, threads=JOBS_THREADS, fila_max=JOBS_FILA_MAX):
+        self.diretorio_saida = diretorio_saida
+        self.diretorio = os.path.join(diretorio_saida, NOME_DIRETORIO)
+        self.template_path = template_path
+        self.threads = threads
+        self.fila_max = fila_max
+        os.makedirs(self.diretorio, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="job-cotacao")
+        self._lock = threading.Lock()
+        self._em_aberto = 0 # Pendentes + processando neste processo
+        self._ultima_limpeza = 0.0
+        self._host = socket.gethostname()
+
+    def _caminho(self, job_id):
+        return os.path.join(self.diretorio, f"{job_id}.json")
+
+    def _gravar(self, estado):
+        estado["atualizado_em"] = time.time()
+        caminho = self._caminho(estado["id"])
+        temporario = f"{caminho}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(estado, f, ensure_ascii=False)
+        os.replace(temporario, caminho)
+
+    def submeter(self, dados_cotacao, nome_pdf, motor=None, aviso=None):
+        """Enfileira a geração e retorna o estado inicial do job. ConversaoSaturada se a fila estiver cheia."""
+        with self._lock:
+            if self._em_aberto >= self.fila_max:
+                duracao = estatisticas_conversao()["duracao_media_s"] or 5.0
+                raise ConversaoSaturada(max(1, int(duracao * self._em_aberto / self.threads)))
+            self._em_aberto += 1
+        estado = {"id": uuid.uuid4().hex, "status": "pendente", "criado_em": time.time(),
+                  "placa": dados_cotacao.get("placa"), "versao_tabela": dados_cotacao.get("versao_tabela"),
+                  "aviso": aviso, "pdf": None, "erro": None, "dono_pid": os.getpid(), "dono_host": self._host}
+        try:
+            self._gravar(estado)
+            self._executor.submit(self._executar, dict(estado), dados_cotacao, nome_pdf, motor)
+        except Exception:
+            with self._lock:
+                self._em_aberto -= 1
+            raise
+        logging.info(f"{log_prefix} Job {estado['id']} enfileirado (placa {estado['placa']}, {self._em_aberto} em aberto).")
+        self._limpar_se_preciso()
+        return estado
+
+    def _executar(self, estado, dados_cotacao, nome_pdf, motor):
+        inicio = time.monotonic()
+        try:
+            estado["status"] = "processando"
+            self._gravar(estado)
+            destino = obter_armazem(self.diretorio_saida).caminho(nome_pdf)
+            for tentativa in range(1, TENTATIVAS_SATURADO + 1):
+                if tentativa > 1:
+                    self._gravar(estado) # Renova atualizado_em: o job segue vivo
+                try:
+                    sucesso = salvar_pdf_cotacao(self.template_path, dados_cotacao, destino, motor, self.diretorio_saida)
+                    break
+                except ConversaoSaturada as e:
+                    if tentativa == TENTATIVAS_SATURADO:
+                        raise
+                    logging.info(f"{log_prefix} Job {estado['id']}: conversões saturadas, nova tentativa em {e.retry_after}s.")
+                    time.sleep(min(e.retry_after, ESPERA_SATURADO_MAX))
+            if sucesso:
+                estado.update(status="concluido", pdf=nome_pdf)
+            else:
+                estado.update(status="erro", erro="Erro ao gerar a cotação em PDF. Verifique os logs do servidor.")
+        except ConversaoSaturada:
+            estado.update(status="erro", erro="Muitas cotações sendo geradas neste momento. Tente novamente.")
+        except Exception:
+            logging.exception(f"{log_prefix} Exceção no job {estado['id']}:")
+            estado.update(status="erro", erro="Ocorreu um erro inesperado durante a geração da cotação.")
+        finally:
+            with self._lock:
+                self._em_aberto -= 1
+        estado["duracao_s"] = round(time.monotonic() - inicio, 3)
+        contar("cotacoes_total", resultado="sucesso" if estado["status"] == "concluido" else "falha")
+        self._gravar(estado)
+        logging.info(f"{log_prefix} Job {estado['id']} {estado['status']} em {estado['duracao_s']}s.")
+
+    def consultar(self, job_id):
+        """Estado do job (de qualquer worker), ou None se o id não existir.
+
+        Job em aberto cujo worker dono morreu (timeout, OOM, restart do gunicorn) ou que não é
+        atualizado há mais que o esperado sai como erro, em vez de ficar pendente para sempre.
+        """
+        if not _ID_VALIDO.fullmatch(job_id):
+            return None
+        try:
+            with open(self._caminho(job_id), encoding="utf-8") as f:
+                estado = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if estado.get("status") in ("pendente", "processando"):
+            motivo = self._motivo_perdido(estado)
+            if motivo:
+                logging.warning(f"{log_prefix} Job {job_id} dado como perdido: {motivo}.")
+                estado.update(status="erro", erro="A geração da cotação foi interrompida no servidor. Tente novamente.")
+        return estado
+
+    def _motivo_perdido(self, estado):
+        pid = estado.get("dono_pid")
+        if pid and estado.get("dono_host") == self._host and not _processo_vivo(pid):
+            return f"worker {pid} não existe mais"
+        limite = LIMITE_SEM_ATUALIZACAO
+        if estado["status"] == "pendente":
+            # Na fila do executor, o job espera os que estão à frente dele (até fila_max, threads por vez)
+            limite *= 1 + self.fila_max // self.threads
+        parado = time.time() - estado.get("atualizado_em", estado.get("criado_em", 0))
+        if parado > limite:
+            return f"sem atualização há {int(parado)}s"
+        return None
+
+    def _limpar_se_preciso(self):
+        agora = time.monotonic()
+        with self._lock:
+            if agora - self._ultima_limpeza < INTERVALO_LIMPEZA:
+                return
+            self._ultima_limpeza = agora
+        limite = time.time() - JOBS_TTL_HORAS * 3600
+        for entrada in os.scandir(self.diretorio):
+            try:
+                if entrada.stat().st_mtime < limite:
+                    os.remove(entrada.path)
+            except OSError:
+                pass
+
+    def estatisticas(self):
+        with self._lock:
+            return {"threads": self.threads, "fila_max": self.fila_max, "em_aberto": self._em_aberto}
+
+
+def _processo_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True # Existe, mas é de outro usuário
+    return True
+
+
+_filas = {}
+_filas_lock = threading.Lock()
+
+
+def obter_fila(diretorio_saida, template_path):
+    """FilaJobs do processo atual (threads não sobrevivem ao fork do gunicorn)."""
+    chave = (os.getpid(), os.path.abspath(diretorio_saida), template_path)
+    fila = _filas.get(chave)
+    if fila is None:
+        with _filas_lock:
+            fila = _filas.get(chave)
+            if fila is None:
+                fila = FilaJobs(diretorio_saida, template_path)
+                _filas[chave] = fila
+    return fila
+
+# ----- FIM DO CÓDIGO -----
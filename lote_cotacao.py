@@ -0,0 +1,244 @@
+# ----- INÍCIO DO CÓDIGO PARA lote_cotacao.py -----
+# Cotação de frota: uma planilha (CSV ou XLSX) com um veículo por linha vira um ZIP de PDFs.
+#
+# Todas as linhas são precificadas de uma vez (PriceTable.calcular_lote) antes de começar a
+# resposta; depois o preenchimento/conversão é distribuído entre as vagas de conversão e o ZIP
+# é enviado aos pedaços, uma entrada por PDF, na ordem em que ficam prontos. Só há no máximo
+# ~2 PDFs por vaga em memória, não importa o tamanho da frota. Erros por linha vão para o
+# manifesto.csv, gravado no fim do ZIP.
+import io
+import os
+import csv
+import time
+import logging
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from armazem_saida import nome_pdf_cotacao
+from calculo_precos import parse_valor_brasileiro
+from converte_pdf import ConversaoSaturada, VAGAS_CONVERSAO, ESPERA_SATURADO_MAX
+from gera_pdf import gerar_pdf_cotacao
+
+log_prefix = "[lote_cotacao]"
+
+COLUNAS_LOTE = ["nome", "placa", "marca", "modelo", "ano", "valor_fipe", "categoria"]
+COLUNAS_OBRIGATORIAS = ["nome", "placa", "marca", "modelo", "ano", "valor_fipe"]
+LOTE_MAX_LINHAS = int(os.environ.get("LOTE_MAX_LINHAS", "2000"))
+LOTE_THREADS = int(os.environ.get("LOTE_THREADS") or VAGAS_CONVERSAO)
+TENTATIVAS_SATURADO = 5 # Depois disso a linha sai como erro no manifesto
+COLUNAS_MANIFESTO = ["linha", "nome", "placa", "valor_fipe", "status", "arquivo", "erro", "aviso", "versao_tabela"]
+
+
+class ErroLote(ValueError):
+    """Planilha ilegível ou sem as colunas esperadas (nada é gerado)."""
+
+
+def _nome_coluna(nome):
+    return str(nome).strip().lower().replace(" ", "_")
+
+
+def ler_planilha(arquivo, nome_arquivo, max_linhas=LOTE_MAX_LINHAS):
+    """Lê o CSV/XLSX enviado e retorna a lista de linhas (dicts com COLUNAS_LOTE, valores crus).
+
+    max_linhas=None não limita o tamanho (lote offline, ver lote_offline.py).
+    """
+    import pandas as pd # Carregado só quando chega uma planilha, não na subida do worker
+
+    extensao = os.path.splitext(nome_arquivo or "")[1].lower()
+    try:
+        if extensao in (".xlsx", ".xlsm"):
+            df = pd.read_excel(arquivo, engine="openpyxl")
+        elif extensao in (".csv", ".txt", ""):
+            # Separador detectado (',' ou ';' do Excel brasileiro); tudo como texto, como no formulário
+            df = pd.read_csv(arquivo, sep=None, engine="python", dtype=str, encoding="utf-8-sig")
+        else:
+            raise ErroLote(f"Formato não suportado: '{extensao}'. Envie um arquivo .csv ou .xlsx.")
+    except ErroLote:
+        raise
+    except Exception as e:
+        raise ErroLote(f"Não foi possível ler a planilha: {e}")
+
+    df.columns = [_nome_coluna(c) for c in df.columns]
+    faltando = [c for c in COLUNAS_OBRIGATORIAS if c not in df.columns]
+    if faltando:
+        raise ErroLote(f"Colunas obrigatórias ausentes: {', '.join(faltando)}.")
+    if "categoria" not in df.columns:
+        df["categoria"] = ""
+    df = df[COLUNAS_LOTE].dropna(how="all")
+    if df.empty:
+        raise ErroLote("A planilha não tem nenhum veículo.")
+    if max_linhas is not None and len(df) > max_linhas:
+        raise ErroLote(f"A planilha tem {len(df)} veículos; o máximo por envio é {max_linhas}.")
+    df = df.astype(object).where(df.notna(), None)
+    # Número da linha como aparece na planilha (1 = cabeçalho)
+    return [dict(linha=int(i) + 2, **registro) for i, registro in zip(df.index, df.to_dict("records"))]
+
+
+def _texto(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor) # Excel devolve 2020.0 para o ano
+    return str(valor).strip()
+
+
+def precificar_lote(tabela, linhas):
+    """Valida e precifica todas as linhas de uma vez.
+
+    Retorna (cotacoes, erros): cotacoes = [(linha, dados_cotacao, aviso)] prontas para gerar;
+    erros = linhas do manifesto das linhas recusadas.
+    """
+    validas = []
+    valores = []
+    erros = []
+    for registro in linhas:
+        campos = {c: _texto(registro.get(c)) for c in COLUNAS_LOTE}
+        faltando = [c for c in COLUNAS_OBRIGATORIAS if not campos[c]]
+        erro = f"Campos obrigatórios vazios: {', '.join(faltando)}." if faltando else None
+        if erro is None:
+            try:
+                ano = int(campos["ano"])
+                valor = registro["valor_fipe"]
+                valor_fipe = parse_valor_brasileiro(valor if not isinstance(valor, str) else valor.strip())
+            except (ValueError, TypeError):
+                erro = "Ano e Valor FIPE devem ser valores numéricos válidos."
+        if erro is not None:
+            erros.append({"linha": registro["linha"], "nome": campos["nome"], "placa": campos["placa"],
+                          "valor_fipe": campos["valor_fipe"], "status": "erro", "erro": erro})
+            continue
+        validas.append((registro["linha"], campos, ano, valor_fipe))
+        valores.append(valor_fipe)
+
+    cotacoes = []
+    if validas:
+        resultado = tabela.calcular_lote(valores)
+        planos = [c for c in resultado.columns if c not in ("valor_fipe", "valor_excedente", "percentual_adicional",
+                                                              "sujeito_aprovacao", "faixa_encontrada")]
+        for (linha, campos, ano, valor_fipe), precos in zip(validas, resultado.to_dict("records")):
+            if not precos["faixa_encontrada"]:
+                erros.append({"linha": linha, "nome": campos["nome"], "placa": campos["placa"], "valor_fipe": valor_fipe,
+                              "status": "erro", "erro": "Nenhuma faixa de preço para o valor FIPE informado."})
+                continue
+            sujeito_aprovacao = bool(precos["sujeito_aprovacao"])
+            # Mesmo dict de PriceTable.calcular()
+            precos_info = {plano: float(precos[plano]) for plano in planos}
+            precos_info["valor_excedente"] = float(precos["valor_excedente"])
+            precos_info["percentual_adicional"] = int(precos["percentual_adicional"]) if sujeito_aprovacao else 0.0
+            precos_info["sujeito_aprovacao"] = sujeito_aprovacao
+            dados_cotacao = {
+                "nome_cliente": campos["nome"],
+                "placa": campos["placa"],
+                "marca": campos["marca"],
+                "modelo": campos["modelo"],
+                "ano": ano,
+                "valor_fipe": valor_fipe,
+                "categoria": campos["categoria"],
+                "precos": precos_info,
+                "versao_tabela": tabela.versao,
+            }
+            aviso = "Sujeita à aprovação da diretoria." if sujeito_aprovacao else None
+            cotacoes.append((linha, dados_cotacao, aviso))
+    return cotacoes, erros
+
+
+class _SaidaStream:
+    """Destino do ZipFile sem seek: guarda os bytes escritos até o gerador entregá-los."""
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def retirar(self):
+        dados = b"".join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+def _gerar_pdf(template_path, dados_cotacao, motor):
+    for tentativa in range(1, TENTATIVAS_SATURADO + 1):
+        try:
+            return gerar_pdf_cotacao(template_path, dados_cotacao, motor)
+        except ConversaoSaturada as e:
+            if tentativa == TENTATIVAS_SATURADO:
+                raise
+            # Com teto: o stream do ZIP não pode ficar parado a ponto de o cliente ou o proxy desistirem
+            time.sleep(min(e.retry_after, ESPERA_SATURADO_MAX))
+
+
+def nome_pdf_linha(linha, placa):
+    return nome_pdf_cotacao(f"{linha:04d}", placa)
+
+
+def gerar_zip_lote(template_path, cotacoes, erros, motor=None, threads=LOTE_THREADS):
+    """Gerador dos pedaços do ZIP: um PDF por cotação (na ordem em que ficam prontos) + manifesto.csv."""
+    saida = _SaidaStream()
+    manifesto = list(erros)
+    inicio = time.monotonic()
+    pendentes = iter(cotacoes)
+    em_andamento = {}
+    janela = max(1, threads) * 2 # PDFs prontos ou em geração ao mesmo tempo (memória constante)
+
+    with ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="lote-cotacao") as executor, \
+            zipfile.ZipFile(saida, "w") as zf:
+        def submeter_proximas():
+            while len(em_andamento) < janela:
+                cotacao = next(pendentes, None)
+                if cotacao is None:
+                    return
+                em_andamento[executor.submit(_gerar_pdf, template_path, cotacao[1], motor)] = cotacao
+
+        try:
+            submeter_proximas()
+            while em_andamento:
+                prontos, _ = wait(em_andamento, return_when=FIRST_COMPLETED)
+                for futuro in prontos:
+                    linha, dados_cotacao, aviso = em_andamento.pop(futuro)
+                    registro = {"linha": linha, "nome": dados_cotacao["nome_cliente"], "placa": dados_cotacao["placa"],
+                                "valor_fipe": dados_cotacao["valor_fipe"], "aviso": aviso,
+                                "versao_tabela": dados_cotacao["versao_tabela"]}
+                    erro = "Falha ao gerar o PDF."
+                    try:
+                        pdf_bytes = futuro.result()
+                    except ConversaoSaturada:
+                        logging.warning(f"{log_prefix} Linha {linha}: conversões saturadas após {TENTATIVAS_SATURADO} tentativas.")
+                        pdf_bytes = None
+                        erro = "Conversões de PDF saturadas: gere esta linha novamente."
+                    except Exception as e:
+                        logging.error(f"{log_prefix} Linha {linha}: exceção ao gerar PDF: {e}")
+                        pdf_bytes = None
+                    if pdf_bytes:
+                        nome = nome_pdf_linha(linha, dados_cotacao["placa"])
+                        # PDF já é comprimido: STORED evita gastar CPU à toa
+                        zf.writestr(nome, pdf_bytes, compress_type=zipfile.ZIP_STORED)
+                        registro.update(status="ok", arquivo=nome)
+                    else:
+                        registro.update(status="erro", erro=erro)
+                    manifesto.append(registro)
+                submeter_proximas()
+                yield saida.retirar()
+        except GeneratorExit:
+            # Cliente desconectou: descarta o que ainda não começou
+            for futuro in em_andamento:
+                futuro.cancel()
+            logging.warning(f"{log_prefix} Download do lote interrompido pelo cliente.")
+            raise
+
+        manifesto.sort(key=lambda r: r["linha"])
+        texto = io.StringIO()
+        escritor = csv.DictWriter(texto, fieldnames=COLUNAS_MANIFESTO, extrasaction="ignore")
+        escritor.writeheader()
+        escritor.writerows(manifesto)
+        zf.writestr("manifesto.csv", texto.getvalue().encode("utf-8-sig"), compress_type=zipfile.ZIP_DEFLATED)
+
+    gerados = sum(1 for r in manifesto if r.get("status") == "ok")
+    logging.info(f"{log_prefix} Lote concluído: {gerados} PDF(s), {len(manifesto) - gerados} erro(s) "
+                 f"em {time.monotonic() - inicio:.1f}s.")
+    yield saida.retirar()
+
+# ----- FIM DO CÓDIGO -----
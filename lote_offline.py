@@ -0,0 +1,160 @@
+# ----- INÍCIO DO CÓDIGO PARA lote_offline.py -----
+# Geração noturna de cotações em massa (ex: renovações do fim do mês), fora do servidor web:
+#   python -m cotacao batch associados.csv --out renovacoes/ --workers 4
+#
+# O processo principal lê a planilha, carrega tabela e template uma vez e precifica tudo de uma
+# vez (lote_cotacao.precificar_lote). O preenchimento + conversão roda em um pool de processos
+# criado por fork: os filhos herdam tabela e template já carregados, e cada um sobe e usa a sua
+# própria instância do LibreOffice (encerrada quando o filho termina).
+#
+# Progresso em <out>/.checkpoint.jsonl, uma linha por cotação concluída. Se a execução for
+# interrompida, rodar o mesmo comando de novo pula as cotações já geradas (mesmos dados, mesma
+# versão da tabela, PDF ainda no disco) e tenta de novo as que falharam.
+import os
+import csv
+import json
+import time
+import hashlib
+import logging
+import multiprocessing
+from multiprocessing.util import Finalize
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from lote_cotacao import COLUNAS_MANIFESTO, ler_planilha, precificar_lote, nome_pdf_linha
+from converte_pdf import VAGAS_CONVERSAO, encerrar_conversao
+from preenche_cotacao import obter_template
+from gera_pdf import salvar_pdf_cotacao
+
+log_prefix = "[lote_offline]"
+
+ARQUIVO_CHECKPOINT = ".checkpoint.jsonl"
+ARQUIVO_MANIFESTO = "manifesto.csv"
+
+# Estado dos processos filhos (definido no initializer)
+_template_path = None
+_diretorio_saida = None
+_motor = None
+
+
+def chave_checkpoint(dados_cotacao):
+    """Identifica a cotação pelos dados e preços: mudou a planilha ou a tabela, gera de novo."""
+    return hashlib.sha1(json.dumps(dados_cotacao, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def ler_checkpoint(diretorio_saida):
+    """chave -> registro das cotações já geradas com sucesso (e cujo PDF ainda existe)."""
+    concluidas = {}
+    caminho = os.path.join(diretorio_saida, ARQUIVO_CHECKPOINT)
+    if not os.path.exists(caminho):
+        return concluidas
+    with open(caminho, encoding="utf-8") as f:
+        for linha in f:
+            try:
+                registro = json.loads(linha)
+            except ValueError:
+                continue # Última linha cortada por uma interrupção no meio da escrita
+            if registro.get("status") == "ok" and os.path.exists(os.path.join(diretorio_saida, registro["arquivo"])):
+                concluidas[registro["chave"]] = registro
+            else:
+                concluidas.pop(registro.get("chave"), None)
+    return concluidas
+
+
+def _iniciar_filho(template_path, diretorio_saida, motor):
+    global _template_path, _diretorio_saida, _motor
+    _template_path, _diretorio_saida, _motor = template_path, diretorio_saida, motor
+    # O multiprocessing encerra os filhos sem atexit; os finalizadores dele rodam
+    Finalize(None, encerrar_conversao, exitpriority=10)
+
+
+def _gerar_no_filho(dados_cotacao, nome_pdf):
+    inicio = time.perf_counter()
+    try:
+        sucesso = salvar_pdf_cotacao(_template_path, dados_cotacao, os.path.join(_diretorio_saida, nome_pdf),
+                                     _motor, _diretorio_saida)
+        erro = None if sucesso else "Falha ao gerar o PDF."
+    except Exception as e:
+        logging.exception(f"{log_prefix} Exceção ao gerar '{nome_pdf}':")
+        erro = f"Exceção ao gerar o PDF: {e}"
+    return erro, time.perf_counter() - inicio
+
+
+def gerar_lote_offline(arquivo_planilha, diretorio_saida, tabela, template_path, workers=VAGAS_CONVERSAO, motor=None):
+    """Gera um PDF por linha da planilha em diretorio_saida, retomando do checkpoint.
+
+    Retorna o resumo: {"total", "gerados", "retomados", "erros": [registros], "duracao_s", "cotacoes_por_min"}.
+    Levanta lote_cotacao.ErroLote se a planilha não puder ser lida.
+    """
+    inicio = time.monotonic()
+    linhas = ler_planilha(arquivo_planilha, arquivo_planilha, max_linhas=None)
+    cotacoes, erros = precificar_lote(tabela, linhas)
+    logging.info(f"{log_prefix} {len(linhas)} linha(s) lidas e precificadas (tabela {tabela.versao}) "
+                 f"em {time.monotonic() - inicio:.1f}s; {len(erros)} recusada(s).")
+
+    os.makedirs(diretorio_saida, exist_ok=True)
+    concluidas = ler_checkpoint(diretorio_saida)
+    manifesto = list(erros)
+    pendentes = []
+    for linha, dados_cotacao, aviso in cotacoes:
+        chave = chave_checkpoint(dados_cotacao)
+        if chave in concluidas:
+            manifesto.append(concluidas[chave])
+        else:
+            pendentes.append((chave, linha, dados_cotacao, aviso))
+    retomados = len(cotacoes) - len(pendentes)
+    if retomados:
+        logging.info(f"{log_prefix} Retomando: {retomados} cotação(ões) já geradas, {len(pendentes)} pendente(s).")
+
+    inicio_geracao = time.monotonic()
+    gerados = 0
+    if pendentes:
+        # Tabela e template carregados antes do fork: os filhos não leem nada do disco para começar
+        obter_template(template_path).renderizador_rapido()
+        contexto = multiprocessing.get_context("fork")
+        with open(os.path.join(diretorio_saida, ARQUIVO_CHECKPOINT), "a", encoding="utf-8") as checkpoint, \
+                ProcessPoolExecutor(max_workers=max(1, workers), mp_context=contexto, initializer=_iniciar_filho,
+                                    initargs=(template_path, diretorio_saida, motor)) as executor:
+            futuros = {}
+            for chave, linha, dados_cotacao, aviso in pendentes:
+                nome = nome_pdf_linha(linha, dados_cotacao["placa"])
+                futuros[executor.submit(_gerar_no_filho, dados_cotacao, nome)] = (chave, linha, dados_cotacao, aviso, nome)
+            try:
+                for n, futuro in enumerate(as_completed(futuros), 1):
+                    chave, linha, dados_cotacao, aviso, nome = futuros[futuro]
+                    try:
+                        erro, duracao = futuro.result()
+                    except Exception as e: # Filho morreu (ex: sem memória)
+                        erro, duracao = f"Processo de geração falhou: {e}", None
+                    registro = {"chave": chave, "linha": linha, "nome": dados_cotacao["nome_cliente"],
+                                "placa": dados_cotacao["placa"], "valor_fipe": dados_cotacao["valor_fipe"], "aviso": aviso,
+                                "versao_tabela": dados_cotacao["versao_tabela"], "duracao_s": duracao and round(duracao, 3)}
+                    if erro is None:
+                        registro.update(status="ok", arquivo=nome)
+                        gerados += 1
+                    else:
+                        registro.update(status="erro", erro=erro)
+                    checkpoint.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                    checkpoint.flush()
+                    manifesto.append(registro)
+                    if n % 100 == 0:
+                        decorrido = time.monotonic() - inicio_geracao
+                        logging.info(f"{log_prefix} {n}/{len(pendentes)} em {decorrido:.0f}s ({n / decorrido * 60:.0f}/min).")
+            except KeyboardInterrupt:
+                executor.shutdown(wait=False, cancel_futures=True)
+                logging.warning(f"{log_prefix} Interrompido: {gerados} gerada(s) nesta execução. "
+                                f"Rode o mesmo comando para continuar.")
+                raise
+
+    manifesto.sort(key=lambda r: r["linha"])
+    with open(os.path.join(diretorio_saida, ARQUIVO_MANIFESTO), "w", newline="", encoding="utf-8-sig") as f:
+        escritor = csv.DictWriter(f, fieldnames=COLUNAS_MANIFESTO, extrasaction="ignore")
+        escritor.writeheader()
+        escritor.writerows(manifesto)
+
+    duracao_geracao = time.monotonic() - inicio_geracao
+    return {"total": len(linhas), "gerados": gerados, "retomados": retomados,
+            "erros": [r for r in manifesto if r.get("status") != "ok"],
+            "duracao_s": round(time.monotonic() - inicio, 2),
+            "cotacoes_por_min": round(gerados / duracao_geracao * 60, 1) if gerados and duracao_geracao else None}
+
+# ----- FIM DO CÓDIGO -----
@@ -0,0 +1,335 @@
+# ----- INÍCIO DO CÓDIGO PARA metricas.py -----
+# Métricas de latência por etapa e contadores, expostas em /metrics no formato texto do Prometheus.
+#
+# Cada worker acumula as suas em memória (contar/observar/medir são baratos: um lock e somas)
+# e grava um retrato em <METRICAS_DIR>/<instância>/<pid>.json a cada INTERVALO_GRAVACAO segundos.
+# A instância é o pid do processo que sobe o servidor (o master do gunicorn, ou o uvicorn): duas
+# subidas no mesmo host não se misturam. O /metrics, atendido por qualquer worker, soma os retratos
+# da sua instância: o Prometheus vê o container inteiro, não só o worker que respondeu. O retrato
+# de um worker que morreu é somado a mortos.json e apagado (contadores não voltam para trás quando
+# o gunicorn recicla um worker). Processos de linha de comando (lote, bench) não gravam nada.
+#
+# Medidores (RSS de cada worker vivo, processos soffice) são lidos do /proc na hora da coleta.
+import os
+import json
+import time
+import logging
+import fcntl
+import shutil
+import tempfile
+import threading
+import contextlib
+
+log_prefix = "[metricas]"
+
+METRICAS_DIR = os.environ.get("METRICAS_DIR", os.path.join(tempfile.gettempdir(), "cotacao_metricas"))
+INTERVALO_GRAVACAO = float(os.environ.get("METRICAS_INTERVALO", "5")) # segundos
+VARIAVEL_INSTANCIA = "METRICAS_INSTANCIA" # Definida por iniciar_instancia(); herdada pelos workers
+ARQUIVO_MORTOS = "mortos.json"
+ARQUIVO_LOCK = ".lock"
+# Limites (segundos) dos baldes dos histogramas: do preenchimento (ms) à conversão lenta (minutos)
+BALDES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# nome -> (tipo, ajuda). Só métricas declaradas aqui são exportadas.
+DESCRICOES = {
+    "cotacao_etapa_segundos": ("histogram", "Duração de cada etapa da geração da cotação."),
+    "cotacoes_total": ("counter", "Cotações processadas, por resultado."),
+    "conversoes_total": ("counter", "Conversões PPTX -> PDF pelo LibreOffice, por modo e resultado."),
+    "cache_pdf_consultas_total": ("counter", "Consultas ao cache de PDFs, por resultado."),
+    "cache_precos_consultas_total": ("counter", "Consultas ao cache de preços, por resultado."),
+}
+
+
+def _chave_rotulos(rotulos):
+    return tuple(sorted(rotulos.items()))
+
+
+class Metricas:
+    """Contadores e histogramas do processo atual."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores = {} # (nome, rótulos) -> valor
+        self._histogramas = {} # (nome, rótulos) -> [contagem por balde..., +Inf, soma]
+
+    def contar(self, nome, valor=1, **rotulos):
+        chave = (nome, _chave_rotulos(rotulos))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def observar(self, nome, segundos, **rotulos):
+        chave = (nome, _chave_rotulos(rotulos))
+        # Só o balde em que o valor cai; a exportação acumula (formato "le" do Prometheus)
+        indice = len(BALDES_SEGUNDOS)
+        for i, limite in enumerate(BALDES_SEGUNDOS):
+            if segundos <= limite:
+                indice = i
+                break
+        with self._lock:
+            valores = self._histogramas.get(chave)
+            if valores is None:
+                valores = self._histogramas[chave] = [0] * (len(BALDES_SEGUNDOS) + 1) + [0.0]
+            valores[indice] += 1
+            valores[-1] += segundos
+
+    def retrato(self):
+        """Cópia serializável (JSON) de tudo que foi medido."""
+        with self._lock:
+            return {
+                "contadores": [[nome, list(rotulos), valor] for (nome, rotulos), valor in self._contadores.items()],
+                "histogramas": [[nome, list(rotulos), list(valores)] for (nome, rotulos), valores in self._histogramas.items()],
+            }
+
+
+_metricas = {} # pid -> Metricas (o worker não herda as contagens do master)
+_metricas_lock = threading.Lock()
+_fontes = [] # funções que devolvem [(nome, rótulos, valor)] de contadores mantidos por outros módulos
+_coletores = {} # id da thread -> lista onde observar() também anota (perfil de uma requisição)
+
+
+def obter_metricas():
+    """Metricas do processo atual; inicia a gravação periódica do retrato na primeira chamada."""
+    pid = os.getpid()
+    metricas = _metricas.get(pid)
+    if metricas is None:
+        with _metricas_lock:
+            metricas = _metricas.get(pid)
+            if metricas is None:
+                metricas = _metricas[pid] = Metricas()
+                threading.Thread(target=_loop_gravacao, name="metricas", daemon=True).start()
+    return metricas
+
+
+def contar(nome, valor=1, **rotulos):
+    obter_metricas().contar(nome, valor, **rotulos)
+
+
+def observar(nome, segundos, **rotulos):
+    obter_metricas().observar(nome, segundos, **rotulos)
+    if _coletores: # Vazio fora do perfil: custo de um teste de dict
+        anotacoes = _coletores.get(threading.get_ident())
+        if anotacoes is not None:
+            anotacoes.append(dict(rotulos, metrica=nome, segundos=round(segundos, 6)))
+
+
+@contextlib.contextmanager
+def medir(etapa, **rotulos):
+    """Mede o bloco no histograma cotacao_etapa_segundos{etapa=...} (também quando ele levanta exceção)."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        observar("cotacao_etapa_segundos", time.perf_counter() - inicio, etapa=etapa, **rotulos)
+
+
+@contextlib.contextmanager
+def coletar_observacoes():
+    """Durante o bloco, as observações feitas nesta thread também vão para a lista devolvida."""
+    anotacoes = []
+    _coletores[threading.get_ident()] = anotacoes
+    try:
+        yield anotacoes
+    finally:
+        _coletores.pop(threading.get_ident(), None)
+
+
+def registrar_fonte(funcao):
+    """Registra contadores já mantidos por outro módulo (ex: acertos de cache), lidos só na gravação."""
+    _fontes.append(funcao)
+
+
+def iniciar_instancia():
+    """Marca este processo (e os que ele criar) como servidor: as métricas passam a ser gravadas em
+    METRICAS_DIR/<pid>/, que começa vazio. Diretórios de instâncias que já terminaram são apagados.
+
+    Chamado no master antes de criar os workers (create_app, hook on_starting do gunicorn) e na
+    subida do asgi; num worker que já herdou a instância, não faz nada.
+    """
+    if os.environ.get(VARIAVEL_INSTANCIA):
+        return
+    instancia = str(os.getpid())
+    os.environ[VARIAVEL_INSTANCIA] = instancia
+    if os.path.isdir(METRICAS_DIR):
+        for entrada in os.scandir(METRICAS_DIR):
+            # O próprio diretório também: no container o master costuma ter sempre o mesmo pid
+            if entrada.is_dir() and entrada.name.isdigit() and (entrada.name == instancia or not _processo_vivo(int(entrada.name))):
+                shutil.rmtree(entrada.path, ignore_errors=True)
+    logging.info(f"{log_prefix} Métricas da instância {instancia} em {_diretorio_instancia()}.")
+
+
+def _diretorio_instancia():
+    """Diretório dos retratos da instância deste processo, ou None fora de um servidor."""
+    instancia = os.environ.get(VARIAVEL_INSTANCIA)
+    return os.path.join(METRICAS_DIR, instancia) if instancia else None
+
+
+def gravar():
+    """Grava o retrato deste worker em METRICAS_DIR/<instância>/<pid>.json (atômico). Fora de um servidor, não faz nada."""
+    diretorio = _diretorio_instancia()
+    if diretorio is None:
+        return
+    retrato = obter_metricas().retrato()
+    for fonte in _fontes:
+        try:
+            retrato["contadores"].extend([nome, sorted(rotulos.items()), valor] for nome, rotulos, valor in fonte())
+        except Exception as e:
+            logging.warning(f"{log_prefix} Fonte de métricas falhou: {e}")
+    os.makedirs(diretorio, exist_ok=True)
+    _gravar_json(os.path.join(diretorio, f"{os.getpid()}.json"), retrato)
+
+
+def _gravar_json(caminho, dados):
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(dados, f)
+    os.replace(temporario, caminho)
+
+
+def _loop_gravacao():
+    while True:
+        time.sleep(INTERVALO_GRAVACAO)
+        try:
+            gravar()
+        except Exception as e:
+            logging.warning(f"{log_prefix} Não foi possível gravar as métricas: {e}")
+
+
+def _processo_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True # Existe, mas é de outro usuário
+    return True
+
+
+def _rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _processos_soffice():
+    total = 0
+    for entrada in os.listdir("/proc"):
+        if entrada.isdigit():
+            try:
+                with open(f"/proc/{entrada}/comm") as f:
+                    if f.read().strip() in ("soffice.bin", "soffice"):
+                        total += 1
+            except OSError:
+                pass
+    return total
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatar_rotulos(rotulos):
+    if not rotulos:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in rotulos) + "}"
+
+
+def _acumular(retrato, contadores, histogramas):
+    for nome, rotulos, valor in retrato["contadores"]:
+        chave = (nome, tuple(tuple(r) for r in rotulos))
+        contadores[chave] = contadores.get(chave, 0) + valor
+    for nome, rotulos, valores in retrato["histogramas"]:
+        chave = (nome, tuple(tuple(r) for r in rotulos))
+        atual = histogramas.get(chave)
+        histogramas[chave] = list(valores) if atual is None else [a + b for a, b in zip(atual, valores)]
+
+
+def _ler_retratos(diretorio):
+    """Soma os retratos da instância. Os de workers mortos entram em mortos.json e são apagados.
+
+    Roda sob um flock: dois workers atendendo /metrics ao mesmo tempo não somam o mesmo morto duas vezes.
+    """
+    contadores, histogramas, pids = {}, {}, []
+    mortos_contadores, mortos_histogramas, mortos = {}, {}, []
+    os.makedirs(diretorio, exist_ok=True)
+    with open(os.path.join(diretorio, ARQUIVO_LOCK), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            caminho_mortos = os.path.join(diretorio, ARQUIVO_MORTOS)
+            with contextlib.suppress(OSError, ValueError):
+                with open(caminho_mortos, encoding="utf-8") as f:
+                    _acumular(json.load(f), mortos_contadores, mortos_histogramas)
+            for nome_arquivo in os.listdir(diretorio):
+                pid = nome_arquivo[:-5]
+                if not (nome_arquivo.endswith(".json") and pid.isdigit()):
+                    continue
+                caminho = os.path.join(diretorio, nome_arquivo)
+                try:
+                    with open(caminho, encoding="utf-8") as f:
+                        retrato = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if int(pid) != os.getpid() and not _processo_vivo(int(pid)):
+                    _acumular(retrato, mortos_contadores, mortos_histogramas)
+                    mortos.append(caminho)
+                else:
+                    _acumular(retrato, contadores, histogramas)
+                    pids.append(pid)
+            if mortos:
+                # Primeiro grava a soma, depois apaga: uma falha no meio nunca perde contagens
+                _gravar_json(caminho_mortos, {
+                    "contadores": [[nome, list(rotulos), valor] for (nome, rotulos), valor in mortos_contadores.items()],
+                    "histogramas": [[nome, list(rotulos), valores] for (nome, rotulos), valores in mortos_histogramas.items()],
+                })
+                for caminho in mortos:
+                    with contextlib.suppress(OSError):
+                        os.remove(caminho)
+                logging.info(f"{log_prefix} Retratos de {len(mortos)} worker(s) encerrado(s) somados a {ARQUIVO_MORTOS}.")
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    for chave, valor in mortos_contadores.items():
+        contadores[chave] = contadores.get(chave, 0) + valor
+    for chave, valores in mortos_histogramas.items():
+        atual = histogramas.get(chave)
+        histogramas[chave] = valores if atual is None else [a + b for a, b in zip(atual, valores)]
+    return contadores, histogramas, pids
+
+
+def exportar():
+    """Texto do /metrics (formato de exposição do Prometheus 0.0.4), somando todos os workers da instância."""
+    iniciar_instancia() # Quem atende /metrics é um servidor, mesmo que ninguém tenha chamado antes
+    gravar() # O retrato deste worker sai sempre atualizado
+    contadores, histogramas, pids = _ler_retratos(_diretorio_instancia())
+
+    linhas = []
+    for nome, (tipo, ajuda) in DESCRICOES.items():
+        linhas.append(f"# HELP {nome} {ajuda}")
+        linhas.append(f"# TYPE {nome} {tipo}")
+        if tipo == "counter":
+            for (nome_metrica, rotulos), valor in sorted(contadores.items()):
+                if nome_metrica == nome:
+                    linhas.append(f"{nome}{_formatar_rotulos(rotulos)} {valor}")
+        else:
+            for (nome_metrica, rotulos), valores in sorted(histogramas.items()):
+                if nome_metrica != nome:
+                    continue
+                acumulado = 0
+                for limite, contagem in zip(BALDES_SEGUNDOS + ("+Inf",), valores[:-1]):
+                    acumulado += contagem
+                    linhas.append(f"{nome}_bucket{_formatar_rotulos(rotulos + (('le', limite),))} {acumulado}")
+                linhas.append(f"{nome}_sum{_formatar_rotulos(rotulos)} {valores[-1]}")
+                linhas.append(f"{nome}_count{_formatar_rotulos(rotulos)} {acumulado}")
+
+    linhas.append("# HELP process_resident_memory_bytes Memória residente (RSS) de cada worker vivo.")
+    linhas.append("# TYPE process_resident_memory_bytes gauge")
+    for pid in sorted(pids):
+        rss = _rss_bytes(pid)
+        if rss is not None:
+            linhas.append(f'process_resident_memory_bytes{{pid="{pid}"}} {rss}')
+    linhas.append("# HELP soffice_processos Processos do LibreOffice (soffice) vivos no container.")
+    linhas.append("# TYPE soffice_processos gauge")
+    linhas.append(f"soffice_processos {_processos_soffice()}")
+    return "\n".join(linhas) + "\n"
+
+# ----- FIM DO CÓDIGO -----
@@ -0,0 +1,468 @@
+# ----- INÍCIO DO CÓDIGO PARA pdf_nativo.py -----
+# Motor de PDF "nativo": desenha a cotação direto em PDF, sem LibreOffice por requisição.
+#
+# O template é "compilado" UMA vez (python -m cotacao compile-native, no build da imagem):
+#   - o template é preenchido com todos os campos VAZIOS e convertido pelo LibreOffice;
+#   - cada página vira um JPEG de fundo (pdftoppm, pacote poppler-utils);
+#   - a posição/caixa de texto de cada campo de CAMPOS_COTACAO é lida do .pptx.
+# Por requisição só escrevemos um PDF pequeno: as imagens de fundo (bytes já prontos) e
+# os textos em Helvetica (mesmas métricas da Liberation Sans usada no template).
+#
+# Se um texto não puder ser desenhado (caractere fora do WinAnsi), renderizar_pdf_nativo
+# retorna None e quem chamou usa o caminho normal (pptx + LibreOffice). O mesmo vale se o
+# template mudou depois da compilação: o artefato guarda a versão (hash) do template de origem.
+import os
+import json
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+
+import numpy as np
+
+from preenche_cotacao import CAMPOS_COTACAO, obter_template, textos_cotacao, _normalizar_nome_shape
+
+log_prefix = "[pdf_nativo]"
+
+EXTENSAO_FUNDO = ".nativo.npz"
+VERSAO_FORMATO_FUNDO = 1
+RESOLUCAO_FUNDO_DPI = int(os.environ.get("PDF_NATIVO_DPI", "150"))
+QUALIDADE_JPEG = 90
+
+EMU_POR_PT = 12700
+# Liberation Sans (fonte do template) tem as mesmas larguras da Helvetica; ascendente/descendente dela:
+ASCENDENTE = 0.905
+ALTURA_LINHA = 1.117 # (ascendente + descendente), espaçamento simples do LibreOffice
+TAMANHO_FONTE_PADRAO = 18.0 # Tamanho herdado do master quando a shape não define outro
+
+# Larguras da Helvetica (AFM, unidades de 1/1000 do tamanho) para os códigos WinAnsi 32..255
+_LARGURAS_ASCII = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278, # ' '..'/'
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556, # '0'..'?'
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778, # '@'..'O'
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556, # 'P'..'_'
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556, # '`'..'o'
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584, 556, # 'p'..DEL
+]
+_LARGURAS_LATIN1 = [
+    278, 333, 556, 556, 556, 556, 260, 556, 333, 737, 370, 556, 584, 333, 737, 333, # 0xA0..0xAF
+    400, 584, 333, 333, 333, 556, 537, 278, 333, 333, 365, 556, 834, 834, 834, 611, # 0xB0..0xBF
+    667, 667, 667, 667, 667, 667, 1000, 722, 667, 667, 667, 667, 278, 278, 278, 278, # 0xC0..0xCF
+    722, 722, 778, 778, 778, 778, 778, 584, 778, 722, 722, 722, 722, 667, 667, 611, # 0xD0..0xDF
+    556, 556, 556, 556, 556, 556, 889, 500, 556, 556, 556, 556, 278, 278, 278, 278, # 0xE0..0xEF
+    556, 556, 556, 556, 556, 556, 556, 584, 611, 556, 556, 556, 556, 500, 556, 500, # 0xF0..0xFF
+]
+LARGURAS_HELVETICA = [0] * 32 + _LARGURAS_ASCII + [556] * 32 + _LARGURAS_LATIN1 # 0x80..0x9F: aspas, €, etc.
+
+
+def caminho_fundo(template_path):
+    """Caminho do artefato do motor nativo ao lado do template (cotacao_auto.pptx -> cotacao_auto.nativo.npz)."""
+    return os.path.splitext(template_path)[0] + EXTENSAO_FUNDO
+
+
+def _dimensoes_jpeg(dados):
+    """(largura, altura, componentes) lidos do marcador SOF do JPEG."""
+    pos = 2
+    while pos < len(dados):
+        marcador = dados[pos + 1]
+        tamanho = int.from_bytes(dados[pos + 2:pos + 4], "big")
+        if marcador in (0xC0, 0xC1, 0xC2):
+            altura = int.from_bytes(dados[pos + 5:pos + 7], "big")
+            largura = int.from_bytes(dados[pos + 7:pos + 9], "big")
+            return largura, altura, dados[pos + 9]
+        pos += 2 + tamanho
+    raise ValueError("JPEG sem marcador SOF")
+
+
+# --- Leitura do layout dos campos a partir do .pptx ---
+def _cor_tema(slide, nome):
+    """Resolve uma cor de esquema (tx1, bg1, accent1...) pelo tema do master do slide."""
+    from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+
+    mapa = {"tx1": "dk1", "tx2": "dk2", "bg1": "lt1", "bg2": "lt2"}
+    try:
+        tema = slide.slide_layout.slide_master.part.part_related_by(RT.THEME)
+    except KeyError:
+        return None
+    from lxml import etree
+    raiz = etree.fromstring(tema.blob)
+    ns = {"a": "http://schemas.openxmlformats.org/drawingml/2006/main"}
+    cor = raiz.find(f".//a:clrScheme/a:{mapa.get(nome, nome)}", ns)
+    if cor is None or len(cor) == 0:
+        return None
+    return _cor_de_elemento(slide, cor[0])
+
+
+def _cor_de_elemento(slide, elemento):
+    nome = elemento.tag.rsplit("}", 1)[-1]
+    if nome == "srgbClr":
+        valor = elemento.get("val")
+    elif nome == "sysClr":
+        valor = elemento.get("lastClr")
+    elif nome == "schemeClr":
+        return _cor_tema(slide, elemento.get("val"))
+    else:
+        return None
+    if not valor or len(valor) != 6:
+        return None
+    return tuple(int(valor[i:i + 2], 16) / 255 for i in (0, 2, 4))
+
+
+def _cor_texto(slide, shape):
+    """Cor do texto herdada pela shape (lstStyle ou estilo da shape); preto se não houver."""
+    ns = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+    candidatos = shape._element.findall(f".//{ns}lstStyle/{ns}lvl1pPr/{ns}defRPr/{ns}solidFill")
+    candidatos += shape._element.findall(".//{http://schemas.openxmlformats.org/presentationml/2006/main}style/"
+                                         f"{ns}fontRef")
+    for candidato in candidatos:
+        for filho in candidato:
+            cor = _cor_de_elemento(slide, filho)
+            if cor is not None:
+                return cor
+    return (0.0, 0.0, 0.0)
+
+
+def layout_campos(template):
+    """Caixa de texto, fonte e alinhamento de cada campo de CAMPOS_COTACAO (em pontos, origem no topo)."""
+    from pptx.enum.text import PP_ALIGN
+
+    prs = template.abrir()
+    ns = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+    campos = []
+    for slide_index, nome_shape, chave, opcoes in CAMPOS_COTACAO:
+        encontrada = template.indice.get((slide_index, _normalizar_nome_shape(nome_shape)))
+        if encontrada is None or not encontrada[2]:
+            logging.warning(f"{log_prefix} Campo '{nome_shape}' (slide {slide_index+1}) sem caixa de texto. Ignorado.")
+            continue
+        slide = prs.slides[slide_index]
+        shape = slide.shapes[encontrada[0]]
+        body_pr = shape.text_frame._txBody.bodyPr
+        def_rpr = shape._element.find(f".//{ns}lstStyle/{ns}lvl1pPr/{ns}defRPr")
+        tamanho_vazio = int(def_rpr.get("sz")) / 100 if def_rpr is not None and def_rpr.get("sz") else TAMANHO_FONTE_PADRAO
+        alinhamento = opcoes.get("alignment", PP_ALIGN.LEFT)
+        campos.append({
+            "pagina": slide_index,
+            "chave": chave,
+            "x": shape.left / EMU_POR_PT, "y": shape.top / EMU_POR_PT,
+            "largura": shape.width / EMU_POR_PT, "altura": shape.height / EMU_POR_PT,
+            "margens": [int(body_pr.get(lado, padrao)) / EMU_POR_PT for lado, padrao in
+                        (("lIns", 91440), ("tIns", 45720), ("rIns", 91440), ("bIns", 45720))],
+            "ancora": body_pr.get("anchor", "t"),
+            "quebra": body_pr.get("wrap", "square") != "none",
+            "tamanho": float(opcoes.get("font_size", 22)), # Padrão do set_text
+            # set_text deixa um parágrafo vazio antes do texto (text_frame.clear() + add_paragraph())
+            "tamanho_linha_vazia": tamanho_vazio,
+            "alinhamento": {PP_ALIGN.CENTER: "centro", PP_ALIGN.RIGHT: "direita"}.get(alinhamento, "esquerda"),
+            "negrito": bool(opcoes.get("is_warning")),
+            "cor": [192 / 255, 0.0, 0.0] if opcoes.get("is_warning") else list(_cor_texto(slide, shape)),
+        })
+    return {"largura": prs.slide_width / EMU_POR_PT, "altura": prs.slide_height / EMU_POR_PT,
+            "n_paginas": template.n_slides, "campos": campos}
+
+
+def _rasterizar_pdf(pdf_bytes, dpi, formato="jpeg"):
+    """Páginas de um PDF como arquivos de imagem (bytes), via pdftoppm."""
+    temp_dir = tempfile.mkdtemp(prefix="cotacao_nativo_")
+    try:
+        pdf_path = os.path.join(temp_dir, "base.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(pdf_bytes)
+        cmd = ["pdftoppm", "-r", str(dpi)]
+        cmd += ["-jpeg", "-jpegopt", f"quality={QUALIDADE_JPEG}"] if formato == "jpeg" else ["-gray"]
+        subprocess.run(cmd + [pdf_path, os.path.join(temp_dir, "pagina")], check=True, timeout=120,
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        nomes = sorted((n for n in os.listdir(temp_dir) if n.startswith("pagina")),
+                       key=lambda n: int(n.rsplit("-", 1)[1].split(".")[0]))
+        paginas = []
+        for nome in nomes:
+            with open(os.path.join(temp_dir, nome), "rb") as f:
+                paginas.append(f.read())
+        return paginas
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def pdf_template_vazio(template_path):
+    """(layout dos campos, PDF do template com todos os campos vazios) - convertido pelo LibreOffice."""
+    from converte_pdf import converter_pptx_bytes_para_pdf # Só na compilação: o motor nativo não usa LibreOffice
+
+    template = obter_template(template_path)
+    layout = layout_campos(template)
+    vazios = {campo["chave"]: "" for campo in layout["campos"]}
+    pdf_vazio = converter_pptx_bytes_para_pdf(template.renderizador_rapido().renderizar(vazios))
+    if not pdf_vazio:
+        raise RuntimeError("LibreOffice não converteu o template vazio para PDF.")
+    return layout, pdf_vazio
+
+
+def compilar_fundo_nativo(template_path, saida=None, dpi=RESOLUCAO_FUNDO_DPI):
+    """Gera o artefato do motor nativo (fundos JPEG + layout dos campos). Precisa de LibreOffice e pdftoppm."""
+    saida = saida or caminho_fundo(template_path)
+    versao_template = obter_template(template_path).versao
+    layout, pdf_vazio = pdf_template_vazio(template_path)
+    paginas = _rasterizar_pdf(pdf_vazio, dpi)
+    if len(paginas) != layout["n_paginas"]:
+        raise RuntimeError(f"PDF do template tem {len(paginas)} páginas; esperado {layout['n_paginas']}.")
+
+    arrays = {f"pagina_{i}": np.frombuffer(jpeg, dtype=np.uint8) for i, jpeg in enumerate(paginas)}
+    temporario = f"{saida}.tmp.{os.getpid()}.npz"
+    np.savez(temporario, versao_formato=np.array(VERSAO_FORMATO_FUNDO), versao_template=np.array(versao_template),
+             layout=np.frombuffer(json.dumps(layout).encode("utf-8"), dtype=np.uint8), **arrays)
+    os.replace(temporario, saida)
+    logging.info(f"{log_prefix} Fundo nativo gravado em '{saida}' ({len(paginas)} páginas, {dpi} dpi).")
+    return saida
+
+
+# --- Escrita do PDF ---
+def _texto_pdf(texto_bytes):
+    """String literal PDF: escapa \\, ( e )."""
+    return b"(" + texto_bytes.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _largura(texto_bytes, tamanho):
+    return sum(LARGURAS_HELVETICA[b] for b in texto_bytes) * tamanho / 1000
+
+
+def _quebrar_linhas(texto_bytes, tamanho, largura_max):
+    """Quebra por palavras como a caixa de texto do LibreOffice (palavra maior que a linha fica sozinha)."""
+    linhas = []
+    atual = b""
+    for palavra in texto_bytes.split(b" "):
+        candidata = atual + b" " + palavra if atual else palavra
+        if atual and _largura(candidata, tamanho) > largura_max:
+            linhas.append(atual)
+            atual = palavra
+        else:
+            atual = candidata
+    linhas.append(atual)
+    return linhas
+
+
+def operacoes_texto(campo, texto, altura_pagina, fonte_normal=b"/F1", fonte_negrito=b"/F2"):
+    """Operadores PDF que desenham 'texto' na caixa do campo (coordenadas do slide, em pontos).
+
+    Retorna b"" para texto vazio e None se o texto não puder ser desenhado em WinAnsi.
+    """
+    if not texto:
+        return b""
+    if any(c < " " for c in texto):
+        return None # Quebras de linha/controle: deixa o LibreOffice tratar
+    try:
+        texto_bytes = texto.encode("cp1252")
+    except UnicodeEncodeError:
+        return None
+    tamanho = campo["tamanho"]
+    margem_esq, margem_topo, margem_dir, margem_base = campo["margens"]
+    largura_util = campo["largura"] - margem_esq - margem_dir
+    linhas = _quebrar_linhas(texto_bytes, tamanho, largura_util) if campo["quebra"] else [texto_bytes]
+
+    altura_vazia = campo["tamanho_linha_vazia"] * ALTURA_LINHA
+    altura_texto = altura_vazia + len(linhas) * tamanho * ALTURA_LINHA
+    if campo["ancora"] == "ctr":
+        topo = campo["y"] + margem_topo + (campo["altura"] - margem_topo - margem_base - altura_texto) / 2
+    elif campo["ancora"] == "b":
+        topo = campo["y"] + campo["altura"] - margem_base - altura_texto
+    else:
+        topo = campo["y"] + margem_topo
+
+    fonte = fonte_negrito if campo["negrito"] else fonte_normal
+    ops = [b"BT %s %.2f Tf %.4f %.4f %.4f rg" % ((fonte, tamanho) + tuple(campo["cor"]))]
+    for n, linha in enumerate(linhas):
+        x = campo["x"] + margem_esq
+        if campo["alinhamento"] != "esquerda":
+            sobra = largura_util - _largura(linha, tamanho)
+            x += sobra / 2 if campo["alinhamento"] == "centro" else sobra
+        base = topo + altura_vazia + n * tamanho * ALTURA_LINHA + ASCENDENTE * tamanho
+        ops.append(b"1 0 0 1 %.2f %.2f Tm %s Tj" % (x, altura_pagina - base, _texto_pdf(linha)))
+    ops.append(b"ET")
+    return b"\n".join(ops)
+
+
+class FundoNativo:
+    """Artefato do motor nativo carregado: objetos fixos do PDF (fontes, imagens) já serializados."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.mtime = os.stat(caminho).st_mtime_ns
+        with np.load(caminho) as dados:
+            versao = int(dados["versao_formato"])
+            if versao != VERSAO_FORMATO_FUNDO:
+                raise ValueError(f"Artefato nativo '{caminho}' tem formato {versao}; esperado {VERSAO_FORMATO_FUNDO}.")
+            # Artefatos compilados antes de a versão ser gravada: nunca batem com o template
+            self.versao_template = str(dados["versao_template"]) if "versao_template" in dados.files else None
+            self.layout = json.loads(dados["layout"].tobytes().decode("utf-8"))
+            paginas = [dados[f"pagina_{i}"].tobytes() for i in range(self.layout["n_paginas"])]
+
+        self.largura = self.layout["largura"]
+        self.altura = self.layout["altura"]
+        self.campos_por_pagina = [[] for _ in paginas]
+        for campo in self.layout["campos"]:
+            self.campos_por_pagina[campo["pagina"]].append(campo)
+
+        # Objetos 1 (catálogo) e 2 (árvore de páginas) são escritos por requisição; 3..4 fontes; 5.. imagens
+        self.objetos_fixos = [
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+        ]
+        for jpeg in paginas:
+            largura, altura, componentes = _dimensoes_jpeg(jpeg)
+            espaco = b"/DeviceGray" if componentes == 1 else b"/DeviceRGB"
+            self.objetos_fixos.append(
+                b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s /BitsPerComponent 8 "
+                b"/Filter /DCTDecode /Length %d >>\nstream\n" % (largura, altura, espaco, len(jpeg)) + jpeg + b"\nendstream")
+        self.primeiro_objeto_pagina = 3 + len(self.objetos_fixos)
+
+        # Cabeçalho + objetos fixos serializados uma vez, com os offsets já conhecidos
+        corpo = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self.offsets_fixos = []
+        for numero, objeto in enumerate(self.objetos_fixos, start=3):
+            self.offsets_fixos.append(len(corpo))
+            corpo += b"%d 0 obj\n" % numero + objeto + b"\nendobj\n"
+        self.bloco_fixo = bytes(corpo)
+
+    def _conteudo_pagina(self, indice, textos):
+        """Stream de conteúdo da página: fundo + textos. None se algum texto não couber no WinAnsi."""
+        ops = [b"q %.4f 0 0 %.4f 0 0 cm /Im0 Do Q" % (self.largura, self.altura)]
+        for campo in self.campos_por_pagina[indice]:
+            texto_ops = operacoes_texto(campo, textos.get(campo["chave"], ""), self.altura)
+            if texto_ops is None:
+                return None
+            if texto_ops:
+                ops.append(texto_ops)
+        return b"\n".join(ops)
+
+    def renderizar(self, textos):
+        """Bytes do PDF da cotação, ou None se algum texto exigir o caminho pptx + LibreOffice."""
+        conteudos = []
+        for indice in range(len(self.campos_por_pagina)):
+            conteudo = self._conteudo_pagina(indice, textos)
+            if conteudo is None:
+                return None
+            conteudos.append(conteudo)
+
+        saida = bytearray(self.bloco_fixo)
+        offsets = list(self.offsets_fixos)
+        kids = []
+        numero = self.primeiro_objeto_pagina
+        for indice, conteudo in enumerate(conteudos):
+            pagina, stream = numero, numero + 1
+            kids.append(b"%d 0 R" % pagina)
+            offsets.append(len(saida))
+            saida += (b"%d 0 obj\n<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.4f %.4f] /Contents %d 0 R "
+                      b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> /XObject << /Im0 %d 0 R >> >> >>\nendobj\n"
+                      % (pagina, self.largura, self.altura, stream, 5 + indice))
+            offsets.append(len(saida))
+            saida += b"%d 0 obj\n<< /Length %d >>\nstream\n" % (stream, len(conteudo)) + conteudo + b"\nendstream\nendobj\n"
+            numero += 2
+
+        offset_catalogo = len(saida)
+        saida += b"1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n"
+        offset_paginas = len(saida)
+        saida += b"2 0 obj\n<< /Type /Pages /Kids [%s] /Count %d >>\nendobj\n" % (b" ".join(kids), len(kids))
+
+        inicio_xref = len(saida)
+        total = numero
+        saida += b"xref\n0 %d\n0000000000 65535 f \n" % total
+        saida += b"%010d 00000 n \n" % offset_catalogo
+        saida += b"%010d 00000 n \n" % offset_paginas
+        for offset in offsets:
+            saida += b"%010d 00000 n \n" % offset
+        saida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (total, inicio_xref)
+        return bytes(saida)
+
+
+_fundos = {}
+_fundos_lock = threading.Lock()
+_avisos_desatualizado = set() # (artefato, versão do template) já avisados neste processo
+
+
+def obter_fundo(template_path):
+    """FundoNativo do template (carregado uma vez por processo; recarrega se o artefato mudar).
+
+    None se o artefato não existir ou tiver sido compilado a partir de outra versão do template
+    (o template é recarregado pelo mtime; o fundo antigo mostraria os slides de antes).
+    """
+    caminho = caminho_fundo(template_path)
+    try:
+        mtime = os.stat(caminho).st_mtime_ns
+    except OSError:
+        return None
+    fundo = _fundos.get(caminho)
+    if fundo is None or fundo.mtime != mtime:
+        with _fundos_lock:
+            fundo = _fundos.get(caminho)
+            if fundo is None or fundo.mtime != mtime:
+                fundo = FundoNativo(caminho)
+                _fundos[caminho] = fundo
+                logging.info(f"{log_prefix} Fundo nativo carregado: {caminho}")
+    versao_template = obter_template(template_path).versao
+    if fundo.versao_template != versao_template:
+        if (caminho, versao_template) not in _avisos_desatualizado:
+            _avisos_desatualizado.add((caminho, versao_template))
+            logging.warning(f"{log_prefix} Artefato '{caminho}' foi compilado de outra versão do template "
+                            f"({fundo.versao_template or 'desconhecida'}; atual {versao_template}). Usando LibreOffice "
+                            f"até rodar 'python -m cotacao compile-native' de novo.")
+        return None
+    return fundo
+
+
+def motor_nativo_disponivel(template_path):
+    return os.path.exists(caminho_fundo(template_path))
+
+
+def renderizar_pdf_nativo(template_path, dados_cotacao):
+    """PDF da cotação (bytes) pelo motor nativo, ou None se o artefato não existir ou o texto não for suportado."""
+    try:
+        fundo = obter_fundo(template_path)
+        if fundo is None:
+            if not motor_nativo_disponivel(template_path): # Desatualizado: obter_fundo já avisou
+                logging.warning(f"{log_prefix} Artefato '{caminho_fundo(template_path)}' não encontrado. "
+                                f"Rode 'python -m cotacao compile-native'.")
+            return None
+        pdf_bytes = fundo.renderizar(textos_cotacao(dados_cotacao))
+        if pdf_bytes is None:
+            logging.info(f"{log_prefix} Texto não suportado pelo motor nativo. Usando LibreOffice.")
+        return pdf_bytes
+    except Exception as e:
+        logging.error(f"{log_prefix} Erro no motor nativo: {e}. Usando LibreOffice.")
+        return None
+
+
+# --- Comparação visual com o LibreOffice ---
+def _ler_pgm(dados):
+    """Imagem PGM binária (P5, 8 bits) como array numpy (altura, largura)."""
+    partes = dados.split(maxsplit=4)
+    if partes[0] != b"P5":
+        raise ValueError("Esperado PGM binário (P5)")
+    largura, altura = int(partes[1]), int(partes[2])
+    return np.frombuffer(partes[4][:largura * altura], dtype=np.uint8).reshape(altura, largura)
+
+
+def _escrever_pgm(caminho, imagem):
+    with open(caminho, "wb") as f:
+        f.write(b"P5\n%d %d\n255\n" % (imagem.shape[1], imagem.shape[0]) + imagem.tobytes())
+
+
+def comparar_visual(pdf_referencia, pdf_nativo, dpi=50, limiar=32, saida_dir=None):
+    """Compara os dois PDFs página a página (tons de cinza, pdftoppm).
+
+    Retorna uma lista por página com a diferença média (0..255) e a fração de pixels que
+    diferem mais que 'limiar'. Se saida_dir for dado, grava as imagens de diferença (.pgm).
+    """
+    ref = [_ler_pgm(p) for p in _rasterizar_pdf(pdf_referencia, dpi, formato="pgm")]
+    nat = [_ler_pgm(p) for p in _rasterizar_pdf(pdf_nativo, dpi, formato="pgm")]
+    if len(ref) != len(nat):
+        raise ValueError(f"Número de páginas diferente: LibreOffice {len(ref)}, nativo {len(nat)}.")
+    resultado = []
+    for i, (a, b) in enumerate(zip(ref, nat), start=1):
+        altura, largura = min(a.shape[0], b.shape[0]), min(a.shape[1], b.shape[1])
+        diferenca = np.abs(a[:altura, :largura].astype(np.int16) - b[:altura, :largura].astype(np.int16)).astype(np.uint8)
+        resultado.append({"pagina": i, "diferenca_media": float(diferenca.mean()),
+                          "pixels_diferentes": float((diferenca > limiar).mean())})
+        if saida_dir:
+            os.makedirs(saida_dir, exist_ok=True)
+            _escrever_pgm(os.path.join(saida_dir, f"diferenca_{i}.pgm"), 255 - diferenca)
+    return resultado
+
+# ----- FIM DO CÓDIGO -----
@@ -0,0 +1,407 @@
+# ----- INÍCIO DO CÓDIGO PARA pdf_sobreposicao.py -----
+# Modo "sobreposição": o template vazio é convertido para PDF UMA vez (LibreOffice) e cada
+# cotação só carimba os textos por cima dessa base.
+#
+# Nada do PDF base é reescrito por requisição. Usamos atualizações incrementais do PDF
+# (objetos novos acrescentados no fim do arquivo, com uma nova tabela xref apontando para a anterior):
+#   1. base preparada (uma vez): PDF do LibreOffice + fontes Helvetica + streams "q"/"Q" e, para
+#      cada página com campos, o dicionário de recursos já mesclado com as fontes;
+#   2. por requisição: base preparada + um stream de texto e uma nova versão do objeto de cada
+#      página que tem campos. Imagens, fontes e desenhos do template são compartilhados.
+import os
+import re
+import time
+import logging
+import threading
+
+from pdf_nativo import layout_campos, operacoes_texto, pdf_template_vazio
+from preenche_cotacao import obter_template, textos_cotacao
+
+log_prefix = "[pdf_sobreposicao]"
+
+EXTENSAO_BASE = ".base.pdf"
+FONTE_NORMAL = b"/FCot1" # Nomes próprios para não colidir com as fontes do LibreOffice
+FONTE_NEGRITO = b"/FCot2"
+# Depois de uma falha ao preparar o PDF base, as cotações vão direto para o LibreOffice por este tempo
+ESPERA_APOS_FALHA = float(os.environ.get("SOBREPOSICAO_ESPERA_FALHA", "60")) # segundos
+
+
+class BaseIndisponivel(Exception):
+    """PDF base em preparação por outra requisição ou com falha recente: usar o LibreOffice."""
+
+
+def caminho_base(template_path):
+    """PDF base ao lado do template (cotacao_auto.pptx -> cotacao_auto.base.pdf)."""
+    return os.path.splitext(template_path)[0] + EXTENSAO_BASE
+
+
+# --- Leitura mínima de PDF (xref clássica, suficiente para o PDF do LibreOffice) ---
+class Ref(tuple):
+    """Referência indireta 'N G R'."""
+
+    def __new__(cls, numero, geracao=0):
+        return super().__new__(cls, (numero, geracao))
+
+
+class Nome(bytes):
+    """Nome PDF (sem a barra), mantido como no arquivo."""
+
+
+class Bruto(bytes):
+    """Número, string, booleano ou null: copiado byte a byte do arquivo original."""
+
+
+_ESPACOS = b" \t\r\n\x0c\x00"
+_TOKEN = re.compile(rb"[^\s()<>\[\]{}/%]+")
+_REFERENCIA = re.compile(rb"\s+(\d+)\s+R(?=[\s()<>\[\]{}/%]|$)")
+_INICIO_OBJETO = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj")
+_SUBSECAO_XREF = re.compile(rb"(\d+)\s+(\d+)")
+_ENTRADA_XREF = re.compile(rb"(\d{10}) (\d{5}) ([nf])")
+
+
+def _pular_espacos(dados, pos):
+    tamanho = len(dados)
+    while pos < tamanho:
+        c = dados[pos]
+        if c in _ESPACOS:
+            pos += 1
+        elif c == 0x25: # comentário '%'
+            while pos < tamanho and dados[pos] not in b"\r\n":
+                pos += 1
+        else:
+            break
+    return pos
+
+
+def _ler_objeto(dados, pos):
+    """Lê um objeto PDF a partir de 'pos'. Retorna (valor, nova posição)."""
+    pos = _pular_espacos(dados, pos)
+    if dados.startswith(b"<<", pos):
+        resultado = {}
+        pos += 2
+        while True:
+            pos = _pular_espacos(dados, pos)
+            if dados.startswith(b">>", pos):
+                return resultado, pos + 2
+            chave, pos = _ler_objeto(dados, pos)
+            valor, pos = _ler_objeto(dados, pos)
+            resultado[bytes(chave)] = valor
+    c = dados[pos:pos + 1]
+    if c == b"[":
+        resultado = []
+        pos += 1
+        while True:
+            pos = _pular_espacos(dados, pos)
+            if dados.startswith(b"]", pos):
+                return resultado, pos + 1
+            valor, pos = _ler_objeto(dados, pos)
+            resultado.append(valor)
+    if c == b"/":
+        m = _TOKEN.match(dados, pos + 1)
+        fim = m.end() if m else pos + 1
+        return Nome(dados[pos + 1:fim]), fim
+    if c == b"(":
+        profundidade, fim = 0, pos
+        while True:
+            b = dados[fim]
+            if b == 0x5C: # '\\' escapa o próximo byte
+                fim += 2
+                continue
+            if b == 0x28:
+                profundidade += 1
+            elif b == 0x29:
+                profundidade -= 1
+                if profundidade == 0:
+                    return Bruto(dados[pos:fim + 1]), fim + 1
+            fim += 1
+    if c == b"<":
+        fim = dados.index(b">", pos)
+        return Bruto(dados[pos:fim + 1]), fim + 1
+    m = _TOKEN.match(dados, pos)
+    if not m:
+        raise ValueError(f"Objeto PDF inválido na posição {pos}")
+    token = m.group(0)
+    if token.isdigit():
+        # Pode ser o início de uma referência "N G R"
+        ref = _REFERENCIA.match(dados, m.end())
+        if ref:
+            return Ref(int(token), int(ref.group(1))), ref.end()
+    return Bruto(token), m.end()
+
+
+def _serializar(valor):
+    if isinstance(valor, dict):
+        return b"<<" + b"".join(b"/" + chave + b" " + _serializar(v) for chave, v in valor.items()) + b">>"
+    if isinstance(valor, list):
+        return b"[" + b" ".join(_serializar(v) for v in valor) + b"]"
+    if isinstance(valor, Ref):
+        return b"%d %d R" % valor
+    if isinstance(valor, Nome):
+        return b"/" + valor
+    return bytes(valor)
+
+
+class LeitorPDF:
+    """Acesso aos objetos de um PDF pela tabela xref clássica (inclusive com atualizações incrementais)."""
+
+    def __init__(self, dados):
+        self.dados = dados
+        inicio = dados.rfind(b"startxref")
+        if inicio < 0:
+            raise ValueError("PDF sem 'startxref'")
+        self.startxref = int(re.match(rb"\s*(\d+)", dados[inicio + 9:]).group(1))
+        self.offsets = {}
+        self.trailer = None
+        pos = self.startxref
+        while pos is not None:
+            if not dados.startswith(b"xref", pos):
+                raise ValueError("PDF com xref comprimida (xref stream) não é suportado")
+            pos += 4
+            while True:
+                pos = _pular_espacos(dados, pos)
+                if dados.startswith(b"trailer", pos):
+                    break
+                m = _SUBSECAO_XREF.match(dados, pos)
+                primeiro, quantidade = int(m.group(1)), int(m.group(2))
+                pos = m.end()
+                for i in range(quantidade):
+                    pos = _pular_espacos(dados, pos)
+                    entrada = _ENTRADA_XREF.match(dados, pos)
+                    pos = entrada.end()
+                    # Seções mais novas vêm primeiro: a primeira ocorrência de cada objeto vale
+                    self.offsets.setdefault(primeiro + i, int(entrada.group(1)) if entrada.group(3) == b"n" else None)
+            trailer, pos = _ler_objeto(dados, pos + 7)
+            if self.trailer is None:
+                self.trailer = trailer
+            pos = int(trailer[b"Prev"]) if b"Prev" in trailer else None
+
+    def objeto(self, numero):
+        offset = self.offsets.get(numero)
+        if offset is None:
+            raise ValueError(f"Objeto {numero} não encontrado no PDF")
+        m = _INICIO_OBJETO.match(self.dados, offset)
+        return _ler_objeto(self.dados, m.end())[0]
+
+    def resolver(self, valor):
+        return self.objeto(valor[0]) if isinstance(valor, Ref) else valor
+
+    def paginas(self):
+        """Lista de (Ref da página, dicionário, recursos herdados, MediaBox herdada), na ordem do documento."""
+        raiz = self.resolver(self.trailer[b"Root"])
+        resultado = []
+
+        def visitar(ref, herdados):
+            no = self.objeto(ref[0])
+            herdados = dict(herdados)
+            for chave in (b"Resources", b"MediaBox"):
+                if chave in no:
+                    herdados[chave] = no[chave]
+            if no.get(b"Type") == b"Pages":
+                for filho in self.resolver(no[b"Kids"]):
+                    visitar(filho, herdados)
+            else:
+                resultado.append((ref, no, herdados.get(b"Resources", {}), herdados.get(b"MediaBox")))
+
+        visitar(raiz[b"Pages"], {})
+        return resultado
+
+
+def _tabela_xref(entradas):
+    """Seções xref (uma por objeto) para [(número, geração, offset)]."""
+    partes = [b"xref\n"]
+    for numero, geracao, offset in sorted(entradas):
+        partes.append(b"%d 1\n%010d %05d n \n" % (numero, offset, geracao))
+    return b"".join(partes)
+
+
+class BaseSobreposicao:
+    """PDF base do template (campos vazios) preparado para receber os textos de cada cotação."""
+
+    def __init__(self, pdf_base, layout):
+        leitor = LeitorPDF(pdf_base)
+        paginas = leitor.paginas()
+        if len(paginas) != layout["n_paginas"]:
+            raise ValueError(f"PDF base tem {len(paginas)} páginas; o template tem {layout['n_paginas']}.")
+
+        saida = bytearray(pdf_base if pdf_base.endswith(b"\n") else pdf_base + b"\n")
+        proximo = int(leitor.trailer[b"Size"])
+        entradas = []
+
+        def novo_objeto(conteudo):
+            nonlocal proximo
+            numero = proximo
+            proximo += 1
+            entradas.append((numero, 0, len(saida)))
+            saida.extend(b"%d 0 obj\n" % numero + conteudo + b"\nendobj\n")
+            return numero
+
+        # Fontes e os streams que isolam o estado gráfico do conteúdo original ("q" ... "Q")
+        fonte_normal = novo_objeto(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        fonte_negrito = novo_objeto(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+        stream_q = novo_objeto(b"<< /Length 1 >>\nstream\nq\nendstream")
+        stream_Q = novo_objeto(b"<< /Length 1 >>\nstream\nQ\nendstream")
+
+        campos_por_pagina = [[] for _ in paginas]
+        for campo in layout["campos"]:
+            campos_por_pagina[campo["pagina"]].append(campo)
+
+        # Para cada página com campos: início do novo objeto da página (tudo menos o stream do texto)
+        self.paginas = []
+        for (ref, pagina, recursos, mediabox), campos in zip(paginas, campos_por_pagina):
+            if not campos:
+                continue
+            recursos = dict(leitor.resolver(recursos))
+            fontes = dict(leitor.resolver(recursos.get(b"Font", {})))
+            fontes[FONTE_NORMAL[1:]] = Ref(fonte_normal)
+            fontes[FONTE_NEGRITO[1:]] = Ref(fonte_negrito)
+            recursos[b"Font"] = fontes
+
+            conteudos = pagina.get(b"Contents", [])
+            if isinstance(conteudos, Ref):
+                # Referência a um stream (o caso comum) ou a um array de streams
+                resolvido = leitor.objeto(conteudos[0])
+                conteudos = resolvido if isinstance(resolvido, list) else [conteudos]
+            novo = {chave: valor for chave, valor in pagina.items() if chave not in (b"Contents", b"Resources")}
+            novo[b"MediaBox"] = leitor.resolver(mediabox)
+            novo[b"Resources"] = recursos
+            prefixo = _serializar(novo)[:-2] + b"/Contents [" + _serializar([Ref(stream_q)] + conteudos + [Ref(stream_Q)])[1:-1]
+
+            # Coordenadas do slide (pontos, layout do .pptx) -> espaço da página do PDF
+            x0, y0, x1, y1 = (float(v) for v in novo[b"MediaBox"])
+            escala_x, escala_y = (x1 - x0) / layout["largura"], (y1 - y0) / layout["altura"]
+            transformacao = b"q %.6f 0 0 %.6f %.4f %.4f cm\n" % (escala_x, escala_y, x0, y0)
+            self.paginas.append((ref, prefixo, transformacao, campos))
+
+        inicio_xref = len(saida)
+        saida += _tabela_xref(entradas)
+        self.trailer_extra = b"".join(b"/" + chave + b" " + _serializar(leitor.trailer[chave])
+                                      for chave in (b"Root", b"Info", b"ID") if chave in leitor.trailer)
+        saida += b"trailer\n<< /Size %d /Prev %d %s >>\nstartxref\n%d\n%%%%EOF\n" % (
+            proximo, leitor.startxref, self.trailer_extra, inicio_xref)
+        self.dados = bytes(saida)
+        self.startxref = inicio_xref
+        self.proximo = proximo
+        self.altura = layout["altura"]
+
+    def renderizar(self, textos):
+        """Bytes do PDF com os textos carimbados, ou None se algum texto não couber no WinAnsi."""
+        saida = bytearray(self.dados)
+        entradas = []
+        proximo = self.proximo
+        for ref, prefixo, transformacao, campos in self.paginas:
+            ops = [transformacao]
+            for campo in campos:
+                texto_ops = operacoes_texto(campo, textos.get(campo["chave"], ""), self.altura, FONTE_NORMAL, FONTE_NEGRITO)
+                if texto_ops is None:
+                    return None
+                ops.append(texto_ops)
+            conteudo = b"\n".join(ops) + b"\nQ"
+
+            stream = proximo
+            proximo += 1
+            entradas.append((stream, 0, len(saida)))
+            saida += b"%d 0 obj\n<< /Length %d >>\nstream\n" % (stream, len(conteudo)) + conteudo + b"\nendstream\nendobj\n"
+            entradas.append((ref[0], ref[1], len(saida)))
+            saida += b"%d %d obj\n" % ref + prefixo + b" %d 0 R]>>\nendobj\n" % stream
+
+        inicio_xref = len(saida)
+        saida += _tabela_xref(entradas)
+        saida += b"trailer\n<< /Size %d /Prev %d %s >>\nstartxref\n%d\n%%%%EOF\n" % (
+            proximo, self.startxref, self.trailer_extra, inicio_xref)
+        return bytes(saida)
+
+
+_bases = {} # template_path -> (TemplateCotacao, BaseSobreposicao)
+_preparos = {} # template_path -> TemplateCotacao cuja base está sendo preparada agora
+_falhas = {} # template_path -> (TemplateCotacao, time.monotonic() até quando não tentar de novo)
+_bases_lock = threading.Lock() # Só protege os dicionários: a conversão roda fora dele
+
+
+def _preparar_base(template_path, template):
+    """BaseSobreposicao a partir do PDF base em disco, se estiver atualizado e válido; senão converte o
+    template vazio pelo LibreOffice e grava o PDF base (os outros workers passam a ler do disco)."""
+    layout = layout_campos(template)
+    caminho = caminho_base(template_path)
+    try:
+        if os.stat(caminho).st_mtime_ns >= os.stat(template_path).st_mtime_ns:
+            with open(caminho, "rb") as f:
+                return BaseSobreposicao(f.read(), layout)
+    except OSError:
+        pass
+    except Exception as e:
+        logging.warning(f"{log_prefix} PDF base em disco inválido ({e}). Convertendo de novo.")
+
+    logging.info(f"{log_prefix} Convertendo o template vazio para o PDF base: {caminho}")
+    _, pdf_base = pdf_template_vazio(template_path)
+    base = BaseSobreposicao(pdf_base, layout) # Só grava no disco um PDF que conseguimos preparar
+    temporario = f"{caminho}.tmp.{os.getpid()}"
+    with open(temporario, "wb") as f:
+        f.write(pdf_base)
+    os.replace(temporario, caminho)
+    return base
+
+
+def obter_base(template_path):
+    """BaseSobreposicao do template (preparada uma vez por processo; refeita se o template mudar).
+
+    Só uma requisição prepara a base (o que pode exigir uma conversão pelo LibreOffice); as que
+    chegam enquanto isso, ou até ESPERA_APOS_FALHA segundos depois de uma falha, recebem
+    BaseIndisponivel na hora, em vez de esperar numa fila ou converter a base de novo.
+    """
+    template = obter_template(template_path)
+    base = _bases.get(template_path)
+    if base is not None and base[0] is template:
+        return base[1]
+    with _bases_lock:
+        base = _bases.get(template_path)
+        if base is not None and base[0] is template:
+            return base[1]
+        falha = _falhas.get(template_path)
+        if falha is not None and falha[0] is template and time.monotonic() < falha[1]:
+            raise BaseIndisponivel(f"preparação do PDF base falhou há pouco; nova tentativa em "
+                                   f"{falha[1] - time.monotonic():.0f}s")
+        if _preparos.get(template_path) is template:
+            raise BaseIndisponivel("PDF base em preparação por outra requisição")
+        _preparos[template_path] = template
+
+    from converte_pdf import ConversaoSaturada
+    try:
+        nova = _preparar_base(template_path, template)
+    except ConversaoSaturada:
+        raise # Sem vaga agora não é falha da base: a próxima cotação tenta de novo
+    except Exception as e:
+        with _bases_lock:
+            _falhas[template_path] = (template, time.monotonic() + ESPERA_APOS_FALHA)
+        logging.error(f"{log_prefix} Falha ao preparar o PDF base: {e}. "
+                      f"Cotações vão direto para o LibreOffice pelos próximos {ESPERA_APOS_FALHA:.0f}s.")
+        raise
+    else:
+        with _bases_lock:
+            _bases[template_path] = (template, nova)
+            _falhas.pop(template_path, None)
+        logging.info(f"{log_prefix} PDF base preparado para sobreposição ({len(nova.dados)} bytes).")
+        return nova
+    finally:
+        with _bases_lock:
+            if _preparos.get(template_path) is template:
+                del _preparos[template_path]
+
+
+def renderizar_pdf_sobreposicao(template_path, dados_cotacao):
+    """PDF da cotação (bytes) carimbando os textos no PDF base, ou None se não for possível."""
+    from converte_pdf import ConversaoSaturada
+    try:
+        pdf_bytes = obter_base(template_path).renderizar(textos_cotacao(dados_cotacao))
+        if pdf_bytes is None:
+            logging.info(f"{log_prefix} Texto não suportado pela sobreposição. Usando LibreOffice.")
+        return pdf_bytes
+    except ConversaoSaturada:
+        raise # Sem vaga para converter a base: quem chamou responde 503
+    except BaseIndisponivel as e:
+        logging.info(f"{log_prefix} {e}. Usando LibreOffice.")
+        return None
+    except Exception as e:
+        logging.error(f"{log_prefix} Erro no modo sobreposição: {e}. Usando LibreOffice.")
+        return None
+
+# ----- FIM DO CÓDIGO -----
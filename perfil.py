@@ -0,0 +1,159 @@
+# ----- INÍCIO DO CÓDIGO PARA perfil.py -----
+# Perfil (flamegraph) de uma requisição específica, para investigar uma cotação lenta em produção.
+#
+# Liga com PERFIL_REQUISICOES=1 e vale só para as requisições que pedirem, com o cabeçalho
+# "X-Perfil: 1" ou a query "?perfil=1" (com PERFIL_TOKEN definido, o valor tem de ser o token).
+# Com a variável desligada, app.perfilavel devolve a própria view: nenhum custo por requisição.
+#
+# O perfil é por amostragem: uma thread lê a pilha da thread da requisição a cada
+# PERFIL_INTERVALO_MS. Tempo bloqueado (esperando o LibreOffice, o disco) aparece também,
+# o que o cProfile não mostraria. Para cada requisição perfilada são gravados em PERFIL_DIR:
+#   <base>.speedscope.json (https://www.speedscope.app) ou <base>.folded (flamegraph.pl),
+#   <base>.etapas.json     (duração de cada etapa medida pelo metricas.py nesta requisição).
+import os
+import sys
+import json
+import time
+import hmac
+import uuid
+import logging
+import tempfile
+import threading
+import collections
+
+from metricas import coletar_observacoes
+
+log_prefix = "[perfil]"
+
+PERFIL_ATIVO = os.environ.get("PERFIL_REQUISICOES", "0").lower() in ("1", "true", "sim")
+PERFIL_TOKEN = os.environ.get("PERFIL_TOKEN") or None
+PERFIL_DIR = os.environ.get("PERFIL_DIR", os.path.join(tempfile.gettempdir(), "cotacao_perfis"))
+PERFIL_FORMATO = os.environ.get("PERFIL_FORMATO", "speedscope") # speedscope | folded
+PERFIL_INTERVALO_MS = float(os.environ.get("PERFIL_INTERVALO_MS", "5"))
+PERFIL_MAX_ARQUIVOS = int(os.environ.get("PERFIL_MAX_ARQUIVOS", "200")) # Perfis mais antigos são apagados
+
+
+def pedido_autorizado(valor):
+    """True se o valor do cabeçalho X-Perfil (ou da query perfil) pede e pode pedir um perfil."""
+    if not PERFIL_ATIVO or not valor:
+        return False
+    if PERFIL_TOKEN:
+        return hmac.compare_digest(valor.encode("utf-8"), PERFIL_TOKEN.encode("utf-8"))
+    return valor.lower() in ("1", "true", "sim")
+
+
+def _rotulo(codigo):
+    # Formato "função (arquivo:linha)"; ';' separa quadros no formato folded
+    return f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})".replace(";", ",")
+
+
+class AmostradorPilha:
+    """Conta as pilhas de uma thread, amostradas em intervalos fixos por uma thread auxiliar."""
+
+    def __init__(self, id_thread, intervalo_s):
+        self.id_thread = id_thread
+        self.intervalo_s = intervalo_s
+        self.pilhas = collections.Counter() # tupla de códigos (raiz -> folha) -> amostras
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="perfil-amostrador", daemon=True)
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo_s):
+            quadro = sys._current_frames().get(self.id_thread)
+            pilha = []
+            while quadro is not None:
+                pilha.append(quadro.f_code)
+                quadro = quadro.f_back
+            if pilha:
+                self.pilhas[tuple(reversed(pilha))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._thread.join()
+
+    def folded(self):
+        """Pilhas no formato "a;b;c contagem" (collapsed stacks do flamegraph.pl/inferno)."""
+        return "".join(f"{';'.join(_rotulo(c) for c in pilha)} {n}\n" for pilha, n in self.pilhas.most_common())
+
+    def speedscope(self, nome):
+        """Perfil do tipo "sampled" do formato de arquivo do speedscope."""
+        indices = {}
+        quadros = []
+        amostras = []
+        pesos = []
+        for pilha, n in self.pilhas.most_common():
+            amostra = []
+            for codigo in pilha:
+                if codigo not in indices:
+                    indices[codigo] = len(quadros)
+                    quadros.append({"name": codigo.co_name, "file": codigo.co_filename, "line": codigo.co_firstlineno})
+                amostra.append(indices[codigo])
+            amostras.append(amostra)
+            pesos.append(round(n * self.intervalo_s * 1000, 3))
+        return {"$schema": "https://www.speedscope.app/file-format-schema.json", "name": nome,
+                "exporter": "cotacao perfil.py", "shared": {"frames": quadros},
+                "profiles": [{"type": "sampled", "name": nome, "unit": "milliseconds", "startValue": 0,
+                              "endValue": round(sum(pesos), 3), "samples": amostras, "weights": pesos}]}
+
+
+class PerfilRequisicao:
+    """Perfila o bloco (na thread atual) e grava o perfil e as etapas ao sair.
+
+    Depois do bloco, 'nome' é a base dos arquivos gravados em PERFIL_DIR.
+    """
+
+    def __init__(self, descricao):
+        self.descricao = descricao
+        self.nome = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+    def __enter__(self):
+        self._coleta = coletar_observacoes()
+        self._etapas = self._coleta.__enter__()
+        self._amostrador = AmostradorPilha(threading.get_ident(), PERFIL_INTERVALO_MS / 1000).__enter__()
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duracao = time.perf_counter() - self._inicio
+        self._amostrador.__exit__(*exc)
+        self._coleta.__exit__(*exc)
+        try:
+            self._gravar(duracao)
+        except Exception as e:
+            logging.warning(f"{log_prefix} Não foi possível gravar o perfil '{self.nome}': {e}")
+
+    def _gravar(self, duracao):
+        os.makedirs(PERFIL_DIR, exist_ok=True)
+        base = os.path.join(PERFIL_DIR, self.nome)
+        if PERFIL_FORMATO == "folded":
+            arquivo_perfil = f"{base}.folded"
+            with open(arquivo_perfil, "w", encoding="utf-8") as f:
+                f.write(self._amostrador.folded())
+        else:
+            arquivo_perfil = f"{base}.speedscope.json"
+            with open(arquivo_perfil, "w", encoding="utf-8") as f:
+                json.dump(self._amostrador.speedscope(self.descricao), f)
+        with open(f"{base}.etapas.json", "w", encoding="utf-8") as f:
+            json.dump({"requisicao": self.descricao, "pid": os.getpid(), "inicio": time.time() - duracao,
+                       "duracao_s": round(duracao, 6), "intervalo_ms": PERFIL_INTERVALO_MS,
+                       "amostras": sum(self._amostrador.pilhas.values()),
+                       "perfil": os.path.basename(arquivo_perfil), "etapas": self._etapas},
+                      f, ensure_ascii=False, indent=2)
+        logging.info(f"{log_prefix} {self.descricao}: {duracao:.3f}s, perfil em {arquivo_perfil}")
+        _remover_antigos()
+
+
+def _remover_antigos():
+    arquivos = sorted(os.scandir(PERFIL_DIR), key=lambda e: e.stat().st_mtime)
+    # Dois arquivos por perfil
+    for entrada in arquivos[:max(0, len(arquivos) - 2 * PERFIL_MAX_ARQUIVOS)]:
+        try:
+            os.remove(entrada.path)
+        except OSError:
+            pass
+
+# ----- FIM DO CÓDIGO -----
@@ -0,0 +1,148 @@
+# ----- INÍCIO DO CÓDIGO PARA ponte_uno.py -----
+# Processo "ponte" entre o pool de converte_pdf.py e UMA instância persistente do LibreOffice.
+# IMPORTANTE: roda com o Python do sistema (o que tem o módulo 'uno', pacote python3-uno),
+# que normalmente NÃO é o mesmo Python da aplicação Flask.
+#
+# Protocolo (uma linha JSON por job, via stdin/stdout):
+#   entrada: {"entrada": "/abs/arquivo.pptx", "saida": "/abs/arquivo.pdf"}
+#   saída:   {"ok": true} ou {"ok": false, "erro": "..."}
+# Ou, sem passar pelo disco (streams UNO em memória, conteúdo em base64):
+#   entrada: {"pptx_b64": "..."}
+#   saída:   {"ok": true, "pdf_b64": "..."}
+# Antes do primeiro job a ponte escreve {"pronto": true} quando conseguir conectar ao soffice.
+import sys
+import json
+import time
+import base64
+import argparse
+
+log_prefix = "[ponte_uno]"
+
+try:
+    import uno
+    import unohelper
+    from com.sun.star.beans import PropertyValue
+    from com.sun.star.connection import NoConnectException
+    from com.sun.star.io import XOutputStream
+except ImportError as e:
+    # Python sem python3-uno: "fatal" avisa o pool que reiniciar não adianta
+    sys.stdout.write(json.dumps({"pronto": False, "fatal": True, "erro": f"{log_prefix} Módulo uno indisponível: {e}"}) + "\n")
+    sys.stdout.flush()
+    sys.exit(1)
+
+
+def _prop(nome, valor):
+    p = PropertyValue()
+    p.Name = nome
+    p.Value = valor
+    return p
+
+
+def _responder(dados):
+    sys.stdout.write(json.dumps(dados) + "\n")
+    sys.stdout.flush()
+
+
+class SaidaMemoria(unohelper.Base, XOutputStream):
+    """XOutputStream que acumula em memória o que o filtro de exportação escreve."""
+
+    def __init__(self):
+        self.partes = []
+
+    def writeBytes(self, dados):
+        self.partes.append(dados.value)
+
+    def flush(self):
+        pass
+
+    def closeOutput(self):
+        pass
+
+    def conteudo(self):
+        return b"".join(self.partes)
+
+
+def conectar(nome_pipe, timeout):
+    """Conecta ao soffice que escuta em 'pipe,name=<nome_pipe>' e retorna (contexto, Desktop)."""
+    local_ctx = uno.getComponentContext()
+    resolver = local_ctx.ServiceManager.createInstanceWithContext("com.sun.star.bridge.UnoUrlResolver", local_ctx)
+    url = f"uno:pipe,name={nome_pipe};urp;StarOffice.ComponentContext"
+    limite = time.monotonic() + timeout
+    while True:
+        try:
+            ctx = resolver.resolve(url)
+            break
+        except NoConnectException:
+            # O soffice ainda está subindo; tenta de novo até o timeout
+            if time.monotonic() > limite:
+                raise
+            time.sleep(0.2)
+    smgr = ctx.ServiceManager
+    return ctx, smgr.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+
+
+def converter(desktop, entrada, saida):
+    """Abre 'entrada' na instância já aberta e exporta para PDF em 'saida'."""
+    doc = desktop.loadComponentFromURL(uno.systemPathToFileUrl(entrada), "_blank", 0, (_prop("Hidden", True),))
+    if doc is None:
+        raise RuntimeError(f"LibreOffice não conseguiu abrir '{entrada}'")
+    try:
+        doc.storeToURL(uno.systemPathToFileUrl(saida), (_prop("FilterName", "impress_pdf_Export"),))
+    finally:
+        doc.close(True)
+
+
+def converter_bytes(ctx, desktop, pptx_bytes):
+    """Converte um .pptx em memória e retorna os bytes do PDF, sem tocar o disco."""
+    entrada = ctx.ServiceManager.createInstanceWithContext("com.sun.star.io.SequenceInputStream", ctx)
+    entrada.initialize((uno.ByteSequence(pptx_bytes),))
+    doc = desktop.loadComponentFromURL("private:stream", "_blank", 0,
+                                       (_prop("InputStream", entrada), _prop("Hidden", True)))
+    if doc is None:
+        raise RuntimeError("LibreOffice não conseguiu abrir o .pptx recebido em memória")
+    try:
+        saida = SaidaMemoria()
+        doc.storeToURL("private:stream", (_prop("FilterName", "impress_pdf_Export"), _prop("OutputStream", saida)))
+    finally:
+        doc.close(True)
+    return saida.conteudo()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ponte UNO para conversão PPTX -> PDF")
+    parser.add_argument("--pipe", required=True, help="Nome do pipe UNO onde o soffice escuta")
+    parser.add_argument("--timeout-conexao", type=float, default=60.0)
+    args = parser.parse_args()
+
+    try:
+        ctx, desktop = conectar(args.pipe, args.timeout_conexao)
+    except Exception as e:
+        _responder({"pronto": False, "erro": f"{log_prefix} Falha ao conectar: {e}"})
+        return 1
+    _responder({"pronto": True})
+
+    for linha in sys.stdin:
+        linha = linha.strip()
+        if not linha:
+            continue
+        try:
+            job = json.loads(linha)
+            if "pptx_b64" in job:
+                pdf = converter_bytes(ctx, desktop, base64.b64decode(job["pptx_b64"]))
+                _responder({"ok": True, "pdf_b64": base64.b64encode(pdf).decode("ascii")})
+                continue
+            converter(desktop, job["entrada"], job["saida"])
+            _responder({"ok": True})
+        except Exception as e:
+            # Conexão perdida (soffice morreu): sai para o pool reiniciar a instância
+            if type(e).__name__ == "DisposedException":
+                _responder({"ok": False, "erro": str(e), "fatal": True})
+                return 2
+            _responder({"ok": False, "erro": str(e)})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# ----- FIM DO CÓDIGO -----
@@ -1,14 +1,17 @@
 # ----- INÍCIO DO CÓDIGO COMPLETO E FINAL PARA preenche_cotacao.py -----
 import sys
 # sys.path.append("/opt/.manus/.sandbox-runtime") 
-from pptx import Presentation
-from pptx.util import Inches, Pt
-from pptx.dml.color import RGBColor
-# Importa APENAS o alinhamento HORIZONTAL
-from pptx.enum.text import PP_ALIGN 
+# python-pptx é importado só no primeiro preenchimento/carga de template (não na subida do worker)
 import traceback 
 import os 
+import io
+import re
+import hashlib
+import struct
+import zipfile
+import zlib
 import logging 
+import threading
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
 log_prefix = "[preenche_cotacao]" 
@@ -37,13 +40,18 @@ def format_currency_value_only(value):
 
 # --- Função set_text FINAL (Tamanho 22pt, Align Left, Fonte Liberation Sans) ---
 def set_text(text_frame, text_value, 
-             font_size=Pt(22),            # <<< TAMANHO PADRÃO 22pt <<<
+             font_size=22,                # <<< TAMANHO PADRÃO 22pt (em pontos) <<<
              font_name='Liberation Sans', # <<< FONTE PADRÃO <<<
-             alignment=PP_ALIGN.LEFT,     # <<< ALINHAMENTO PADRÃO ESQUERDA <<<
+             alignment=None,              # <<< ALINHAMENTO PADRÃO ESQUERDA (PP_ALIGN.LEFT) <<<
              is_warning=False):
     """Define o texto em um text_frame, limpando, aplicando formatação e alinhamento HORIZONTAL."""
     if text_frame is None:
         return 
+    from pptx.util import Pt
+    from pptx.dml.color import RGBColor
+    from pptx.enum.text import PP_ALIGN
+    if alignment is None:
+        alignment = PP_ALIGN.LEFT
         
     # REMOVIDA a tentativa de definir alinhamento vertical
         
@@ -71,7 +79,7 @@ def set_text(text_frame, text_value,
         logging.error(f"  ERRO ao definir nome da fonte '{font_name}': {font_err}. Usando fonte padrão.")
         font_final_name = p.font.name # Loga qual fonte ficou como padrão
 
-    p.font.size = font_size 
+    p.font.size = Pt(font_size) 
     if is_warning:
         p.font.bold = True
         p.font.color.rgb = RGBColor(192, 0, 0)
@@ -79,110 +87,319 @@ def set_text(text_frame, text_value,
          p.font.bold = False 
 
     # Log final SEM VAlign e SEM usar '.parent'
-    logging.info(f"  Texto definido. Fonte Aplicada: {font_final_name}, Tamanho: {font_size.pt}pt, HAlign: {p.alignment}") 
+    logging.info(f"  Texto definido. Fonte Aplicada: {font_final_name}, Tamanho: {font_size}pt, HAlign: {p.alignment}") 
 
 
-# --- Função Principal preencher_cotacao_pptx (COM CHAMADAS AJUSTADAS para formato e tamanho de preço) ---
-def preencher_cotacao_pptx(template_path, output_path, dados_cotacao):
-    logging.info(f"{log_prefix} Iniciando preenchimento com template: {template_path}")
-    logging.info(f"{log_prefix} Dados recebidos: {dados_cotacao}")
-    try:
-        # Tenta abrir a apresentação ANTES da função auxiliar
-        logging.info(f"{log_prefix} Abrindo apresentação: {template_path}")
-        prs = Presentation(template_path)
-        logging.info(f"{log_prefix} Template aberto com sucesso.")
-        
-        # --- Função Auxiliar Interna find_shape (sem alterações) ---
-        def find_shape(slide_index, shape_name_to_find):
-            if slide_index < 0 or slide_index >= len(prs.slides):
-                logging.warning(f"{log_prefix} AVISO: Slide índice {slide_index} (página {slide_index+1}) não existe.")
-                return None
-            slide = prs.slides[slide_index]
-            shape_found = None
-            logging.info(f"{log_prefix} Procurando shape '{shape_name_to_find}' no slide {slide_index+1}...")
-            for shape in slide.shapes:
-                # Comparação case-insensitive e removendo espaços extras do nome da shape
-                if shape.name.strip().lower() == shape_name_to_find.strip().lower(): 
-                    shape_found = shape
-                    break # Encontrou, pode parar de procurar neste slide
-
-            if shape_found:
-                if shape_found.has_text_frame:
-                    logging.info(f"{log_prefix}   Encontrada forma '{shape_found.name}' (buscando por '{shape_name_to_find}').")
-                    return shape_found.text_frame
-                else:
-                    logging.warning(f"{log_prefix} AVISO: Forma '{shape_found.name}' encontrada mas não tem frame de texto.")
-                    return None
+# --- Template pré-carregado (bytes + índice de shapes), um por processo ---
+def _normalizar_nome_shape(nome):
+    """Mesma comparação do antigo find_shape: sem espaços nas pontas e case-insensitive."""
+    return nome.strip().lower()
+
+
+class TemplateCotacao:
+    """Bytes do template .pptx lidos uma vez + índice (slide, nome normalizado) -> posição da shape.
+
+    Cada requisição abre uma cópia nova a partir dos bytes em memória (sem I/O de disco) e
+    acessa as shapes direto pela posição, sem varrer e comparar nomes de todas as shapes.
+    """
+
+    def __init__(self, template_path):
+        self.template_path = template_path
+        self._renderizador = None
+        self._lock = threading.Lock()
+        self.mtime = os.stat(template_path).st_mtime_ns
+        with open(template_path, "rb") as f:
+            self.dados = f.read()
+        self.versao = hashlib.sha256(self.dados).hexdigest()[:12] # Identifica o conteúdo (chave do cache de PDFs)
+
+        from pptx import Presentation
+
+        prs = Presentation(io.BytesIO(self.dados))
+        self.n_slides = len(prs.slides)
+        self.indice = {} # (slide_index, nome normalizado) -> (posição em slide.shapes, nome original, tem texto)
+        for slide_index, slide in enumerate(prs.slides):
+            for posicao, shape in enumerate(slide.shapes):
+                chave = (slide_index, _normalizar_nome_shape(shape.name))
+                # setdefault: vale a PRIMEIRA shape com o nome, como no loop com 'break' de antes
+                self.indice.setdefault(chave, (posicao, shape.name, shape.has_text_frame))
+        logging.info(f"{log_prefix} Template carregado em memória: {template_path} ({len(self.dados)} bytes, "
+                     f"{self.n_slides} slides, {len(self.indice)} shapes indexadas)")
+
+    def abrir(self):
+        """Nova Presentation independente, criada a partir dos bytes em memória."""
+        from pptx import Presentation
+
+        return Presentation(io.BytesIO(self.dados))
+
+    def renderizador_rapido(self):
+        """RenderizadorRapido deste template, compilado na primeira chamada."""
+        if self._renderizador is None:
+            with self._lock:
+                if self._renderizador is None:
+                    self._renderizador = RenderizadorRapido(self)
+        return self._renderizador
+
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def obter_template(template_path):
+    """TemplateCotacao de 'template_path', recarregado automaticamente se o arquivo mudar (mtime)."""
+    mtime = os.stat(template_path).st_mtime_ns # FileNotFoundError se não existir
+    template = _templates.get(template_path)
+    if template is not None and template.mtime == mtime:
+        return template
+    with _templates_lock:
+        template = _templates.get(template_path)
+        if template is None or template.mtime != mtime:
+            template = TemplateCotacao(template_path)
+            _templates[template_path] = template
+    return template
+
+
+# --- Campos da cotação: onde cada texto vai e com qual formatação ---
+# Definir tamanho GRANDE para mensalidades (Ajuste aqui se 36 for muito/pouco)
+TAMANHO_FONTE_MENSALIDADE = 36 # pontos
+
+# (slide_index, nome da shape, chave do texto em textos_cotacao(), argumentos extras de set_text)
+# Sem argumentos extras: padrões de set_text (22pt, Liberation Sans, LEFT)
+CAMPOS_COTACAO = [
+    (0, "Nome associado", "nome_cliente", {}),
+    (3, "Nome associado", "nome_cliente", {}),
+    (3, "Placa", "placa", {}),
+    (3, "Marca carro", "marca", {}),
+    (3, "modelo", "modelo", {}),
+    (3, "Ano", "ano", {}),
+    (3, "Categoria", "categoria", {}),
+    (3, "Valor fipe", "valor_fipe", {}), # Mantém R$ mas usa formatação padrão
+    # Slides 5, 6 e 7: adesão e mensalidade SEM R$, alinhamento padrão (LEFT), mas TAMANHO GRANDE
+    (4, "adesão", "adesao", {"font_size": TAMANHO_FONTE_MENSALIDADE}),
+    (4, "ouro", "plano_ouro", {"font_size": TAMANHO_FONTE_MENSALIDADE}),
+    (5, "adesão", "adesao", {"font_size": TAMANHO_FONTE_MENSALIDADE}),
+    (5, "diamante", "plano_diamante", {"font_size": TAMANHO_FONTE_MENSALIDADE}),
+    (6, "adesão", "adesao", {"font_size": TAMANHO_FONTE_MENSALIDADE}),
+    (6, "platinium", "plano_platinum", {"font_size": TAMANHO_FONTE_MENSALIDADE}), # Confirmar se o nome da shape é 'platinium' mesmo
+]
+
+
+def textos_cotacao(dados_cotacao):
+    """Textos finais (já formatados) de cada campo da cotação, por chave de CAMPOS_COTACAO."""
+    precos = dados_cotacao.get("precos", {})
+    return {
+        "nome_cliente": str(dados_cotacao.get("nome_cliente", "N/A")),
+        "placa": str(dados_cotacao.get("placa", "N/A")),
+        "marca": str(dados_cotacao.get("marca", "N/A")),
+        "modelo": str(dados_cotacao.get("modelo", "N/A")),
+        "ano": str(dados_cotacao.get("ano", "N/A")),
+        "categoria": str(dados_cotacao.get("categoria", "N/A")),
+        "valor_fipe": format_currency_manual(dados_cotacao.get("valor_fipe")),
+        # Formata adesão UMA VEZ e SEM R$
+        "adesao": format_currency_value_only(precos.get('Adesão')),
+        "plano_ouro": format_currency_value_only(precos.get('Plano Ouro')),
+        "plano_diamante": format_currency_value_only(precos.get('Diamante')),
+        "plano_platinum": format_currency_value_only(precos.get('Platinum')),
+    }
+
+
+def _aplicar_campos(prs, template, textos):
+    """Preenche 'prs' (aberta a partir de 'template') com os textos de cada campo via set_text."""
+
+    # --- Função Auxiliar Interna find_shape (busca direta pelo índice pré-calculado) ---
+    def find_shape(slide_index, shape_name_to_find):
+        if slide_index < 0 or slide_index >= template.n_slides:
+            logging.warning(f"{log_prefix} AVISO: Slide índice {slide_index} (página {slide_index+1}) não existe.")
+            return None
+        encontrada = template.indice.get((slide_index, _normalizar_nome_shape(shape_name_to_find)))
+        if encontrada is None:
+            logging.warning(f"{log_prefix} AVISO: Forma com nome parecido com '{shape_name_to_find}' NÃO encontrada no slide {slide_index+1}.")
+            return None
+        posicao, nome_shape, tem_texto = encontrada
+        if not tem_texto:
+            logging.warning(f"{log_prefix} AVISO: Forma '{nome_shape}' encontrada mas não tem frame de texto.")
+            return None
+        return prs.slides[slide_index].shapes[posicao].text_frame
+
+    # --- Preenchimento Slide por Slide ---
+    for slide_index, nome_shape, chave, opcoes in CAMPOS_COTACAO:
+        set_text(find_shape(slide_index, nome_shape), textos[chave], **opcoes)
+
+
+# --- Renderização rápida: monta o .pptx direto no nível do ZIP/XML, sem python-pptx por requisição ---
+PREENCHIMENTO_RAPIDO = os.environ.get("PREENCHIMENTO_RAPIDO", "1") == "1"
+
+# Marcadores de posição (área de uso privado do Unicode) colocados no lugar de cada texto na compilação
+_MARCADOR = re.compile(rb"(<a:r><a:t>)?\xee\x80\x80(\d+)\xee\x80\x81(</a:t></a:r>)?")
+# Textos com caracteres de controle/inválidos em XML ou com os marcadores: deixa o python-pptx tratar
+_TEXTO_NAO_SUPORTADO = re.compile("[\x00-\x1f\ud800-\udfff\ufffe\uffff\ue000\ue001]")
+
+
+def _dos_data_hora(date_time):
+    ano, mes, dia, hora, minuto, segundo = date_time
+    return (hora << 11) | (minuto << 5) | (segundo // 2), ((ano - 1980) << 9) | (mes << 5) | dia
+
+
+class RenderizadorRapido:
+    """Template "compilado" em partes do ZIP para gerar cotações sem montar o modelo do python-pptx.
+
+    Na compilação, o template é preenchido UMA vez pelo caminho normal (set_text) com marcadores
+    no lugar dos textos e salvo. Os slides que contêm marcadores viram listas de trechos de bytes;
+    as demais partes (imagens, masters, layouts...) são guardadas já comprimidas. Por requisição,
+    só os slides alterados são montados (trechos + textos escapados) e comprimidos; o resto é
+    copiado byte a byte. Fontes, tamanhos, alinhamento e cor vêm do próprio set_text, então o
+    XML dos slides sai idêntico ao do python-pptx.
+    """
+
+    def __init__(self, template):
+        chaves = list(dict.fromkeys(chave for _, _, chave, _ in CAMPOS_COTACAO))
+        marcadores = {chave: f"\ue000{i}\ue001" for i, chave in enumerate(chaves)}
+        prs = template.abrir()
+        _aplicar_campos(prs, template, marcadores)
+        buffer = io.BytesIO()
+        prs.save(buffer)
+        bruto = buffer.getvalue()
+
+        estaticos = [] # (local header + dados comprimidos, entrada do diretório central sem offset)
+        self.dinamicos = [] # (nome, date_time, trechos) - trechos: bytes ou (chave, com_run)
+        with zipfile.ZipFile(io.BytesIO(bruto)) as zf:
+            for info in zf.infolist():
+                conteudo = zf.read(info.filename)
+                if b"\xee\x80\x80" in conteudo:
+                    self.dinamicos.append((info.filename, info.date_time, self._trechos(conteudo, chaves)))
+                    continue
+                # Copia os bytes já comprimidos, sem descomprimir/recomprimir
+                n_nome, n_extra = struct.unpack("<HH", bruto[info.header_offset + 26:info.header_offset + 30])
+                inicio = info.header_offset + 30 + n_nome + n_extra
+                dados = bruto[inicio:inicio + info.compress_size]
+                estaticos.append((info.filename, info.date_time, info.compress_type, info.CRC, dados, info.file_size))
+
+        self.bloco_estatico = bytearray()
+        self.diretorio_estatico = bytearray()
+        for nome, date_time, metodo, crc, dados, tamanho in estaticos:
+            cabecalho, central = self._entrada_zip(nome, date_time, metodo, crc, len(dados), tamanho, len(self.bloco_estatico))
+            self.bloco_estatico += cabecalho + dados
+            self.diretorio_estatico += central
+        self.bloco_estatico = bytes(self.bloco_estatico)
+        self.diretorio_estatico = bytes(self.diretorio_estatico)
+        self.n_estaticos = len(estaticos)
+        logging.info(f"{log_prefix} Renderizador rápido compilado: {len(estaticos)} partes copiadas byte a byte, "
+                     f"{len(self.dinamicos)} slides dinâmicos.")
+
+    @staticmethod
+    def _trechos(conteudo, chaves):
+        trechos = []
+        pos = 0
+        for m in _MARCADOR.finditer(conteudo):
+            trechos.append(conteudo[pos:m.start()])
+            chave = chaves[int(m.group(2))]
+            if m.group(1) and m.group(3):
+                # Texto vazio no python-pptx não gera <a:r>: o run inteiro é parte do campo
+                trechos.append((chave, True))
             else:
-                logging.warning(f"{log_prefix} AVISO: Forma com nome parecido com '{shape_name_to_find}' NÃO encontrada no slide {slide_index+1}.")
+                trechos.append(m.group(1) or b"")
+                trechos.append((chave, False))
+                trechos.append(m.group(3) or b"")
+            pos = m.end()
+        trechos.append(conteudo[pos:])
+        return [t for t in trechos if t != b""]
+
+    @staticmethod
+    def _entrada_zip(nome, date_time, metodo, crc, tamanho_comprimido, tamanho, offset):
+        """Local file header e entrada do diretório central (formato ZIP sem zip64)."""
+        nome_bytes = nome.encode("utf-8")
+        flags = 0x800 if not nome.isascii() else 0
+        hora, data = _dos_data_hora(date_time)
+        cabecalho = struct.pack("<4s2B4HL2L2H", b"PK\x03\x04", 20, 0, flags, metodo, hora, data,
+                                crc, tamanho_comprimido, tamanho, len(nome_bytes), 0) + nome_bytes
+        central = struct.pack("<4s4B4HL2L5H2L", b"PK\x01\x02", 20, 0, 20, 0, flags, metodo, hora, data,
+                              crc, tamanho_comprimido, tamanho, len(nome_bytes), 0, 0, 0, 0, 0, offset) + nome_bytes
+        return cabecalho, central
+
+    def renderizar(self, textos):
+        """Bytes do .pptx preenchido, ou None se algum texto exigir o caminho normal do python-pptx."""
+        escapados = {}
+        for chave, texto in textos.items():
+            if _TEXTO_NAO_SUPORTADO.search(texto):
                 return None
+            escapados[chave] = texto.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").encode("utf-8")
 
-        # Extração de dados
-        nome_cliente = dados_cotacao.get("nome_cliente", "N/A")
-        placa = dados_cotacao.get("placa", "N/A")
-        marca = dados_cotacao.get("marca", "N/A")
-        modelo = dados_cotacao.get("modelo", "N/A")
-        ano = dados_cotacao.get("ano", "N/A")
-        valor_fipe = dados_cotacao.get("valor_fipe")
-        categoria = dados_cotacao.get("categoria", "N/A")
-        precos = dados_cotacao.get("precos", {})
-        sujeito_aprovacao = precos.get("sujeito_aprovacao", False)
-        # Formata adesão UMA VEZ e SEM R$
-        adesao_valor_str = format_currency_value_only(precos.get('Adesão')) 
+        partes = [self.bloco_estatico]
+        diretorio = [self.diretorio_estatico]
+        offset = len(self.bloco_estatico)
+        for nome, date_time, trechos in self.dinamicos:
+            xml = []
+            for trecho in trechos:
+                if trecho.__class__ is bytes:
+                    xml.append(trecho)
+                    continue
+                chave, com_run = trecho
+                texto = escapados[chave]
+                if com_run:
+                    if texto:
+                        xml.append(b"<a:r><a:t>" + texto + b"</a:t></a:r>")
+                else:
+                    xml.append(texto)
+            xml = b"".join(xml)
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            dados = compressor.compress(xml) + compressor.flush()
+            cabecalho, central = self._entrada_zip(nome, date_time, zipfile.ZIP_DEFLATED, zlib.crc32(xml),
+                                                   len(dados), len(xml), offset)
+            partes.append(cabecalho)
+            partes.append(dados)
+            diretorio.append(central)
+            offset += len(cabecalho) + len(dados)
 
-        # Definir tamanho GRANDE para mensalidades (Ajuste aqui se 36 for muito/pouco)
-        TAMANHO_FONTE_MENSALIDADE = Pt(36) 
+        diretorio = b"".join(diretorio)
+        total = self.n_estaticos + len(self.dinamicos)
+        fim = struct.pack("<4s4H2LH", b"PK\x05\x06", 0, 0, total, total, len(diretorio), offset, 0)
+        return b"".join(partes) + diretorio + fim
+
+
+# --- Função Principal preencher_cotacao_pptx (COM CHAMADAS AJUSTADAS para formato e tamanho de preço) ---
+def preencher_cotacao_pptx(template_path, output_path, dados_cotacao, rapido=None):
+    """Preenche o template com os dados da cotação e salva em output_path.
+
+    output_path pode ser um caminho ou um objeto de arquivo binário (ex: io.BytesIO),
+    para gerar o .pptx só em memória e entregá-lo direto à conversão.
+
+    rapido=True (padrão via PREENCHIMENTO_RAPIDO=1) usa o RenderizadorRapido; se ele não
+    puder tratar algum texto, cai para o preenchimento normal com python-pptx.
+    """
+    from pptx.exc import PackageNotFoundError
+
+    logging.info(f"{log_prefix} Iniciando preenchimento com template: {template_path}")
+    logging.info(f"{log_prefix} Dados recebidos: {dados_cotacao}")
+    if rapido is None:
+        rapido = PREENCHIMENTO_RAPIDO
+    try:
+        # Template já carregado (bytes + índice de shapes); só abre uma cópia em memória
+        template = obter_template(template_path)
+        textos = textos_cotacao(dados_cotacao)
 
-        # --- Preenchimento Slide por Slide ---
-        
-        logging.info(f"{log_prefix} Preenchendo Slide 1 (Índice 0)")
-        tf = find_shape(0, "Nome associado") 
-        # Usa padrões de set_text: Pt(22), Liberation Sans, LEFT
-        set_text(tf, nome_cliente) 
-
-        logging.info(f"{log_prefix} Preenchendo Slide 4 (Índice 3)")
-        tf = find_shape(3, "Nome associado") 
-        set_text(tf, nome_cliente) # Usa padrões (Left, 22pt)
-        tf = find_shape(3, "Placa") 
-        set_text(tf, placa) # Usa padrões
-        tf = find_shape(3, "Marca carro") 
-        set_text(tf, marca) # Usa padrões
-        tf = find_shape(3, "modelo") 
-        set_text(tf, modelo) # Usa padrões
-        tf = find_shape(3, "Ano") 
-        set_text(tf, str(ano)) # Usa padrões
-        tf = find_shape(3, "Categoria") 
-        set_text(tf, categoria) # Usa padrões
-        tf = find_shape(3, "Valor fipe") 
-        # Para o valor FIPE, manter R$ mas usar formatação padrão (Left, 22pt)
-        set_text(tf, format_currency_manual(valor_fipe)) 
-
-        logging.info(f"{log_prefix} Preenchendo Slide 5 (Índice 4) - Ouro")
-        tf_adesao_ouro = find_shape(4, "adesão") 
-        # Usa formatador SEM R$, alinhamento padrão (LEFT), mas TAMANHO GRANDE
-        set_text(tf_adesao_ouro, adesao_valor_str, font_size=TAMANHO_FONTE_MENSALIDADE) 
-        tf_mensal_ouro = find_shape(4, "ouro") 
-        set_text(tf_mensal_ouro, format_currency_value_only(precos.get('Plano Ouro')), font_size=TAMANHO_FONTE_MENSALIDADE) 
-
-        logging.info(f"{log_prefix} Preenchendo Slide 6 (Índice 5) - Diamante")
-        tf_adesao_diamante = find_shape(5, "adesão") 
-        set_text(tf_adesao_diamante, adesao_valor_str, font_size=TAMANHO_FONTE_MENSALIDADE) 
-        tf_mensal_diamante = find_shape(5, "diamante") 
-        set_text(tf_mensal_diamante, format_currency_value_only(precos.get('Diamante')), font_size=TAMANHO_FONTE_MENSALIDADE) 
-
-        logging.info(f"{log_prefix} Preenchendo Slide 7 (Índice 6) - Platinum")
-        tf_adesao_platinum = find_shape(6, "adesão") 
-        set_text(tf_adesao_platinum, adesao_valor_str, font_size=TAMANHO_FONTE_MENSALIDADE) 
-        tf_mensal_platinum = find_shape(6, "platinium") # Confirmar se o nome da shape é 'platinium' mesmo
-        set_text(tf_mensal_platinum, format_currency_value_only(precos.get('Platinum')), font_size=TAMANHO_FONTE_MENSALIDADE) 
-        
         # --- PONTOS FALTANDO (Onde colocar estes?) ---
+        precos = dados_cotacao.get("precos", {})
         preco_pesados_str = format_currency_value_only(precos.get('Pesados'))
         if preco_pesados_str != "N/A":
              logging.warning(f"{log_prefix} Valor Pesados ({preco_pesados_str}) NÃO INSERIDO - Definir Slide/Shape.")
-        if sujeito_aprovacao:
+        if precos.get("sujeito_aprovacao", False):
              logging.warning(f"{log_prefix} AVISO Sujeito à Aprovação NÃO INSERIDO - Definir Slide/Shape.")
 
+        if rapido:
+            conteudo = template.renderizador_rapido().renderizar(textos)
+            if conteudo is not None:
+                if hasattr(output_path, "write"):
+                    output_path.write(conteudo)
+                else:
+                    with open(output_path, "wb") as f:
+                        f.write(conteudo)
+                logging.info(f"{log_prefix} Cotação salva com sucesso (renderização rápida) em {output_path}.")
+                return True
+            logging.info(f"{log_prefix} Texto não suportado pela renderização rápida. Usando python-pptx.")
+
+        prs = template.abrir()
+        logging.info(f"{log_prefix} Template aberto com sucesso (cópia em memória).")
+        _aplicar_campos(prs, template, textos)
+
         # --- Salvando e Retornando ---
         logging.info(f"{log_prefix} Salvando apresentação em {output_path}")
         prs.save(output_path)
@@ -190,7 +407,7 @@ def preencher_cotacao_pptx(template_path, output_path, dados_cotacao):
         return True
 
     # --- Tratamento de Erros ---
-    except Presentation.PackageNotFoundError as pe: # Erro específico para arquivo corrompido/inválido
+    except PackageNotFoundError as pe: # Erro específico para arquivo corrompido/inválido
          logging.error(f"{log_prefix} ERRO AO ABRIR/LER O TEMPLATE: {pe}")
          logging.error(f"{log_prefix} Verifique se o arquivo '{template_path}' não está corrompido ou se é um formato PPTX válido.")
          traceback.print_exc()
@@ -0,0 +1,173 @@
+# ----- INÍCIO DO CÓDIGO PARA registro_tabelas.py -----
+# Registro de tabelas de preços versionadas, com data de vigência e troca sem downtime.
+#
+# Convenção de nomes em input_files/ (a data no nome é a data de vigência):
+#   "Tabela 2023.xlsx"        -> vigente a partir de 2023-01-01
+#   "Tabela 2024-07-01.xlsx"  -> vigente a partir de 2024-07-01
+# Vale a tabela com a maior data de vigência que já chegou. Para mudar preços basta
+# copiar a nova planilha para input_files/: ela é compilada em segundo plano e entra
+# no ar sozinha na data certa, sem reiniciar os workers.
+import os
+import re
+import datetime
+import logging
+import threading
+
+from calculo_precos import PriceTable, cache_precos
+
+log_prefix = "[registro_tabelas]"
+
+PADRAO_NOME_TABELA = re.compile(r"^Tabela[ _-]?(\d{4})(?:-(\d{2})-(\d{2}))?\.xlsx$", re.IGNORECASE)
+INTERVALO_VERIFICACAO = float(os.environ.get("TABELAS_INTERVALO_VERIFICACAO", "10")) # segundos
+
+
+def data_vigencia(nome_arquivo):
+    """Data de vigência codificada no nome do arquivo, ou None se o nome não seguir a convenção."""
+    m = PADRAO_NOME_TABELA.match(nome_arquivo)
+    if not m:
+        return None
+    ano, mes, dia = m.group(1), m.group(2) or "01", m.group(3) or "01"
+    try:
+        return datetime.date(int(ano), int(mes), int(dia))
+    except ValueError:
+        return None
+
+
+class RegistroTabelas:
+    """Mantém todas as versões de tabela compiladas e aponta para a vigente.
+
+    A troca é atômica (uma atribuição de referência): quem já pegou a tabela com
+    tabela_ativa() termina o cálculo na versão antiga; as próximas requisições usam a nova.
+    """
+
+    def __init__(self, diretorio, intervalo=INTERVALO_VERIFICACAO):
+        self.diretorio = diretorio
+        self.intervalo = intervalo
+        self._versoes = {} # caminho -> (mtime, data_vigencia, PriceTable ou None se rejeitada)
+        self._ativa = None
+        self._lock = threading.Lock() # Serializa verificações (thread de fundo x chamada manual)
+        self._parar = threading.Event()
+        self._thread = None
+
+    def tabela_ativa(self):
+        """PriceTable vigente. Levanta RuntimeError se nenhuma tabela válida foi encontrada."""
+        tabela = self._ativa
+        if tabela is None:
+            raise RuntimeError(f"Nenhuma tabela de preços válida encontrada em '{self.diretorio}'.")
+        return tabela
+
+    def versoes(self):
+        """Resumo das versões conhecidas (para logs/diagnóstico)."""
+        ativa = self._ativa
+        return [
+            {"arquivo": os.path.basename(caminho), "vigencia": vigencia.isoformat(),
+             "versao": tabela.versao if tabela is not None else None,
+             "ativa": tabela is not None and tabela is ativa}
+            for caminho, (_, vigencia, tabela) in sorted(self._versoes.items(), key=lambda item: item[1][1])
+        ]
+
+    def verificar(self):
+        """Varre o diretório, compila tabelas novas/alteradas e atualiza a versão vigente."""
+        with self._lock:
+            encontrados = {}
+            for entrada in os.scandir(self.diretorio):
+                vigencia = data_vigencia(entrada.name)
+                if vigencia is not None and entrada.is_file():
+                    encontrados[entrada.path] = (entrada.stat().st_mtime_ns, vigencia)
+
+            for caminho in set(self._versoes) - set(encontrados):
+                logging.info(f"{log_prefix} Tabela removida do diretório: {caminho}")
+                del self._versoes[caminho]
+
+            for caminho, (mtime, vigencia) in encontrados.items():
+                atual = self._versoes.get(caminho)
+                if atual is not None and atual[0] == mtime:
+                    continue
+                # Tabela rejeitada fica registrada como None: só é recompilada se o arquivo mudar de novo
+                self._versoes[caminho] = (mtime, vigencia, self._compilar(caminho))
+
+            self._atualizar_ativa()
+
+    def _compilar(self, caminho):
+        """Compila e valida uma tabela. Tabelas com erro de validação nunca entram no ar."""
+        logging.info(f"{log_prefix} Compilando tabela: {caminho}")
+        try:
+            tabela = PriceTable(caminho)
+        except Exception as e:
+            logging.error(f"{log_prefix} Falha ao compilar '{caminho}': {e}. Versão ignorada.")
+            return None
+        erros, avisos = tabela.validar()
+        for aviso in avisos:
+            logging.warning(f"{log_prefix} {os.path.basename(caminho)}: {aviso}")
+        if erros:
+            for erro in erros:
+                logging.error(f"{log_prefix} {os.path.basename(caminho)}: {erro}")
+            logging.error(f"{log_prefix} Tabela '{caminho}' rejeitada ({len(erros)} erro(s) de validação).")
+            return None
+        return tabela
+
+    def _atualizar_ativa(self):
+        hoje = datetime.date.today()
+        vigentes = [(vigencia, tabela) for _, vigencia, tabela in self._versoes.values()
+                    if tabela is not None and vigencia <= hoje]
+        nova = max(vigentes, key=lambda item: item[0])[1] if vigentes else None
+        if nova is not self._ativa:
+            anterior = self._ativa.versao if self._ativa is not None else None
+            self._ativa = nova
+            cache_precos.limpar() # Preços em cache são da versão anterior
+            logging.info(f"{log_prefix} Tabela vigente: {nova.versao if nova else None} (anterior: {anterior})")
+
+    def herdar(self, outro):
+        """Reaproveita as tabelas já compiladas por 'outro' (o registro do master antes do fork):
+        o worker compartilha a memória delas (copy-on-write) em vez de compilar de novo."""
+        with outro._lock:
+            self._versoes = dict(outro._versoes)
+            self._ativa = outro._ativa
+
+    def iniciar(self):
+        """Carrega as tabelas agora e passa a vigiar o diretório em uma thread de fundo."""
+        self.verificar()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="registro-tabelas", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.verificar()
+            except Exception:
+                logging.exception(f"{log_prefix} Erro ao verificar tabelas em '{self.diretorio}':")
+
+    def parar(self):
+        self._parar.set()
+
+
+_registros = {}
+_registros_lock = threading.Lock()
+
+
+def obter_registro(diretorio, vigiar=True):
+    """Registro do processo atual para 'diretorio' (threads não sobrevivem ao fork do gunicorn).
+
+    No worker, herda as tabelas do registro do processo pai (master com --preload), se houver.
+    vigiar=False carrega as tabelas sem subir a thread de verificação (usado no master antes do fork).
+    """
+    caminho = os.path.abspath(diretorio)
+    chave = (os.getpid(), caminho)
+    registro = _registros.get(chave)
+    if registro is None or (vigiar and registro._thread is None):
+        with _registros_lock:
+            registro = _registros.get(chave)
+            if registro is None:
+                registro = RegistroTabelas(diretorio)
+                pai = _registros.get((os.getppid(), caminho))
+                if pai is not None:
+                    registro.herdar(pai)
+                _registros[chave] = registro
+                if not vigiar:
+                    registro.verificar()
+            if vigiar and registro._thread is None:
+                registro.iniciar()
+    return registro
+
+# ----- FIM DO CÓDIGO -----